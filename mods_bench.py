@@ -0,0 +1,418 @@
+"""
+ZDE ModManager 基准测试：生成模拟的创意工坊目录，在没有图形界面的情况下测量扫描源目录、复制、生成mods_info.json、
+比较清单和移动的耗时，结果保存为JSON，可以比较两个版本的性能。
+
+用法示例：
+    python mods_bench.py generate <目录> --items 200
+    python mods_bench.py run --items 200 --output new.json
+    python mods_bench.py compare old.json new.json
+
+每项操作记录实际耗时、用户态和内核态CPU时间（内核态时间高说明系统调用多）、读写系统调用次数和字节数（Linux），
+使用 --memory 时还记录Python分配内存的峰值（会让耗时变长）。
+"cold" 表示程序自己的缓存（索引、哈希、大小）为空，操作系统的文件缓存不受影响。
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+from mods_cache import set_cache_directory, save_json
+from mods_copy import DEFAULT_COPY_WORKERS, format_duration, format_size
+from mods_diff import build_sync_plan, diff_manifests
+from mods_jobs import JobExecutor, JOB_DONE
+from mods_manifest import MODS_INFO_FILE_NAME, load_manifest
+from mods_index import load_id_map
+from mods_ops import generate_mods_info_job, move_or_copy_mods_job, scan_mods_job
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# 结果文件格式版本
+BENCH_VERSION = 1
+
+# 生成模拟目录的默认参数
+DEFAULT_ITEMS = 100
+DEFAULT_MODS_PER_ITEM = 2
+DEFAULT_LUA_FILES = 40
+DEFAULT_ASSET_FILES = 6
+DEFAULT_ASSET_MEDIAN = 48 * 1024
+DEFAULT_ASSET_SIGMA = 1.5
+MAX_ASSET_SIZE = 16 * 1024 * 1024
+LUA_SIZE_RANGE = (200, 8 * 1024)
+LUA_DIRECTORY_DEPTH = 3
+FIRST_WORKSHOP_ID = 2000000000
+# 文件内容从这块随机数据中截取，避免逐字节生成随机数
+DATA_POOL_SIZE = 1024 * 1024
+# 比较清单时另外模拟的Mods数量
+COMPARE_MANIFEST_SIZE = 20000
+# 等待任务结束时的轮询间隔（秒）
+JOB_POLL_INTERVAL = 0.01
+
+# 操作名称，按执行顺序排列（后面的操作依赖前面的结果，move会移走源目录中的Mods，所以最后执行）
+OPERATIONS = ["scan_cold", "scan_warm", "copy", "copy_delta", "generate_info_cold", "generate_info_warm",
+              "compare", "move"]
+# 可以重复执行而不改变结果的操作
+REPEATABLE_OPERATIONS = {"scan_warm", "copy_delta", "generate_info_warm", "compare"}
+
+
+def write_file(path, size, rng, pool):
+    """
+    写入一个指定大小的文件，内容以文件路径开头（保证内容各不相同），其余部分来自随机数据
+    """
+    header = (path + "\n").encode("utf-8")[:size]
+    offset = rng.randrange(len(pool))
+    with open(path, 'wb') as file:
+        file.write(header)
+        remaining = size - len(header)
+        while remaining > 0:
+            chunk = pool[offset:offset + remaining]
+            file.write(chunk)
+            remaining -= len(chunk)
+            offset = 0
+
+
+def generate_workshop_tree(directory, items=DEFAULT_ITEMS, mods_per_item=DEFAULT_MODS_PER_ITEM,
+                           lua_files=DEFAULT_LUA_FILES, asset_files=DEFAULT_ASSET_FILES,
+                           asset_median=DEFAULT_ASSET_MEDIAN, asset_sigma=DEFAULT_ASSET_SIGMA, seed=0):
+    """
+    生成模拟的创意工坊目录：<目录>/<创意工坊ID>/mods/<Mod名称>/，每个Mod包含mod.info、poster.png、
+    大量分布在多层目录中的小lua文件，以及大小服从对数正态分布的贴图和声音文件
+    :param directory: 目录（不存在时自动创建）
+    :param items: 创意工坊物品数量
+    :param mods_per_item: 每个物品平均包含的Mod数量
+    :param lua_files: 每个Mod平均包含的lua文件数量
+    :param asset_files: 每个Mod平均包含的贴图和声音文件数量
+    :param asset_median: 贴图和声音文件大小的中位数（字节）
+    :param asset_sigma: 贴图和声音文件大小的对数标准差，越大分布越分散
+    :param seed: 随机数种子，相同参数和种子生成的目录完全相同
+    :return: {"items", "mods", "files", "bytes"}
+    """
+    rng = random.Random(seed)
+    pool = rng.getrandbits(DATA_POOL_SIZE * 8).to_bytes(DATA_POOL_SIZE, 'little')
+    stats = {"items": items, "mods": 0, "files": 0, "bytes": 0}
+
+    def add_file(path, size):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file(path, size, rng, pool)
+        stats["files"] += 1
+        stats["bytes"] += size
+
+    for item_number in range(items):
+        workshop_id = str(FIRST_WORKSHOP_ID + item_number)
+        for mod_number in range(rng.randint(1, max(1, mods_per_item * 2 - 1))):
+            mod = f"BenchMod{item_number}_{mod_number}"
+            mod_path = os.path.join(directory, workshop_id, "mods", mod)
+            os.makedirs(mod_path, exist_ok=True)
+            with open(os.path.join(mod_path, "mod.info"), 'w', encoding='utf-8') as file:
+                file.write(f"name=Bench Mod {item_number}-{mod_number}\nid={mod}\nposter=poster.png\n"
+                           f"description=Generated by mods_bench\n")
+            stats["files"] += 1
+            add_file(os.path.join(mod_path, "poster.png"), rng.randint(4 * 1024, 64 * 1024))
+            for lua_number in range(rng.randint(lua_files // 2, lua_files * 3 // 2)):
+                parts = [rng.choice(("client", "server", "shared"))]
+                parts += [f"dir{rng.randint(0, 4)}" for _ in range(rng.randint(0, LUA_DIRECTORY_DEPTH - 1))]
+                add_file(os.path.join(mod_path, "media", "lua", *parts, f"file{lua_number}.lua"),
+                         rng.randint(*LUA_SIZE_RANGE))
+            for asset_number in range(rng.randint(0, asset_files * 2)):
+                size = min(MAX_ASSET_SIZE, int(rng.lognormvariate(math.log(asset_median), asset_sigma)))
+                kind, extension = rng.choice((("textures", ".png"), ("sound", ".ogg")))
+                add_file(os.path.join(mod_path, "media", kind, f"asset{asset_number}{extension}"), size)
+            stats["mods"] += 1
+    return stats
+
+
+def read_process_io():
+    """
+    :return: Linux上当前进程的读写统计 {"syscr", "syscw", "read_bytes", "write_bytes"}，其他系统返回{}
+    """
+    try:
+        with open("/proc/self/io", 'r') as file:
+            return {key: int(value) for key, value in (line.split(":") for line in file)
+                    if key in ("syscr", "syscw", "read_bytes", "write_bytes")}
+    except OSError:
+        return {}
+
+
+def get_max_rss():
+    """
+    :return: 进程的最大常驻内存（字节），不支持时返回None
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS上单位为字节，Linux上为KB
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def run_job_sync(target, *args):
+    """
+    通过任务执行器运行任务函数（与界面和命令行使用相同的任务代码）并等待结束，失败时抛出异常
+    :return: 任务结果
+    """
+    executor = JobExecutor(echo=False)
+    try:
+        job = executor.submit(target.__name__, target, *args)
+        while not job.finished:
+            time.sleep(JOB_POLL_INTERVAL)
+            executor.drain_events()
+    finally:
+        executor.shutdown(cancel=False)
+    if job.state != JOB_DONE:
+        raise RuntimeError(f"{target.__name__} 失败: {job.error}")
+    return job.result
+
+
+def measure(function, trace_memory=False):
+    """
+    运行一次操作并记录耗时和资源使用
+    :param function: 无参数的函数
+    :param trace_memory: 是否使用tracemalloc记录Python分配内存的峰值
+    :return: (函数返回值, 指标字典)
+    """
+    io_before = read_process_io()
+    times_before = os.times()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = function()
+        wall = time.perf_counter() - start
+    finally:
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+    times_after = os.times()
+    io_after = read_process_io()
+    metrics = {
+        "wall": wall,
+        "user": times_after.user - times_before.user,
+        "system": times_after.system - times_before.system,
+    }
+    for key in io_after:
+        metrics[key] = io_after[key] - io_before.get(key, 0)
+    if peak is not None:
+        metrics["peak_memory"] = peak
+    return result, metrics
+
+
+def make_compare_manifests(count, seed):
+    """
+    生成两个有差异的大清单，用于测量比较的耗时
+    """
+    rng = random.Random(seed)
+    local = {"mods": {}, "details": {}}
+    remote = {"mods": {}, "details": {}}
+    for number in range(count):
+        mod = f"CompareMod{number}"
+        workshop_id = str(FIRST_WORKSHOP_ID + number)
+        details = {"size": 1, "mtime": rng.randint(0, 1000), "file_count": 1, "hash": f"{rng.getrandbits(128):032x}"}
+        roll = rng.random()
+        if roll > 0.05:
+            local["mods"][mod] = workshop_id
+            local["details"][mod] = details
+        if roll < 0.95:
+            remote["mods"][mod] = workshop_id
+            remote["details"][mod] = dict(details, hash=f"{rng.getrandbits(128):032x}") if roll < 0.1 else details
+    return local, remote
+
+
+def run_benchmarks(work_directory, tree_options, operations=OPERATIONS, workers=DEFAULT_COPY_WORKERS, repeat=1,
+                   trace_memory=False, log=print):
+    """
+    在工作目录中生成模拟目录并依次执行各项操作
+    :param work_directory: 工作目录（会在其中创建 workshop、destination、moved 和 cache）
+    :param tree_options: generate_workshop_tree的参数
+    :param operations: 需要执行的操作（OPERATIONS的子集）
+    :param workers: 复制线程数
+    :param repeat: 可重复的操作执行的次数，记录最短的一次
+    :param trace_memory: 是否记录Python分配内存的峰值
+    :param log: 输出进度的函数
+    :return: 结果字典
+    """
+    source_directory = os.path.join(work_directory, "workshop")
+    destination_directory = os.path.join(work_directory, "destination")
+    moved_directory = os.path.join(work_directory, "moved")
+    cache_directory = os.path.join(work_directory, "cache")
+    for directory in (source_directory, destination_directory, moved_directory, cache_directory):
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+    os.makedirs(destination_directory)
+    os.makedirs(moved_directory)
+    # 使用独立的缓存目录，不影响（也不受）正常使用时的缓存
+    set_cache_directory(cache_directory)
+
+    log("生成模拟的创意工坊目录...")
+    tree, generate_metrics = measure(lambda: generate_workshop_tree(source_directory, **tree_options))
+    log(f"共 {tree['items']} 个物品，{tree['mods']} 个Mods，{tree['files']} 个文件，{format_size(tree['bytes'])}，"
+        f"生成耗时 {format_duration(generate_metrics['wall'])}")
+
+    state = {}
+
+    def scan():
+        index = run_job_sync(scan_mods_job, source_directory)
+        state["id_map"] = load_id_map(source_directory)
+        return index
+
+    def copy():
+        id_map = state.get("id_map") or load_id_map(source_directory)
+        return run_job_sync(move_or_copy_mods_job, source_directory, destination_directory, sorted(id_map), id_map,
+                            'copy', workers, True)
+
+    def generate_info():
+        return run_job_sync(generate_mods_info_job, destination_directory, state.get("id_map") or {})
+
+    def compare():
+        local, remote = state["compare_manifests"]
+        diff = diff_manifests(local, [remote])
+        build_sync_plan(diff, local["mods"], source_directory, destination_directory, prune=True)
+        destination_manifest = load_manifest(os.path.join(destination_directory, MODS_INFO_FILE_NAME))
+        return diff_manifests(destination_manifest, [destination_manifest])
+
+    def move():
+        id_map = state.get("id_map") or load_id_map(source_directory)
+        return run_job_sync(move_or_copy_mods_job, source_directory, moved_directory, sorted(id_map), id_map, 'move')
+
+    def clear_cache(*names):
+        for name in os.listdir(cache_directory) if os.path.isdir(cache_directory) else []:
+            if name.startswith(names):
+                os.remove(os.path.join(cache_directory, name))
+
+    steps = {
+        "scan_cold": (lambda: clear_cache("workshop_index"), scan),
+        "scan_warm": (None, scan),
+        "copy": (None, copy),
+        "copy_delta": (None, copy),
+        "generate_info_cold": (lambda: clear_cache("hash_cache"), generate_info),
+        "generate_info_warm": (None, generate_info),
+        "compare": (lambda: state.setdefault("compare_manifests",
+                                             make_compare_manifests(COMPARE_MANIFEST_SIZE, tree_options.get("seed", 0))),
+                    compare),
+        "move": (None, move),
+    }
+    results = {}
+    for operation in OPERATIONS:
+        if operation not in operations:
+            continue
+        prepare, function = steps[operation]
+        runs = []
+        for _ in range(repeat if operation in REPEATABLE_OPERATIONS else 1):
+            if prepare:
+                prepare()
+            runs.append(measure(function, trace_memory)[1])
+        best = min(runs, key=lambda metrics: metrics["wall"])
+        best["runs"] = [metrics["wall"] for metrics in runs]
+        results[operation] = best
+        log(f"{operation}: {best['wall']:.3f}s（用户态 {best['user']:.2f}s，内核态 {best['system']:.2f}s）")
+
+    return {
+        "version": BENCH_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "options": dict(tree_options, workers=workers, repeat=repeat, trace_memory=trace_memory),
+        "tree": tree,
+        "results": results,
+        "max_rss": get_max_rss(),
+    }
+
+
+def compare_results(old, new):
+    """
+    比较两次基准测试的结果
+    :return: [(操作名称, 旧耗时, 新耗时, 新/旧), ...]，只包含两边都有的操作
+    """
+    rows = []
+    for operation in OPERATIONS:
+        if operation in old["results"] and operation in new["results"]:
+            old_wall = old["results"][operation]["wall"]
+            new_wall = new["results"][operation]["wall"]
+            rows.append((operation, old_wall, new_wall, new_wall / old_wall if old_wall else None))
+    return rows
+
+
+def add_tree_arguments(parser):
+    parser.add_argument("--items", type=int, default=DEFAULT_ITEMS, help="创意工坊物品数量")
+    parser.add_argument("--mods-per-item", type=int, default=DEFAULT_MODS_PER_ITEM, help="每个物品平均的Mod数量")
+    parser.add_argument("--lua-files", type=int, default=DEFAULT_LUA_FILES, help="每个Mod平均的lua文件数量")
+    parser.add_argument("--asset-files", type=int, default=DEFAULT_ASSET_FILES, help="每个Mod平均的贴图和声音文件数量")
+    parser.add_argument("--asset-median", type=int, default=DEFAULT_ASSET_MEDIAN, help="贴图和声音文件大小的中位数（字节）")
+    parser.add_argument("--asset-sigma", type=float, default=DEFAULT_ASSET_SIGMA, help="贴图和声音文件大小的对数标准差")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+
+
+def get_tree_options(args):
+    return {"items": args.items, "mods_per_item": args.mods_per_item, "lua_files": args.lua_files,
+            "asset_files": args.asset_files, "asset_median": args.asset_median, "asset_sigma": args.asset_sigma,
+            "seed": args.seed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="mods_bench", description="ZDE ModManager 基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser("generate", help="只生成模拟的创意工坊目录")
+    generate_parser.add_argument("directory", help="输出目录")
+    add_tree_arguments(generate_parser)
+
+    run_parser = subparsers.add_parser("run", help="生成模拟目录并测量各项操作")
+    add_tree_arguments(run_parser)
+    run_parser.add_argument("--operations", default=",".join(OPERATIONS), help="需要测量的操作，逗号分隔")
+    run_parser.add_argument("--workers", type=int, default=DEFAULT_COPY_WORKERS, help="复制线程数")
+    run_parser.add_argument("--repeat", type=int, default=1, help="可重复的操作执行的次数（记录最短的一次）")
+    run_parser.add_argument("--memory", action="store_true", help="记录Python分配内存的峰值（耗时会变长）")
+    run_parser.add_argument("--work-dir", help="工作目录（默认使用临时目录，结束后删除）")
+    run_parser.add_argument("--output", help="结果JSON文件")
+
+    compare_parser = subparsers.add_parser("compare", help="比较两个结果JSON文件")
+    compare_parser.add_argument("old", help="旧版本的结果")
+    compare_parser.add_argument("new", help="新版本的结果")
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        tree = generate_workshop_tree(args.directory, **get_tree_options(args))
+        print(f"共 {tree['items']} 个物品，{tree['mods']} 个Mods，{tree['files']} 个文件，{format_size(tree['bytes'])}")
+        return 0
+
+    if args.command == "compare":
+        with open(args.old, 'r', encoding='utf-8') as file:
+            old = json.load(file)
+        with open(args.new, 'r', encoding='utf-8') as file:
+            new = json.load(file)
+        if old.get("tree") != new.get("tree"):
+            print("注意：两次测试的模拟目录不同，结果不能直接比较")
+        print(f"{'操作':<20}{'旧':>12}{'新':>12}{'新/旧':>10}")
+        for operation, old_wall, new_wall, ratio in compare_results(old, new):
+            print(f"{operation:<20}{old_wall:>11.3f}s{new_wall:>11.3f}s{ratio:>10.2f}" if ratio is not None else
+                  f"{operation:<20}{old_wall:>11.3f}s{new_wall:>11.3f}s{'-':>10}")
+        return 0
+
+    operations = [operation.strip() for operation in args.operations.split(",") if operation.strip()]
+    unknown = [operation for operation in operations if operation not in OPERATIONS]
+    if unknown:
+        parser.error(f"未知的操作：{', '.join(unknown)}（可选：{', '.join(OPERATIONS)}）")
+    work_directory = args.work_dir or tempfile.mkdtemp(prefix="zde_bench_")
+    try:
+        result = run_benchmarks(work_directory, get_tree_options(args), operations, args.workers, max(1, args.repeat),
+                                args.memory, log=lambda message: print(message, file=sys.stderr))
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_directory, ignore_errors=True)
+    if args.output:
+        save_json(args.output, result, indent=2)
+    else:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import os
+import json
+import hashlib
+
+# 缓存目录，所有索引/哈希/缩略图等持久化缓存都放在这里
+CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".zde_modmanager")
+
+
+def set_cache_directory(directory):
+    """
+    更改缓存目录（例如基准测试使用独立的临时缓存），需要在创建任何缓存对象之前调用
+    :param directory: 新的缓存目录
+    """
+    global CACHE_DIRECTORY
+    CACHE_DIRECTORY = os.path.abspath(directory)
+
+
+def get_cache_directory(*parts):
+    """
+    获取缓存目录（不存在时自动创建）
+    :param parts: 缓存目录下的子目录
+    :return: 缓存目录路径
+    """
+    directory = os.path.join(CACHE_DIRECTORY, *parts)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def cache_file_path(name, key):
+    """
+    根据缓存名称和键（通常是目录路径）生成缓存文件路径
+    :param name: 缓存名称，例如 'workshop_index'
+    :param key: 缓存键，例如源目录的绝对路径
+    :return: 缓存文件路径
+    """
+    digest = hashlib.sha1(os.path.normcase(os.path.abspath(key)).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(get_cache_directory(), f"{name}_{digest}.json")
+
+
+def load_json(path, default=None):
+    """
+    读取JSON缓存文件，文件不存在或已损坏时返回默认值
+    :param path: 文件路径
+    :param default: 默认值
+    :return: 读取到的数据
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(path, data, indent=None):
+    """
+    原子地写入JSON文件（先写临时文件再重命名），避免写到一半时文件损坏
+    :param path: 文件路径
+    :param data: 要写入的数据
+    :param indent: 缩进
+    """
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, indent=indent)
+    os.replace(temp_path, path)
@@ -0,0 +1,682 @@
+"""
+ZDE ModManager 命令行入口，不依赖Tkinter和PIL，可以在没有图形界面的服务器上运行，供计划任务和部署脚本调用。
+
+用法示例：
+    python mods_cli.py scan <源目录>
+    python mods_cli.py scan <Steam库1的源目录>:<Steam库2的源目录>
+    python mods_cli.py conflicts <源目录1>:<源目录2> --rule library --pin modA=123456
+    python mods_cli.py copy <源目录> <目标目录> --all --json
+    python mods_cli.py generate-info <目标目录> --source <源目录>
+    python mods_cli.py compare <目标目录> <远程mods_info.json> [更多mods_info.json] --source <源目录> --save-plan plan.json
+    python mods_cli.py apply-plan plan.json
+    python mods_cli.py move-by-id <源目录> <目标目录> --ids-file ids.txt [--dry-run]
+    python mods_cli.py delete <目标目录> modA modB --yes
+    python mods_cli.py restore <目标目录>
+    python mods_cli.py purge-trash <目标目录> --older-than 3600
+    python mods_cli.py serve <目标目录> --port 8765
+    python mods_cli.py pack mods.zdepack --source <源目录> --all
+    python mods_cli.py unpack mods.zdepack <目标目录>
+    python mods_cli.py copy <源目录> <目标目录> --all --deploy store
+    python mods_cli.py store-gc
+    python mods_cli.py copy <源目录> <目标目录> --all --trace copy_trace.json
+    python mods_cli.py history --limit 20
+    python mods_cli.py copy <源目录> <目标目录> --all --verify
+    python mods_cli.py audit <目标目录> --source <源目录>
+    python mods_cli.py server-config <源目录> --all --output servertest.ini
+
+日志和进度输出到标准错误，--json 时标准输出只包含一个JSON结果对象。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+from mods_cache import load_json, save_json
+from mods_copy import DEFAULT_COPY_WORKERS, format_size
+from mods_deploy import DEPLOY_COPY, DEPLOY_MODES
+from mods_diff import (SYNC_PLAN_VERSION, build_sync_plan, describe_diff, describe_id_plan, diff_manifests,
+                       has_differences, parse_id_list)
+from mods_index import (CONFLICT_RULES, SOURCE_SEPARATOR, get_mod_path, load_conflict_settings, load_id_map,
+                        load_workshop_index, save_conflict_settings, split_source_directories)
+from mods_jobs import JobExecutor, EVENT_LOG, JOB_DONE, JOB_CANCELLED, UNIT_BYTES
+from mods_journal import is_internal_name
+from mods_manifest import MODS_INFO_FILE_NAME, load_manifest
+from mods_metadata import build_server_config, format_server_config, load_mods_metadata
+from mods_ops import (move_or_copy_mods_job, plan_mods_by_id_job, delete_mods_job, generate_mods_info_job,
+                      calculate_mods_size_job, run_sync_plan_job)
+from mods_pack import DEFAULT_COMPRESS_LEVEL, read_pack_index, pack_mods_job, unpack_pack_job
+from mods_store import store_gc_job, store_report_job
+from mods_sync import DEFAULT_PORT, serve_mods
+from mods_trace import format_history, load_run_history, save_chrome_trace
+from mods_trash import (DEFAULT_PURGE_FILES_PER_SECOND, TrashBin, purge_trash_job, restore_mods_job,
+                        trash_mods_job)
+from mods_verify import DEFAULT_VERIFY_WORKERS, audit_destination_job
+
+# 退出码
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+# compare 发现差异时的退出码（与diff命令的约定类似）
+EXIT_DIFFERENCES = 3
+EXIT_CANCELLED = 130
+
+# 等待任务时刷新日志和进度的间隔（秒）
+POLL_INTERVAL = 0.2
+
+
+class CommandError(Exception):
+    """命令参数或环境有误，以EXIT_USAGE退出"""
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def run_job(args, name, target, *job_args):
+    """
+    在后台线程中运行任务，把日志和进度输出到标准错误，Ctrl+C时取消任务并等待它保存已完成的部分
+    :param args: 命令行参数
+    :param name: 任务名称
+    :param target: 任务函数
+    :return: 结束后的Job对象
+    """
+    executor = JobExecutor(echo=False)
+    job = executor.submit(name, target, *job_args)
+    show_progress = not args.quiet and sys.stderr.isatty()
+    try:
+        while True:
+            try:
+                while not job.finished:
+                    time.sleep(POLL_INTERVAL)
+                    print_events(args, executor, job, show_progress)
+                break
+            except KeyboardInterrupt:
+                log("正在取消，等待已完成的部分保存……")
+                job.cancel()
+        print_events(args, executor, job, False)
+    finally:
+        executor.shutdown(cancel=False)
+    if getattr(args, "trace", None):
+        save_chrome_trace(job.tracer, args.trace)
+        if not args.quiet:
+            log(f"trace已保存到 {args.trace}")
+    return job
+
+
+def print_events(args, executor, job, show_progress):
+    for event in executor.drain_events():
+        if event[0] == EVENT_LOG and not args.quiet:
+            if show_progress:
+                sys.stderr.write("\r\033[K")
+            log(event[2])
+    if show_progress:
+        stats = job.stats()
+        if stats["total"]:
+            done, total = stats["done"], stats["total"]
+            if stats["unit"] == UNIT_BYTES:
+                text = f"{format_size(done)} / {format_size(total)}  {format_size(stats['rate'])}/s"
+            else:
+                text = f"{done} / {total}"
+            sys.stderr.write(f"\r\033[K{done * 100 // max(total, 1)}%  {text}  {stats['status']}")
+            sys.stderr.flush()
+
+
+def job_exit_code(job):
+    if job.state == JOB_DONE:
+        return EXIT_OK
+    if job.state == JOB_CANCELLED:
+        return EXIT_CANCELLED
+    return EXIT_ERROR
+
+
+def job_result(job, **fields):
+    """
+    :return: 任务结果的JSON对象
+    """
+    result = {"ok": job.state == JOB_DONE, "state": job.state}
+    if job.error is not None:
+        result["error"] = str(job.error)
+    result.update(fields)
+    return result
+
+
+def require_directory(path, description):
+    if not os.path.isdir(path):
+        raise CommandError(f"{description}不存在：{path}")
+    return path
+
+
+def require_source_directories(source_directory):
+    """
+    检查一个或多个源目录（用SOURCE_SEPARATOR分隔）都存在
+    :return: 使用绝对路径的源目录字符串
+    """
+    directories = split_source_directories(source_directory)
+    if not directories:
+        raise CommandError("没有指定源目录")
+    for directory in directories:
+        require_directory(directory, "源目录")
+    return SOURCE_SEPARATOR.join(directories)
+
+
+def select_mods(id_map, args):
+    """
+    根据 --all 或 mod名称参数确定需要处理的Mods
+    :return: mod名称列表
+    """
+    if args.all:
+        return sorted(id_map)
+    if not args.mods:
+        raise CommandError("请指定需要处理的Mods，或使用 --all")
+    unknown = [mod for mod in args.mods if mod not in id_map]
+    if unknown:
+        raise CommandError(f"源目录中找不到这些Mods：{', '.join(unknown)}")
+    return args.mods
+
+
+def read_id_list(args):
+    """
+    读取 --ids 和 --ids-file 指定的创意工坊ID（逗号、空白或换行分隔，与“导出创意工坊ID”的格式相同）
+    :return: 创意工坊ID列表（去掉重复的ID）
+    """
+    text = args.ids or ""
+    if args.ids_file:
+        with open(args.ids_file, 'r', encoding='utf-8') as file:
+            text += "," + file.read()
+    return parse_id_list(text)
+
+
+def confirm(args, message):
+    """
+    需要确认的操作：--yes 时直接执行；非交互环境中没有 --yes 时拒绝执行
+    """
+    if args.yes:
+        return True
+    if not sys.stdin.isatty():
+        raise CommandError(f"{message}（非交互模式下请使用 --yes 确认）")
+    return input(f"{message} [y/N] ").strip().lower() in ("y", "yes")
+
+
+def command_scan(args):
+    source_directory = require_source_directories(args.source)
+    conflicts = {}
+    id_map = load_id_map(source_directory, use_cache=not args.no_cache, conflicts=conflicts)
+    result = {"ok": True, "mods_count": len(id_map), "mods": dict(sorted(id_map.items())),
+              "conflicts": dict(sorted(conflicts.items()))}
+    if args.size:
+        size_job = run_job(args, "计算Mods大小", calculate_mods_size_job,
+                           [get_mod_path(source_directory, workshop_id, mod) for mod, workshop_id in id_map.items()])
+        if size_job.state != JOB_DONE:
+            return job_exit_code(size_job), job_result(size_job)
+        result["size"], result["files"] = size_job.result
+    if args.metadata:
+        metadata = load_mods_metadata({mod: get_mod_path(source_directory, workshop_id, mod)
+                                       for mod, workshop_id in id_map.items()})
+        result["metadata"] = {mod: {key: entry[key] for key in ("id", "name", "require")}
+                              for mod, entry in sorted(metadata.items())}
+    if not args.json:
+        for mod, workshop_id in result["mods"].items():
+            if args.metadata:
+                entry = result["metadata"].get(mod, {})
+                print(f"{workshop_id}\t{mod}\t{entry.get('id', '')}\t{entry.get('name', '')}")
+            else:
+                print(f"{workshop_id}\t{mod}")
+        log(f"共 {len(id_map)} 个Mods" + (f"，{format_size(result['size'])}" if args.size else ""))
+        if conflicts:
+            log(f"{len(conflicts)} 个Mods在多个创意工坊物品中同名，使用 conflicts 命令查看")
+    return EXIT_OK, result
+
+
+def command_server_config(args):
+    if args.destination:
+        destination_directory = require_directory(args.directory, "目标目录")
+        id_map = load_manifest(os.path.join(destination_directory, MODS_INFO_FILE_NAME))["mods"]
+        with os.scandir(destination_directory) as entries:
+            id_map = {entry.name: id_map.get(entry.name, "") for entry in entries
+                      if entry.is_dir() and not is_internal_name(entry.name)}
+        selected_mods = select_mods(id_map, args)
+        mod_paths = {mod: os.path.join(destination_directory, mod) for mod in selected_mods}
+    else:
+        source_directory = require_source_directories(args.directory)
+        id_map = load_id_map(source_directory)
+        selected_mods = select_mods(id_map, args)
+        mod_paths = {mod: get_mod_path(source_directory, id_map[mod], mod) for mod in selected_mods}
+    config = build_server_config(selected_mods, {mod: workshop_id for mod, workshop_id in id_map.items() if workshop_id},
+                                 load_mods_metadata(mod_paths))
+    text = format_server_config(config)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text)
+        log(f"服务器配置已保存到 {args.output}")
+    elif not args.json:
+        print(text, end="")
+    for mod_id, required in config["missing_requires"]:
+        log(f"{mod_id} 依赖的 {required} 不在选定的Mods中")
+    return EXIT_OK, dict({"ok": True}, **config)
+
+
+def command_conflicts(args):
+    settings = load_conflict_settings()
+    if args.rule:
+        settings["rule"] = args.rule
+    for pin in args.pin or []:
+        mod, separator, workshop_id = pin.partition("=")
+        if not separator or not mod or not workshop_id:
+            raise CommandError(f"--pin 的格式应为 mod名称=创意工坊ID：{pin}")
+        settings["pins"][mod] = workshop_id
+    for mod in args.unpin or []:
+        settings["pins"].pop(mod, None)
+    if args.rule or args.pin or args.unpin:
+        save_conflict_settings(settings)
+    conflicts = {}
+    load_id_map(require_source_directories(args.source), conflicts=conflicts)
+    if not args.json:
+        print(f"选择规则：{CONFLICT_RULES[settings['rule']]}")
+        for mod, conflict in sorted(conflicts.items()):
+            others = [item for item in conflict["candidates"] if item != conflict["chosen"]]
+            print(f"{mod}\t使用 {conflict['chosen']}{'（固定）' if conflict['pinned'] else ''}\t"
+                  f"其他：{', '.join(others)}")
+        log(f"共 {len(conflicts)} 个同名Mods")
+    return EXIT_OK, {"ok": True, "rule": settings["rule"], "pins": settings["pins"],
+                     "conflicts": dict(sorted(conflicts.items()))}
+
+
+def command_generate_info(args):
+    destination_directory = require_directory(args.destination, "目标目录")
+    id_map = load_id_map(require_source_directories(args.source)) if args.source else {}
+    if not id_map:
+        # 没有源目录时沿用目标目录中已有的创意工坊ID
+        id_map = load_manifest(os.path.join(destination_directory, MODS_INFO_FILE_NAME))["mods"]
+    job = run_job(args, "生成Mods_info.json", generate_mods_info_job, destination_directory, id_map, args.files)
+    mods_count = job.result["mods_count"] if job.result else 0
+    return job_exit_code(job), job_result(job, mods_count=mods_count,
+                                          path=os.path.join(destination_directory, MODS_INFO_FILE_NAME))
+
+
+def command_copy(args):
+    source_directory = require_source_directories(args.source)
+    destination_directory = args.destination
+    os.makedirs(destination_directory, exist_ok=True)
+    id_map = load_id_map(source_directory)
+    selected_mods = select_mods(id_map, args)
+    action = 'move' if args.move else 'copy'
+    job = run_job(args, f"{action} Mods", move_or_copy_mods_job, source_directory, destination_directory,
+                  selected_mods, id_map, action, args.workers, not args.no_delta, args.hash, args.deploy, args.store,
+                  args.verify)
+    return job_exit_code(job), job_result(job, action=action, processed=job.result or [])
+
+
+def command_move_by_id(args):
+    source_directory = require_source_directories(args.source)
+    destination_directory = require_directory(args.destination, "目标目录")
+    workshop_ids = read_id_list(args)
+    if args.all:
+        workshop_ids = sorted(load_workshop_index(source_directory)["items"])
+    elif not workshop_ids:
+        raise CommandError("请使用 --ids 或 --ids-file 指定创意工坊ID，或使用 --all")
+    action = 'copy' if args.copy else 'move'
+    plan_job = run_job(args, "生成创意工坊ID计划", plan_mods_by_id_job, source_directory,
+                       os.path.abspath(destination_directory), workshop_ids, action)
+    if plan_job.state != JOB_DONE:
+        return job_exit_code(plan_job), job_result(plan_job)
+    plan = plan_job.result
+    if args.save_plan:
+        save_json(args.save_plan, plan, indent=4)
+    if not args.json:
+        print(describe_id_plan(plan))
+    if args.dry_run or not plan["copy"]:
+        return EXIT_OK, {"ok": True, "plan": plan, "processed": []}
+    job = run_job(args, "通过创意工坊ID移动Mods", run_sync_plan_job, plan)
+    return job_exit_code(job), job_result(job, plan=plan, processed=(job.result or {}).get("copied", []))
+
+
+def command_compare(args):
+    local_directory = require_directory(args.destination, "目标目录")
+    local_json_path = os.path.join(local_directory, MODS_INFO_FILE_NAME)
+    if not os.path.exists(local_json_path):
+        raise CommandError(f"本地mods_info.json不存在：{local_json_path}")
+    for remote in args.remote:
+        if not os.path.exists(remote):
+            raise CommandError(f"远程mods_info.json不存在：{remote}")
+    diff = diff_manifests(load_manifest(local_json_path), [load_manifest(remote) for remote in args.remote])
+    result = {"ok": True}
+    result.update(diff)
+    plan = None
+    if args.source:
+        source_directory = require_source_directories(args.source)
+        plan = build_sync_plan(diff, load_id_map(source_directory), source_directory,
+                               os.path.abspath(local_directory), args.prune)
+        result["plan"] = plan
+        if args.save_plan:
+            save_json(args.save_plan, plan, indent=4)
+    elif args.save_plan or args.prune:
+        raise CommandError("生成同步计划需要使用 --source 指定源目录")
+    if not args.json:
+        print(describe_diff(diff))
+        if plan:
+            print(f"同步计划：复制 {len(plan['copy'])} 个，删除 {len(plan['delete'])} 个，跳过 {len(plan['skipped'])} 个")
+    return (EXIT_DIFFERENCES if has_differences(diff) else EXIT_OK), result
+
+
+def command_apply_plan(args):
+    plan = load_json(args.plan)
+    if not plan or plan.get("version") != SYNC_PLAN_VERSION:
+        raise CommandError(f"无效的同步计划：{args.plan}")
+    require_source_directories(plan["source_directory"])
+    require_directory(plan["destination_directory"], "目标目录")
+    if plan["delete"] and not confirm(args, f"同步计划将从 {plan['destination_directory']} 删除 "
+                                            f"{len(plan['delete'])} 个Mods，确定继续吗？"):
+        return EXIT_CANCELLED, {"ok": False, "state": JOB_CANCELLED}
+    job = run_job(args, "执行同步计划", run_sync_plan_job, plan, args.workers, not args.no_delta, args.hash, args.deploy,
+                  args.verify)
+    return job_exit_code(job), job_result(job, **(job.result or {}))
+
+
+def command_delete(args):
+    destination_directory = require_directory(args.destination, "目标目录")
+    if not confirm(args, f"确定要从 {destination_directory} 删除 {len(args.mods)} 个Mods吗？"):
+        return EXIT_CANCELLED, {"ok": False, "state": JOB_CANCELLED, "deleted": []}
+    if args.permanent:
+        job = run_job(args, "删除Mods", delete_mods_job, destination_directory, args.mods)
+        return job_exit_code(job), job_result(job, deleted=job.result or [])
+    job = run_job(args, "删除Mods", trash_mods_job, destination_directory, args.mods)
+    result = job.result or {"batch": None, "trashed": []}
+    if result["trashed"] and not args.json:
+        print(f"已移到回收站（批次 {result['batch']}），可以使用 restore 撤销，purge-trash 立即释放空间")
+    return job_exit_code(job), job_result(job, deleted=result["trashed"], batch=result["batch"])
+
+
+def command_trash(args):
+    batches = TrashBin(require_directory(args.destination, "目标目录")).batches()
+    if not args.json:
+        if not batches:
+            print("回收站是空的")
+        for batch, mods, deleted_at in batches:
+            print(f"{batch}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(deleted_at))}  "
+                  f"{len(mods)} 个Mods：{', '.join(sorted(mods))}")
+    return EXIT_OK, {"ok": True, "batches": [{"batch": batch, "mods": mods, "deleted_at": deleted_at}
+                                             for batch, mods, deleted_at in batches]}
+
+
+def command_restore(args):
+    destination_directory = require_directory(args.destination, "目标目录")
+    job = run_job(args, "恢复Mods", restore_mods_job, destination_directory, args.batch)
+    return job_exit_code(job), job_result(job, restored=job.result or [])
+
+
+def command_purge_trash(args):
+    destination_directory = require_directory(args.destination, "目标目录")
+    job = run_job(args, "清理回收站", purge_trash_job, destination_directory, args.older_than, args.rate or None)
+    result = job.result or {"purged": [], "removed_files": 0, "freed_bytes": 0}
+    if job.result and not args.json:
+        print(f"已清理 {len(result['purged'])} 个Mods，释放 {format_size(result['freed_bytes'])}")
+    return job_exit_code(job), job_result(job, **result)
+
+
+def command_pack(args):
+    if args.source:
+        source_directory = require_source_directories(args.source)
+        id_map = load_id_map(source_directory)
+        mods = [(mod, get_mod_path(source_directory, id_map[mod], mod), id_map[mod])
+                for mod in select_mods(id_map, args)]
+    elif args.destination:
+        # 打包整个目标目录，创意工坊ID来自目标目录的mods_info.json
+        destination_directory = require_directory(args.destination, "目标目录")
+        id_map = load_manifest(os.path.join(destination_directory, MODS_INFO_FILE_NAME))["mods"]
+        mods = [(mod, os.path.join(destination_directory, mod), workshop_id)
+                for mod, workshop_id in sorted(id_map.items())
+                if os.path.isdir(os.path.join(destination_directory, mod))]
+    else:
+        raise CommandError("请使用 --source 或 --destination 指定需要打包的Mods")
+    job = run_job(args, "导出Mods包", pack_mods_job, args.pack, mods, args.level)
+    return job_exit_code(job), job_result(job, path=args.pack, **(job.result or {}))
+
+
+def command_unpack(args):
+    if not os.path.isfile(args.pack):
+        raise CommandError(f"Mods包不存在：{args.pack}")
+    if args.list:
+        index = read_pack_index(args.pack)
+        if not args.json:
+            for mod, entry in index["mods"].items():
+                print(f"{entry['workshop_id']}\t{mod}\t{format_size(entry['size'])}")
+        return EXIT_OK, {"ok": True, "mods": index["mods"]}
+    if not args.destination:
+        raise CommandError("请指定目标目录")
+    job = run_job(args, "导入Mods包", unpack_pack_job, args.pack, args.destination, args.mods or None)
+    return job_exit_code(job), job_result(job, extracted=job.result or [])
+
+
+def print_store_report(args, report):
+    if args.json:
+        return
+    print(f"共享存储：{report['objects']} 个对象，占用 {format_size(report['stored_bytes'])}")
+    print(f"目标目录中引用 {format_size(report['referenced_bytes'])}，节省 {format_size(report['saved_bytes'])}")
+    if report["unreferenced_objects"]:
+        print(f"不再使用的对象：{report['unreferenced_objects']} 个（{format_size(report['unreferenced_bytes'])}），"
+              f"可以使用 store-gc 清理")
+
+
+def command_audit(args):
+    destination_directory = require_directory(args.destination, "目标目录")
+    source_paths = None
+    if args.source:
+        source_directory = require_source_directories(args.source)
+        id_map = load_id_map(source_directory)
+        source_paths = {mod: get_mod_path(source_directory, workshop_id, mod) for mod, workshop_id in id_map.items()}
+    job = run_job(args, "审计目标目录", audit_destination_job, destination_directory, source_paths, args.workers)
+    if job.state != JOB_DONE:
+        return job_exit_code(job), job_result(job)
+    report = job.result
+    problems = [mod for mod in list(report["mismatched"]) + report["missing"]
+                if mod not in report["repaired"] or mod in report["failed"]]
+    if not args.json:
+        for mod, rel_paths in sorted(report["mismatched"].items()):
+            state = "已修复" if mod in report["repaired"] and mod not in report["failed"] else "不一致"
+            print(f"{state}\t{mod}\t{', '.join(rel_paths)}")
+        for mod in report["missing"]:
+            print(f"缺少\t{mod}")
+    return (EXIT_DIFFERENCES if problems else EXIT_OK), job_result(job, **report)
+
+
+def command_store_report(args):
+    job = run_job(args, "统计共享存储", store_report_job, args.store)
+    if job.result:
+        print_store_report(args, job.result)
+    return job_exit_code(job), job_result(job, **(job.result or {}))
+
+
+def command_store_gc(args):
+    job = run_job(args, "清理共享存储", store_gc_job, args.store)
+    if job.result:
+        if not args.json:
+            print(f"已删除 {job.result['removed_objects']} 个对象，释放 {format_size(job.result['freed_bytes'])}")
+        print_store_report(args, job.result)
+    return job_exit_code(job), job_result(job, **(job.result or {}))
+
+
+def command_history(args):
+    entries = load_run_history(args.name, args.limit)
+    if not args.json:
+        print(format_history(entries) if entries else "还没有运行记录")
+    return EXIT_OK, {"ok": True, "runs": entries}
+
+
+def command_serve(args):
+    serve_mods(require_directory(args.destination, "目标目录"), args.host, args.port)
+    return EXIT_OK, {"ok": True}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="mods_cli", description="ZDE ModManager 命令行工具（不需要图形界面）")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--json", action="store_true", help="在标准输出中输出JSON格式的结果")
+    common.add_argument("-q", "--quiet", action="store_true", help="不输出日志和进度")
+    common.add_argument("--trace", metavar="FILE", help="把任务的耗时统计保存为Chrome trace-event格式的JSON文件")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan_parser = subparsers.add_parser("scan", parents=[common], help="列出源目录中的Mods和创意工坊ID")
+    scan_parser.add_argument("source", help=f"源目录（包含Mods文件夹的目录），多个源目录用\"{SOURCE_SEPARATOR}\"分隔")
+    scan_parser.add_argument("--no-cache", action="store_true", help="不使用索引缓存，重新扫描")
+    scan_parser.add_argument("--size", action="store_true", help="同时计算Mods总大小")
+    scan_parser.add_argument("--metadata", action="store_true", help="同时列出mod.info中的Mod ID和名称")
+    scan_parser.set_defaults(handler=command_scan)
+
+    config_parser = subparsers.add_parser("server-config", parents=[common],
+                                          help="按mod.info生成服务器配置中的WorkshopItems=和Mods=")
+    config_parser.add_argument("directory", help=f"源目录（多个源目录用\"{SOURCE_SEPARATOR}\"分隔），或 --destination 时的目标目录")
+    config_parser.add_argument("mods", nargs="*", help="Mod名称")
+    config_parser.add_argument("--all", action="store_true", help="使用目录中的所有Mods")
+    config_parser.add_argument("--destination", action="store_true", help="directory是目标目录（Mods直接放在其中）")
+    config_parser.add_argument("--output", help="保存到文件而不是输出到标准输出")
+    config_parser.set_defaults(handler=command_server_config)
+
+    conflicts_parser = subparsers.add_parser("conflicts", parents=[common],
+                                             help="列出多个创意工坊物品中的同名Mods，设置使用哪一个")
+    conflicts_parser.add_argument("source", help=f"源目录，多个源目录用\"{SOURCE_SEPARATOR}\"分隔")
+    conflicts_parser.add_argument("--rule", choices=list(CONFLICT_RULES),
+                                  help="选择规则：newest 修改时间最新，library 排在前面的源目录，highest_id 创意工坊ID最大")
+    conflicts_parser.add_argument("--pin", action="append", metavar="MOD=ID", help="固定使用某个创意工坊物品中的Mod")
+    conflicts_parser.add_argument("--unpin", action="append", metavar="MOD", help="取消固定选择")
+    conflicts_parser.set_defaults(handler=command_conflicts)
+
+    info_parser = subparsers.add_parser("generate-info", parents=[common], help="生成目标目录的mods_info.json")
+    info_parser.add_argument("destination", help="目标目录")
+    info_parser.add_argument("--source", help="源目录，用于查找创意工坊ID（默认沿用已有的mods_info.json）")
+    info_parser.add_argument("--files", action="store_true", help="记录每个文件的哈希")
+    info_parser.set_defaults(handler=command_generate_info)
+
+    copy_parser = subparsers.add_parser("copy", parents=[common], help="复制（或移动）Mods到目标目录")
+    copy_parser.add_argument("source", help="源目录")
+    copy_parser.add_argument("destination", help="目标目录（不存在时自动创建）")
+    copy_parser.add_argument("mods", nargs="*", help="需要复制的Mod名称")
+    copy_parser.add_argument("--all", action="store_true", help="复制源目录中的所有Mods")
+    copy_parser.add_argument("--move", action="store_true", help="移动而不是复制")
+    copy_parser.add_argument("--workers", type=int, default=DEFAULT_COPY_WORKERS, help="复制线程数")
+    copy_parser.add_argument("--no-delta", action="store_true", help="目标已存在时整个重新复制，而不是增量同步")
+    copy_parser.add_argument("--hash", action="store_true", help="增量同步时比较文件内容")
+    copy_parser.add_argument("--deploy", choices=list(DEPLOY_MODES), default=DEPLOY_COPY, help="部署方式")
+    copy_parser.add_argument("--store", help="共享存储目录（--deploy store 时使用，默认在缓存目录中）")
+    copy_parser.add_argument("--verify", action="store_true", help="复制后重新读取并比较内容，只重新复制不一致的文件")
+    copy_parser.set_defaults(handler=command_copy)
+
+    move_parser = subparsers.add_parser("move-by-id", parents=[common], help="通过创意工坊ID移动Mods")
+    move_parser.add_argument("source", help="源目录")
+    move_parser.add_argument("destination", help="目标目录")
+    move_parser.add_argument("--ids", help="创意工坊ID，逗号分隔")
+    move_parser.add_argument("--ids-file", help="包含创意工坊ID的txt文件")
+    move_parser.add_argument("--all", action="store_true", help="移动源目录中的所有Mods")
+    move_parser.add_argument("--copy", action="store_true", help="复制而不是移动")
+    move_parser.add_argument("--dry-run", action="store_true", help="只显示计划（Mods、数据量和找不到的ID），不移动")
+    move_parser.add_argument("--save-plan", help="把计划保存到文件，之后可以使用 apply-plan 执行")
+    move_parser.set_defaults(handler=command_move_by_id)
+
+    compare_parser = subparsers.add_parser("compare", parents=[common], help="比较本地和远程的mods_info.json")
+    compare_parser.add_argument("destination", help="本地目标目录")
+    compare_parser.add_argument("remote", nargs="+", help="远程mods_info.json文件（可以指定多个）")
+    compare_parser.add_argument("--source", help="源目录，指定时生成同步计划")
+    compare_parser.add_argument("--prune", action="store_true", help="同步计划中删除远程没有的本地Mods")
+    compare_parser.add_argument("--save-plan", help="把同步计划保存到文件，之后可以使用 apply-plan 执行")
+    compare_parser.set_defaults(handler=command_compare)
+
+    apply_parser = subparsers.add_parser("apply-plan", parents=[common], help="执行 compare 生成的同步计划")
+    apply_parser.add_argument("plan", help="同步计划文件")
+    apply_parser.add_argument("--workers", type=int, default=DEFAULT_COPY_WORKERS, help="复制线程数")
+    apply_parser.add_argument("--no-delta", action="store_true", help="目标已存在时整个重新复制，而不是增量同步")
+    apply_parser.add_argument("--hash", action="store_true", help="增量同步时比较文件内容")
+    apply_parser.add_argument("--deploy", choices=list(DEPLOY_MODES), default=DEPLOY_COPY, help="部署方式")
+    apply_parser.add_argument("--verify", action="store_true", help="复制后重新读取并比较内容，只重新复制不一致的文件")
+    apply_parser.add_argument("-y", "--yes", action="store_true", help="计划中包含删除时不询问")
+    apply_parser.set_defaults(handler=command_apply_plan)
+
+    delete_parser = subparsers.add_parser("delete", parents=[common], help="删除目标目录中的Mods")
+    delete_parser.add_argument("destination", help="目标目录")
+    delete_parser.add_argument("mods", nargs="+", help="需要删除的Mod名称")
+    delete_parser.add_argument("-y", "--yes", action="store_true", help="不询问，直接删除")
+    delete_parser.add_argument("--permanent", action="store_true", help="直接删除，不经过回收站（不能撤销）")
+    delete_parser.set_defaults(handler=command_delete)
+
+    trash_parser = subparsers.add_parser("trash", parents=[common], help="列出目标目录回收站中可以恢复的Mods")
+    trash_parser.add_argument("destination", help="目标目录")
+    trash_parser.set_defaults(handler=command_trash)
+
+    restore_parser = subparsers.add_parser("restore", parents=[common], help="从回收站恢复删除的Mods")
+    restore_parser.add_argument("destination", help="目标目录")
+    restore_parser.add_argument("--batch", help="需要恢复的批次（见 trash），默认恢复最近一次删除的Mods")
+    restore_parser.set_defaults(handler=command_restore)
+
+    purge_parser = subparsers.add_parser("purge-trash", parents=[common], help="清理回收站，释放磁盘空间")
+    purge_parser.add_argument("destination", help="目标目录")
+    purge_parser.add_argument("--older-than", type=float, default=0, metavar="SECONDS",
+                              help="只清理删除时间超过这么多秒的Mods（默认全部清理）")
+    purge_parser.add_argument("--rate", type=int, default=DEFAULT_PURGE_FILES_PER_SECOND,
+                              help="每秒最多删除的文件数，0表示不限速")
+    purge_parser.set_defaults(handler=command_purge_trash)
+
+    pack_parser = subparsers.add_parser("pack", parents=[common], help="把Mods打包为一个压缩的Mods包")
+    pack_parser.add_argument("pack", help="Mods包路径（.zdepack）")
+    pack_parser.add_argument("mods", nargs="*", help="需要打包的Mod名称（配合 --source）")
+    pack_parser.add_argument("--source", help="从源目录打包")
+    pack_parser.add_argument("--all", action="store_true", help="打包源目录中的所有Mods")
+    pack_parser.add_argument("--destination", help="打包整个目标目录")
+    pack_parser.add_argument("--level", type=int, default=DEFAULT_COMPRESS_LEVEL, choices=range(0, 10),
+                             metavar="0-9", help="压缩级别")
+    pack_parser.set_defaults(handler=command_pack)
+
+    unpack_parser = subparsers.add_parser("unpack", parents=[common], help="把Mods包解压到目标目录")
+    unpack_parser.add_argument("pack", help="Mods包路径")
+    unpack_parser.add_argument("destination", nargs="?", help="目标目录")
+    unpack_parser.add_argument("mods", nargs="*", help="只解压这些Mods")
+    unpack_parser.add_argument("--list", action="store_true", help="只列出Mods包中的Mods")
+    unpack_parser.set_defaults(handler=command_unpack)
+
+    audit_parser = subparsers.add_parser("audit", parents=[common], help="按mods_info.json中的哈希审计目标目录")
+    audit_parser.add_argument("destination", help="目标目录")
+    audit_parser.add_argument("--source", help="源目录，指定时从源目录重新复制不一致的文件")
+    audit_parser.add_argument("--workers", type=int, default=DEFAULT_VERIFY_WORKERS, help="计算哈希的进程数")
+    audit_parser.set_defaults(handler=command_audit)
+
+    store_report_parser = subparsers.add_parser("store-report", parents=[common], help="统计共享存储节省的空间")
+    store_report_parser.add_argument("--store", help="共享存储目录（默认在缓存目录中）")
+    store_report_parser.set_defaults(handler=command_store_report)
+
+    store_gc_parser = subparsers.add_parser("store-gc", parents=[common], help="清理共享存储中不再使用的文件")
+    store_gc_parser.add_argument("--store", help="共享存储目录（默认在缓存目录中）")
+    store_gc_parser.set_defaults(handler=command_store_gc)
+
+    history_parser = subparsers.add_parser("history", parents=[common], help="列出以前运行的耗时和吞吐量")
+    history_parser.add_argument("--name", help="只列出这个任务名称的运行，例如 \"copy Mods\"")
+    history_parser.add_argument("--limit", type=int, default=20, help="最多列出最近的多少次运行")
+    history_parser.set_defaults(handler=command_history)
+
+    serve_parser = subparsers.add_parser("serve", help="启动同步服务端，供“客户端一键同步mods”下载目标目录中的Mods")
+    serve_parser.add_argument("destination", help="提供下载的目标目录")
+    serve_parser.add_argument("--host", default="0.0.0.0", help="监听地址")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="监听端口")
+    serve_parser.set_defaults(handler=command_serve, json=False)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        exit_code, result = args.handler(args)
+    except CommandError as e:
+        exit_code, result = EXIT_USAGE, {"ok": False, "error": str(e)}
+        log(f"错误：{e}")
+    except OSError as e:
+        exit_code, result = EXIT_ERROR, {"ok": False, "error": str(e)}
+        log(f"错误：{e}")
+    except KeyboardInterrupt:
+        exit_code, result = EXIT_CANCELLED, {"ok": False, "state": JOB_CANCELLED}
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    return exit_code
+
+
+if __name__ == "__main__":
+    # 校验使用进程池，打包为exe后需要
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,426 @@
+import os
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mods_hash import hash_file
+from mods_jobs import JobCancelled
+
+# 并发复制的默认设置
+DEFAULT_COPY_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+DEFAULT_MAX_BYTES_IN_FLIGHT = 256 * 1024 * 1024
+DEFAULT_MAX_OPEN_FILES = 64
+
+# 分块复制时每块的大小，每复制一块报告一次进度
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# 比较修改时间时允许的误差（秒），FAT/exFAT文件系统的时间精度只有2秒
+MTIME_TOLERANCE = 2.0
+
+# 增量同步时新文件先写入同一文件夹中带这个后缀的临时文件，写完后再替换目标文件
+# （以mods_journal.INTERNAL_PREFIX开头，中断后留下的临时文件在下次同步时作为多余文件删除）
+PARTIAL_SUFFIX = ".zde_partial"
+
+
+def format_size(size):
+    """
+    把字节数格式化为便于阅读的字符串
+    :param size: 字节数
+    :return: 例如 '1.5 MB'
+    """
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} {unit}"
+        size /= 1024
+
+
+def format_duration(seconds):
+    """
+    把秒数格式化为 时:分:秒
+    :param seconds: 秒数，为None时返回 '--:--'
+    :return: 例如 '01:05' 或 '1:02:03'
+    """
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def get_tree_size(path):
+    """
+    计算文件夹的总大小（使用os.scandir，不需要额外的stat调用）
+    :param path: 文件夹路径
+    :return: (总字节数, 文件数)
+    """
+    total = 0
+    count = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                sub_total, sub_count = get_tree_size(entry.path)
+                total += sub_total
+                count += sub_count
+            else:
+                total += entry.stat().st_size
+                count += 1
+    return total, count
+
+
+def copy_file_with_progress(job, src, dst, chunk_size=COPY_CHUNK_SIZE):
+    """
+    分块复制单个文件，每复制一块都报告字节进度并经过任务检查点，完成后复制文件元数据（与shutil.copy2相同）
+    :param job: 当前任务
+    :param src: 源文件路径
+    :param dst: 目标文件路径
+    :param chunk_size: 每块的字节数
+    :return: 目标文件路径
+    """
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(src, 'rb') as source_file, open(dst, 'wb') as destination_file:
+        while True:
+            length = source_file.readinto(buffer)
+            if not length:
+                break
+            destination_file.write(view[:length])
+            job.advance(length)
+            job.checkpoint()
+    shutil.copystat(src, dst)
+    job.advance(0, files=1)
+    return dst
+
+
+def progress_copy_function(job):
+    """
+    :param job: 当前任务
+    :return: 报告字节进度的复制函数，签名为 copy_function(src, dst)，可用于shutil.copytree
+    """
+    return lambda src, dst: copy_file_with_progress(job, src, dst)
+
+
+def replace_file_function(copy_function):
+    """
+    包装复制函数：先复制到目标文件旁边的临时文件，完成后用os.replace替换目标文件。
+    增量同步直接写入正在使用的目标Mod，中断时目标文件要么是旧版本要么是新版本，不会只写了一半或被删除。
+    :param copy_function: 复制单个文件的函数，签名为 copy_function(src, dst)
+    :return: 签名相同的复制函数
+    """
+    def copy(src, dst):
+        temp_path = dst + PARTIAL_SUFFIX
+        try:
+            copy_function(src, temp_path)
+            os.replace(temp_path, dst)
+        except BaseException:
+            _remove_missing_ok(temp_path)
+            raise
+        return dst
+    return copy
+
+
+def _remove_missing_ok(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class CopyLimiter:
+    """
+    并发复制的准入控制：同时复制的文件总字节数和打开的文件句柄数都不超过上限。
+    单个文件超过字节上限时，等到没有其他文件在复制时单独放行，避免死锁。
+    """
+
+    def __init__(self, max_bytes_in_flight=DEFAULT_MAX_BYTES_IN_FLIGHT, max_open_files=DEFAULT_MAX_OPEN_FILES):
+        self.max_bytes_in_flight = max_bytes_in_flight
+        self.max_open_files = max_open_files
+        self.bytes_in_flight = 0
+        self.open_files = 0
+        self._condition = threading.Condition()
+
+    def _can_admit(self, size, handles):
+        if self.open_files == 0:
+            return True
+        return (self.bytes_in_flight + size <= self.max_bytes_in_flight
+                and self.open_files + handles <= self.max_open_files)
+
+    def acquire(self, size, handles=2, timeout=None):
+        """
+        申请复制一个文件的额度
+        :param size: 文件大小（字节）
+        :param handles: 复制时占用的文件句柄数（源和目标各一个）
+        :param timeout: 超时时间（秒），None表示一直等待
+        :return: 是否申请成功
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._can_admit(size, handles), timeout):
+                return False
+            self.bytes_in_flight += size
+            self.open_files += handles
+            return True
+
+    def release(self, size, handles=2):
+        """
+        归还复制一个文件的额度
+        :param size: 文件大小（字节）
+        :param handles: 复制时占用的文件句柄数
+        """
+        with self._condition:
+            self.bytes_in_flight -= size
+            self.open_files -= handles
+            self._condition.notify_all()
+
+
+def iter_tree_files(source_path, destination_path):
+    """
+    遍历源文件夹（使用os.scandir），按遍历顺序在目标位置创建子文件夹，并逐个返回需要复制的文件
+    :param source_path: 源文件夹
+    :param destination_path: 目标文件夹
+    :return: 生成 (源文件路径, 目标文件路径, 文件大小)
+    """
+    os.makedirs(destination_path, exist_ok=True)
+    with os.scandir(source_path) as entries:
+        entries = list(entries)
+    for entry in entries:
+        target = os.path.join(destination_path, entry.name)
+        if entry.is_dir():
+            yield from iter_tree_files(entry.path, target)
+        else:
+            yield entry.path, target, entry.stat().st_size
+
+
+def new_delta_stats():
+    """
+    :return: 增量同步的统计信息
+    """
+    return {"copied_files": 0, "copied_bytes": 0, "skipped_files": 0, "skipped_bytes": 0, "deleted_files": 0}
+
+
+def _scan_tree(path, prefix=""):
+    """
+    递归扫描文件夹
+    :param path: 文件夹路径
+    :param prefix: 相对路径前缀
+    :return: ({相对路径: os.stat_result}, {相对文件夹路径})
+    """
+    files = {}
+    dirs = set()
+    with os.scandir(path) as entries:
+        for entry in entries:
+            rel_path = prefix + entry.name
+            if entry.is_dir():
+                dirs.add(rel_path)
+                sub_files, sub_dirs = _scan_tree(entry.path, rel_path + os.sep)
+                files.update(sub_files)
+                dirs.update(sub_dirs)
+            else:
+                files[rel_path] = entry.stat()
+    return files, dirs
+
+
+def is_same_file(source_stat, destination_stat, source_file=None, destination_file=None, use_hash=False):
+    """
+    判断目标文件是否与源文件相同
+    :param source_stat: 源文件的stat
+    :param destination_stat: 目标文件的stat
+    :param source_file: 源文件路径（use_hash为True时需要）
+    :param destination_file: 目标文件路径（use_hash为True时需要）
+    :param use_hash: 是否比较内容哈希，为False时只比较大小和修改时间
+    :return: 是否相同
+    """
+    if source_stat.st_size != destination_stat.st_size:
+        return False
+    if use_hash:
+        return hash_file(source_file) == hash_file(destination_file)
+    return abs(source_stat.st_mtime - destination_stat.st_mtime) <= MTIME_TOLERANCE
+
+
+def iter_delta_files(source_path, destination_path, stats, use_hash=False, job=None):
+    """
+    比较源文件夹和目标文件夹：删除目标中多余的文件，创建缺少的子文件夹，
+    并逐个返回新增或有变化、需要复制的文件。未变化的文件计入stats中的跳过字节数。
+    :param source_path: 源文件夹
+    :param destination_path: 目标文件夹
+    :param stats: 统计信息字典（见new_delta_stats），会被更新
+    :param use_hash: 大小相同时是否比较内容哈希
+    :param job: 当前任务（可选），跳过的文件计入任务的已完成字节数
+    :return: 生成 (源文件路径, 目标文件路径, 文件大小)
+    """
+    source_files, source_dirs = _scan_tree(source_path)
+    if os.path.isdir(destination_path):
+        destination_files, destination_dirs = _scan_tree(destination_path)
+    else:
+        destination_files, destination_dirs = {}, set()
+
+    stale_files = destination_files.keys() - source_files.keys()
+    stale_dirs = destination_dirs - source_dirs
+    # 与源中的文件夹或文件同名的多余条目需要先删除，否则无法创建；其余的在复制完新文件之后再删除，
+    # 中断时目标Mod中只会多出旧文件，不会缺少文件
+    for rel_path in stale_files & source_dirs:
+        os.remove(os.path.join(destination_path, rel_path))
+    for rel_path in sorted(stale_dirs & source_files.keys(), reverse=True):
+        shutil.rmtree(os.path.join(destination_path, rel_path), ignore_errors=True)
+
+    os.makedirs(destination_path, exist_ok=True)
+    for rel_path in sorted(source_dirs - destination_dirs):
+        os.makedirs(os.path.join(destination_path, rel_path), exist_ok=True)
+
+    for rel_path, source_stat in source_files.items():
+        source_file = os.path.join(source_path, rel_path)
+        destination_file = os.path.join(destination_path, rel_path)
+        destination_stat = destination_files.get(rel_path)
+        if destination_stat is not None and is_same_file(source_stat, destination_stat,
+                                                         source_file, destination_file, use_hash):
+            stats["skipped_files"] += 1
+            stats["skipped_bytes"] += source_stat.st_size
+            if job:
+                job.advance(source_stat.st_size, files=1)
+            continue
+        stats["copied_files"] += 1
+        stats["copied_bytes"] += source_stat.st_size
+        yield source_file, destination_file, source_stat.st_size
+
+    # 删除源中已经不存在的文件和文件夹
+    for rel_path in stale_files:
+        _remove_missing_ok(os.path.join(destination_path, rel_path))
+        stats["deleted_files"] += 1
+    for rel_path in sorted(stale_dirs, reverse=True):
+        shutil.rmtree(os.path.join(destination_path, rel_path), ignore_errors=True)
+
+
+def sync_mod_tree(job, source_path, destination_path, use_hash=False, copy_function=None):
+    """
+    增量同步一个Mod文件夹：只复制新增或有变化的文件（先写入临时文件再替换），只删除源中已经不存在的文件
+    :param job: 当前任务
+    :param source_path: 源Mod文件夹
+    :param destination_path: 目标Mod文件夹
+    :param use_hash: 大小相同时是否比较内容哈希
+    :param copy_function: 复制单个文件的函数，为None时使用报告字节进度的分块复制
+    :return: 统计信息字典（见new_delta_stats）
+    """
+    copy_function = replace_file_function(copy_function or progress_copy_function(job))
+    stats = new_delta_stats()
+    for src, dst, size in iter_delta_files(source_path, destination_path, stats, use_hash, job):
+        job.checkpoint()
+        copy_function(src, dst)
+    return stats
+
+
+def copy_mods_parallel(job, transfers, on_mod_done=None, workers=DEFAULT_COPY_WORKERS,
+                       max_bytes_in_flight=DEFAULT_MAX_BYTES_IN_FLIGHT, max_open_files=DEFAULT_MAX_OPEN_FILES,
+                       copy_function=None, file_iterator=iter_tree_files, cleanup_incomplete=True):
+    """
+    在线程池中并发复制多个Mod，不同Mod的文件以及大Mod内部的文件会同时复制。
+    由CopyLimiter按在途字节数和文件句柄数控制准入，而不仅仅是线程数。
+    :param job: 当前任务
+    :param transfers: 需要复制的列表 [(mod名称, 源Mod文件夹, 目标Mod文件夹), ...]，使用默认file_iterator时目标文件夹必须不存在或为空
+    :param on_mod_done: 某个Mod的全部文件复制完成后调用的回调函数，参数为mod名称
+                        （在调用本函数的线程中调用，回调抛出的异常会让整个复制失败）
+    :param workers: 线程数
+    :param max_bytes_in_flight: 同时复制的最大字节数
+    :param max_open_files: 同时打开的最大文件句柄数
+    :param copy_function: 复制单个文件的函数，签名为 copy_function(src, dst)，为None时使用报告字节进度的分块复制
+    :param file_iterator: 生成需要复制的文件的函数，签名为 file_iterator(源Mod文件夹, 目标Mod文件夹)
+    :param cleanup_incomplete: 取消或出错时是否删除没有复制完成的目标Mod文件夹（增量同步时应为False）
+    :return: 已完成的mod名称列表
+    """
+    copy_function = copy_function or progress_copy_function(job)
+    limiter = CopyLimiter(max_bytes_in_flight, max_open_files)
+    lock = threading.Lock()
+    remaining = {}
+    scanned = set()
+    completed = []
+    errors = []
+    # 有文件复制失败或没有复制（出错或取消后跳过）的Mods，不能当作已完成
+    failed = set()
+    # 全部文件都已处理的Mods由工作线程放入队列，在提交任务的线程中调用on_mod_done
+    finished = queue.Queue()
+    handled = set()
+    # 每个Mod开始复制的时间，用于记录逐个Mod的耗时（不同Mod的文件在多个线程中复制，记录为异步区间）
+    started = {}
+
+    def finish_file(mod):
+        with lock:
+            remaining[mod] -= 1
+            done = remaining[mod] == 0 and mod in scanned
+        if done:
+            finished.put(mod)
+
+    def mark_done(mod):
+        handled.add(mod)
+        with lock:
+            if mod in failed:
+                return
+        try:
+            job.tracer.add_span("copy_mod", started[mod], time.perf_counter(), {"mod": mod}, async_id=mod)
+            if on_mod_done:
+                on_mod_done(mod)
+        except Exception as e:
+            errors.append(e)
+            return
+        completed.append(mod)
+
+    def drain(wait=False):
+        # wait为True时一直等到所有已扫描的Mods都处理完
+        while len(handled) < len(scanned):
+            try:
+                mod = finished.get(block=wait)
+            except queue.Empty:
+                return
+            mark_done(mod)
+
+    def copy_one(mod, src, dst, size):
+        try:
+            if errors or job.cancelled:
+                with lock:
+                    failed.add(mod)
+            else:
+                copy_function(src, dst)
+        except Exception as e:
+            with lock:
+                failed.add(mod)
+            errors.append(e)
+        finally:
+            limiter.release(size)
+            finish_file(mod)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="mods-copy")
+    try:
+        for mod, source_path, destination_path in transfers:
+            with lock:
+                remaining[mod] = 0
+            started[mod] = time.perf_counter()
+            for src, dst, size in file_iterator(source_path, destination_path):
+                job.checkpoint()
+                if errors:
+                    raise errors[0]
+                limiter.acquire(size)
+                with lock:
+                    remaining[mod] += 1
+                pool.submit(copy_one, mod, src, dst, size)
+                drain()
+            with lock:
+                scanned.add(mod)
+                done = remaining[mod] == 0
+            if done:
+                finished.put(mod)
+            drain()
+        drain(wait=True)
+    finally:
+        pool.shutdown(wait=True)
+        # 提前结束时处理已经复制完成的Mods
+        drain()
+        if cleanup_incomplete and (errors or job.cancelled):
+            # 清理没有复制完成的Mod
+            for mod, source_path, destination_path in transfers:
+                if mod in remaining and mod not in completed:
+                    shutil.rmtree(destination_path, ignore_errors=True)
+    if errors:
+        raise errors[0]
+    if job.cancelled:
+        raise JobCancelled(job.name)
+    return completed
@@ -0,0 +1,228 @@
+import os
+import sys
+import errno
+import shutil
+import threading
+
+from mods_copy import COPY_CHUNK_SIZE, copy_file_with_progress
+from mods_journal import INTERNAL_PREFIX
+
+# 部署方式
+DEPLOY_COPY = "copy"            # 普通的分块复制
+DEPLOY_AUTO = "auto"            # reflink -> 硬链接 -> copy_file_range/sendfile -> 普通复制
+DEPLOY_NO_HARDLINK = "nolink"   # reflink -> copy_file_range/sendfile -> 普通复制（目标文件与源文件互不影响）
+DEPLOY_STORE = "store"          # 内容寻址共享存储，相同文件只保存一份（见mods_store）
+DEPLOY_MODES = {
+    DEPLOY_COPY: "普通复制",
+    DEPLOY_AUTO: "自动（reflink → 硬链接 → 内核复制 → 普通复制）",
+    DEPLOY_NO_HARDLINK: "自动，不使用硬链接",
+    DEPLOY_STORE: "共享存储（相同文件只保存一份）",
+}
+
+# 单个文件使用的部署方法
+METHOD_REFLINK = "reflink"
+METHOD_HARDLINK = "硬链接"
+METHOD_KERNEL_COPY = "内核复制"
+METHOD_BUFFERED = "普通复制"
+
+# Linux的FICLONE ioctl（btrfs、xfs等支持写时复制的文件系统）
+FICLONE = 0x40049409
+# 内核复制时每次调用复制的字节数，复制完一块报告一次进度
+KERNEL_COPY_CHUNK_SIZE = 8 * COPY_CHUNK_SIZE
+
+# 检查能否使用reflink或硬链接时在目标目录中临时创建的文件
+PROBE_FILE_NAME = INTERNAL_PREFIX + "deploy_probe"
+
+# 出现这些错误说明当前文件系统组合不支持该方法，之后不再尝试
+UNSUPPORTED_ERRNOS = {
+    errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.ENOTTY, errno.EPERM, errno.EMLINK,
+    getattr(errno, "EOPNOTSUPP", errno.EINVAL), getattr(errno, "ENOTSUP", errno.EINVAL),
+}
+
+
+def _remove_if_exists(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _reflink_linux(src, dst):
+    import fcntl
+    with open(src, 'rb') as source_file, open(dst, 'wb') as destination_file:
+        fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+
+
+def _reflink_darwin(src, dst):
+    import ctypes
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error), dst)
+
+
+if sys.platform.startswith("linux"):
+    reflink_file = _reflink_linux
+elif sys.platform == "darwin":
+    reflink_file = _reflink_darwin
+else:
+    reflink_file = None
+
+
+def kernel_copy_file(job, src, dst):
+    """
+    使用copy_file_range（不支持时用sendfile）在内核中复制文件，数据不经过Python进程
+    :param job: 当前任务
+    :param src: 源文件路径
+    :param dst: 目标文件路径
+    """
+    copy_range = getattr(os, "copy_file_range", None)
+    with open(src, 'rb') as source_file, open(dst, 'wb') as destination_file:
+        source_fd = source_file.fileno()
+        destination_fd = destination_file.fileno()
+        offset = 0
+        try:
+            while True:
+                if copy_range:
+                    try:
+                        copied = copy_range(source_fd, destination_fd, KERNEL_COPY_CHUNK_SIZE)
+                    except OSError as e:
+                        # 较旧的内核不支持跨文件系统的copy_file_range，改用sendfile
+                        if offset == 0 and e.errno in (errno.EXDEV, errno.ENOSYS, errno.EINVAL):
+                            copy_range = None
+                            continue
+                        raise
+                else:
+                    copied = os.sendfile(destination_fd, source_fd, offset, KERNEL_COPY_CHUNK_SIZE)
+                if not copied:
+                    break
+                offset += copied
+                job.advance(copied)
+                job.checkpoint()
+        except OSError:
+            # 失败后会改用其他方法重新复制，撤销已经报告的进度
+            job.advance(-offset)
+            raise
+
+
+def probe_space_free_method(source_file, destination_directory, mode=DEPLOY_AUTO):
+    """
+    用一个真实的源文件试验能否在源文件和目标目录之间使用reflink或硬链接（不占用额外磁盘空间的部署方法）。
+    同一个磁盘上也可能不支持（例如FAT/exFAT没有硬链接、只有部分文件系统支持reflink、
+    fs.protected_hardlinks禁止链接其他用户的文件），这时FileDeployer会改用复制。
+    :param source_file: 源文件路径
+    :param destination_directory: 目标目录
+    :param mode: 部署方式，DEPLOY_AUTO时允许硬链接，DEPLOY_NO_HARDLINK时只试验reflink
+    :return: 可用的方法（METHOD_REFLINK或METHOD_HARDLINK），都不可用时返回None
+    """
+    methods = []
+    if reflink_file and mode in (DEPLOY_AUTO, DEPLOY_NO_HARDLINK):
+        methods.append(METHOD_REFLINK)
+    if mode == DEPLOY_AUTO:
+        methods.append(METHOD_HARDLINK)
+    probe_path = os.path.join(destination_directory, PROBE_FILE_NAME)
+    for method in methods:
+        try:
+            _remove_if_exists(probe_path)
+            if method == METHOD_REFLINK:
+                reflink_file(source_file, probe_path)
+            else:
+                os.link(source_file, probe_path)
+            return method
+        except OSError:
+            continue
+        finally:
+            try:
+                _remove_if_exists(probe_path)
+            except OSError:
+                pass
+    return None
+
+
+class FileDeployer:
+    """
+    为每个文件选择最快的部署方法：依次尝试reflink、硬链接、copy_file_range/sendfile，最后使用普通复制。
+    某个方法在一对文件系统之间失败后会被记住，之后的文件不再尝试。
+    可以直接作为copy_function使用，签名为 deployer(src, dst)。
+    linked_sources记录使用reflink或硬链接部署的源文件：目标文件与源文件共享数据，复制后的校验可以跳过它们。
+    """
+
+    def __init__(self, job, mode=DEPLOY_AUTO):
+        self.job = job
+        self.mode = mode
+        self.counts = {}
+        self.linked_sources = set()
+        self._disabled = set()
+        self._lock = threading.Lock()
+
+    def _methods(self):
+        if self.mode == DEPLOY_COPY:
+            return [METHOD_BUFFERED]
+        methods = []
+        if reflink_file:
+            methods.append(METHOD_REFLINK)
+        if self.mode == DEPLOY_AUTO:
+            methods.append(METHOD_HARDLINK)
+        if hasattr(os, "copy_file_range") or hasattr(os, "sendfile"):
+            methods.append(METHOD_KERNEL_COPY)
+        methods.append(METHOD_BUFFERED)
+        return methods
+
+    def _record(self, method, src):
+        with self._lock:
+            self.counts[method] = self.counts.get(method, 0) + 1
+            if method in (METHOD_REFLINK, METHOD_HARDLINK):
+                self.linked_sources.add(src)
+
+    def _try(self, method, src, dst, size):
+        if method == METHOD_REFLINK:
+            reflink_file(src, dst)
+            shutil.copystat(src, dst)
+            self.job.advance(size, files=1)
+        elif method == METHOD_HARDLINK:
+            # 硬链接与源文件共享数据和元数据，不能再调用copystat
+            os.link(src, dst)
+            self.job.advance(size, files=1)
+        elif method == METHOD_KERNEL_COPY:
+            kernel_copy_file(self.job, src, dst)
+            shutil.copystat(src, dst)
+            self.job.advance(0, files=1)
+        else:
+            copy_file_with_progress(self.job, src, dst)
+
+    def __call__(self, src, dst):
+        source_stat = os.stat(src)
+        try:
+            destination_device = os.stat(os.path.dirname(dst)).st_dev
+        except OSError:
+            destination_device = None
+        # 目标文件可能是指向旧版本的硬链接，先删除，避免写入共享的数据
+        _remove_if_exists(dst)
+        for method in self._methods():
+            key = (method, source_stat.st_dev, destination_device)
+            if key in self._disabled:
+                continue
+            try:
+                self._try(method, src, dst, source_stat.st_size)
+            except OSError as e:
+                if method == METHOD_BUFFERED or e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                with self._lock:
+                    self._disabled.add(key)
+                _remove_if_exists(dst)
+                continue
+            self._record(method, src)
+            return dst
+        return dst
+
+    def close(self):
+        """
+        部署结束（FileDeployer没有需要保存的状态）
+        """
+
+    def describe(self):
+        """
+        :return: 各部署方法使用次数的描述，例如 'reflink 120 个文件，普通复制 3 个文件'
+        """
+        with self._lock:
+            return "，".join(f"{method} {count} 个文件" for method, count in self.counts.items()) or "没有复制文件"
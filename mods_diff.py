@@ -0,0 +1,194 @@
+"""
+清单比较：按Mod名称、创意工坊ID和内容哈希比较本地清单与一个或多个参考清单，
+并生成可以直接交给复制流程执行的同步计划。所有比较都基于字典查找，时间与清单条目数成线性关系。
+"""
+
+from mods_copy import format_size
+
+# 同步计划格式版本
+SYNC_PLAN_VERSION = 1
+
+
+def diff_manifests(local_manifest, reference_manifests):
+    """
+    比较本地清单和参考清单（例如服务器或其他玩家的mods_info.json）
+    多个参考清单中的同一个Mod以修改时间最新的记录为准。
+    :param local_manifest: 本地清单（版本2结构，见mods_manifest.load_manifest）
+    :param reference_manifests: 参考清单列表
+    :return: {"missing": {mod: 创意工坊ID},         参考清单中有、本地没有
+              "extra": {mod: 创意工坊ID},           本地有、所有参考清单中都没有
+              "outdated": {mod: 创意工坊ID},        两边都有但内容哈希不同
+              "id_conflicts": {mod: [创意工坊ID, ...]}}  同名Mod对应不同的创意工坊ID，无法自动处理
+    """
+    # Mod名称 -> (创意工坊ID, 详细信息)
+    wanted = {}
+    conflicts = {}
+    for manifest in reference_manifests:
+        details = manifest.get("details", {})
+        for mod, workshop_id in manifest["mods"].items():
+            mod_details = details.get(mod)
+            current = wanted.get(mod)
+            if current is None:
+                wanted[mod] = (workshop_id, mod_details)
+                continue
+            current_id, current_details = current
+            if workshop_id and current_id and workshop_id != current_id:
+                conflicts.setdefault(mod, {current_id}).add(workshop_id)
+            if mod_details and (not current_details or mod_details["mtime"] > current_details["mtime"]):
+                wanted[mod] = (workshop_id or current_id, mod_details)
+
+    local_mods = local_manifest["mods"]
+    local_details = local_manifest.get("details", {})
+    missing = {}
+    outdated = {}
+    for mod, (workshop_id, mod_details) in wanted.items():
+        if mod in conflicts:
+            continue
+        local_id = local_mods.get(mod)
+        if local_id is None:
+            missing[mod] = workshop_id
+        elif workshop_id and local_id and workshop_id != local_id:
+            conflicts[mod] = {workshop_id, local_id}
+        elif mod_details and mod in local_details and mod_details["hash"] != local_details[mod]["hash"]:
+            outdated[mod] = workshop_id or local_id
+    extra = {mod: workshop_id for mod, workshop_id in local_mods.items() if mod not in wanted}
+    return {
+        "missing": missing,
+        "extra": extra,
+        "outdated": outdated,
+        "id_conflicts": {mod: sorted(workshop_ids) for mod, workshop_ids in conflicts.items()},
+    }
+
+
+def has_differences(diff):
+    """
+    :param diff: diff_manifests的返回值
+    :return: 是否有任何差异
+    """
+    return any(diff.values())
+
+
+def build_sync_plan(diff, id_map, source_directory, destination_directory, prune=False):
+    """
+    根据比较结果生成同步计划：缺少和内容不同的Mods从源目录复制到目标目录，多余的Mods（prune时）从目标目录删除。
+    源目录中找不到的Mods和创意工坊ID冲突的Mods不会自动处理，记录在"skipped"中。
+    :param diff: diff_manifests的返回值
+    :param id_map: 源目录的 mod名称 -> 创意工坊ID 映射
+    :param source_directory: 源目录（包含Mods文件夹的目录）
+    :param destination_directory: 目标目录
+    :param prune: 是否删除参考清单中没有的本地Mods
+    :return: 同步计划 {"version", "source_directory", "destination_directory",
+                       "copy": {mod: 创意工坊ID}, "delete": [mod, ...], "skipped": {mod: 原因}}
+    """
+    copy = {}
+    skipped = {}
+    for group in ("missing", "outdated"):
+        for mod, workshop_id in diff[group].items():
+            source_id = id_map.get(mod)
+            if source_id is None:
+                skipped[mod] = f"源目录中没有这个Mod（创意工坊ID：{workshop_id or '未知'}）"
+            elif workshop_id and source_id != workshop_id:
+                skipped[mod] = f"源目录中的创意工坊ID为 {source_id}，清单中为 {workshop_id}"
+            else:
+                copy[mod] = source_id
+    for mod, workshop_ids in diff["id_conflicts"].items():
+        skipped[mod] = f"创意工坊ID冲突：{'、'.join(workshop_ids)}"
+    return {
+        "version": SYNC_PLAN_VERSION,
+        "source_directory": source_directory,
+        "destination_directory": destination_directory,
+        "copy": copy,
+        "delete": sorted(diff["extra"]) if prune else [],
+        "skipped": skipped,
+    }
+
+
+def parse_id_list(text):
+    """
+    解析创意工坊ID列表（逗号、空白或换行分隔，与“导出创意工坊ID”的格式相同），保持原来的顺序并去掉重复的ID
+    :param text: 文本
+    :return: 创意工坊ID（或Mod名称）列表
+    """
+    return list(dict.fromkeys(token for token in text.replace(",", " ").split() if token))
+
+
+def build_id_plan(workshop_ids, items, id_map, source_directory, destination_directory, action='move'):
+    """
+    根据创意工坊ID列表生成同步计划（格式与build_sync_plan相同，可以交给run_sync_plan_job执行）。
+    列表中的每一项先按创意工坊ID在索引中查找，找不到时再按Mod名称查找（与旧版程序相同），都是字典查找。
+    :param workshop_ids: 创意工坊ID列表（也可以是Mod名称）
+    :param items: 源目录的索引信息 {创意工坊ID: {"mtime": ..., "mods": [...]}}
+    :param id_map: 源目录的 mod名称 -> 创意工坊ID 映射，多个请求的物品包含同名Mod时优先使用其中的选择
+    :param source_directory: 源目录
+    :param destination_directory: 目标目录
+    :param action: 'move' 或 'copy'
+    :return: 同步计划，另外包含 "action" 和 "missing"（源目录中找不到的创意工坊ID列表）
+    """
+    copy = {}
+    missing = []
+    for workshop_id in workshop_ids:
+        info = items.get(workshop_id)
+        if info is not None:
+            for mod in info["mods"]:
+                if mod not in copy or id_map.get(mod) == workshop_id:
+                    copy[mod] = workshop_id
+        elif workshop_id in id_map:
+            copy.setdefault(workshop_id, id_map[workshop_id])
+        else:
+            missing.append(workshop_id)
+    return {
+        "version": SYNC_PLAN_VERSION,
+        "action": action,
+        "source_directory": source_directory,
+        "destination_directory": destination_directory,
+        "copy": copy,
+        "delete": [],
+        "skipped": {},
+        "missing": missing,
+    }
+
+
+def describe_id_plan(plan, limit=None):
+    """
+    生成创意工坊ID计划的文本：需要处理的Mods、数据量和找不到的创意工坊ID
+    :param plan: build_id_plan的返回值（"size"和"files"由plan_mods_by_id_job填入）
+    :param limit: 最多列出的Mod数量，为None时全部列出
+    :return: 文本
+    """
+    action = "移动" if plan["action"] == 'move' else "复制"
+    lines = [f"将{action} {len(plan['copy'])} 个Mods" +
+             (f"，共 {format_size(plan['size'])}，{plan['files']} 个文件" if "size" in plan else "")]
+    mods = sorted(plan["copy"])
+    for mod in mods[:limit]:
+        lines.append(f"- {mod} (ID: {plan['copy'][mod]})")
+    if limit is not None and len(mods) > limit:
+        lines.append(f"  …… 还有 {len(mods) - limit} 个")
+    if plan["missing"]:
+        lines.append(f"源目录中找不到的创意工坊ID（{len(plan['missing'])}）：{', '.join(plan['missing'])}")
+    return "\n".join(lines)
+
+
+def describe_diff(diff, limit=None):
+    """
+    生成比较结果的文本（一次性拼接，界面只需要插入一次）
+    :param diff: diff_manifests的返回值
+    :param limit: 每组最多列出的Mod数量，为None时全部列出
+    :return: 文本
+    """
+    lines = []
+    for group, title in (("missing", "本地缺少的Mods"), ("extra", "远程缺少的Mods"),
+                         ("outdated", "版本不同的Mods"), ("id_conflicts", "创意工坊ID冲突的Mods")):
+        entries = diff[group]
+        if not entries:
+            continue
+        lines.append(f"{title}（{len(entries)}）:")
+        mods = sorted(entries)
+        for mod in mods[:limit]:
+            value = entries[mod]
+            lines.append(f"- {mod} (ID: {'、'.join(value) if isinstance(value, list) else value})")
+        if limit is not None and len(mods) > limit:
+            lines.append(f"  …… 还有 {len(mods) - limit} 个")
+        lines.append("")
+    if not lines:
+        return "两个设备上的Mods完全一致。"
+    return "\n".join(lines)
@@ -0,0 +1,136 @@
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from mods_cache import get_cache_directory, load_json, save_json
+from mods_trace import count
+
+# 分块读取大小
+HASH_CHUNK_SIZE = 1024 * 1024
+# 哈希算法名称，写入清单以便以后更换算法
+HASH_ALGORITHM = "blake2b-128"
+DEFAULT_HASH_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def hash_file(path, chunk_size=HASH_CHUNK_SIZE):
+    """
+    计算文件内容的BLAKE2b哈希（分块读取，不会把大文件整个读入内存）
+    :param path: 文件路径
+    :param chunk_size: 每次读取的字节数
+    :return: 十六进制哈希字符串
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class HashCache:
+    """
+    文件哈希缓存，以 (路径, 大小, 修改时间) 为键，保存在缓存目录中。
+    文件没有变化时直接返回缓存的哈希，不需要重新读取文件内容。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_cache_directory(), "hash_cache.json")
+        self._lock = threading.Lock()
+        self._entries = load_json(self.path, {}) if self.path else {}
+        if not isinstance(self._entries, dict) or self._entries.get("algorithm") != HASH_ALGORITHM:
+            self._entries = {"algorithm": HASH_ALGORITHM, "files": {}}
+        self._dirty = False
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def get(self, path, stat):
+        """
+        查找缓存的哈希
+        :param path: 文件路径
+        :param stat: 文件的os.stat_result
+        :return: 哈希字符串，缓存不存在或已过期时返回None
+        """
+        entry = self._entries["files"].get(self._key(path))
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        return None
+
+    def put(self, path, stat, digest):
+        """
+        保存文件的哈希
+        :param path: 文件路径
+        :param stat: 文件的os.stat_result
+        :param digest: 哈希字符串
+        """
+        with self._lock:
+            self._entries["files"][self._key(path)] = [stat.st_size, stat.st_mtime_ns, digest]
+            self._dirty = True
+
+    def hash(self, path, stat=None):
+        """
+        获取文件哈希，优先使用缓存
+        :param path: 文件路径
+        :param stat: 文件的os.stat_result，为None时自动获取
+        :return: 哈希字符串
+        """
+        if stat is None:
+            stat = os.stat(path)
+        digest = self.get(path, stat)
+        if digest is None:
+            digest = hash_file(path)
+            self.put(path, stat, digest)
+        return digest
+
+    def save(self):
+        """
+        保存缓存到磁盘（没有变化时不写入）
+        """
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            save_json(self.path, self._entries)
+            self._dirty = False
+
+
+def hash_files(files, cache=None, workers=DEFAULT_HASH_WORKERS, job=None):
+    """
+    在线程池中并发计算多个文件的哈希，已缓存且未变化的文件不会重新读取
+    :param files: [(文件路径, os.stat_result), ...]
+    :param cache: HashCache对象，为None时不使用缓存
+    :param workers: 线程数
+    :param job: 当前任务（可选），用于响应取消和报告进度
+    :return: {文件路径: 哈希字符串}
+    """
+    results = {}
+    pending = []
+    for path, stat in files:
+        digest = cache.get(path, stat) if cache else None
+        if digest is None:
+            pending.append((path, stat))
+        else:
+            results[path] = digest
+            if job:
+                job.advance(stat.st_size, files=1)
+
+    def hash_one(path, stat):
+        if job:
+            job.checkpoint()
+        digest = hash_file(path)
+        if cache:
+            cache.put(path, stat, digest)
+        if job:
+            job.advance(stat.st_size, files=1)
+        return path, digest
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="mods-hash") as pool:
+            for path, digest in pool.map(lambda item: hash_one(*item), pending):
+                results[path] = digest
+    count("hashed_files", len(pending))
+    count("hashed_bytes", sum(stat.st_size for _, stat in pending))
+    return results
@@ -0,0 +1,409 @@
+import os
+import sys
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from mods_cache import cache_file_path, get_cache_directory, load_json, save_json
+from mods_trace import get_current_tracer, set_current_tracer, span
+
+# 索引文件格式版本，格式变化时递增以丢弃旧缓存
+INDEX_VERSION = 1
+# 流式扫描时每批返回的Mod数量
+MOD_BATCH_SIZE = 200
+# 并发扫描创意工坊物品的线程数
+DEFAULT_SCAN_WORKERS = 4
+# 多个源目录（例如多个Steam库的workshop/content/108600）之间的分隔符，与PATH环境变量相同（Windows上为";"）
+SOURCE_SEPARATOR = os.pathsep
+
+# 多个创意工坊物品包含同名Mod时的选择规则
+CONFLICT_NEWEST = "newest"
+CONFLICT_LIBRARY_ORDER = "library"
+CONFLICT_HIGHEST_ID = "highest_id"
+CONFLICT_RULES = {
+    CONFLICT_NEWEST: "使用修改时间最新的物品",
+    CONFLICT_LIBRARY_ORDER: "使用排在前面的源目录中的物品",
+    CONFLICT_HIGHEST_ID: "使用创意工坊ID最大的物品",
+}
+DEFAULT_CONFLICT_RULE = CONFLICT_NEWEST
+# 选择规则和固定选择的Mods保存在缓存目录中
+CONFLICT_SETTINGS_FILE_NAME = "conflict_settings.json"
+
+
+def get_mtime(path):
+    """
+    :param path: 路径
+    :return: 修改时间（纳秒），不存在时返回None
+    """
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def scan_workshop_item(item_path):
+    """
+    扫描单个创意工坊物品的mods文件夹
+    :param item_path: 创意工坊物品目录
+    :return: (mods文件夹的修改时间, mod名称列表)，没有mods文件夹时返回 (None, [])
+    """
+    mod_folder_path = os.path.join(item_path, "mods")
+    mtime = get_mtime(mod_folder_path)
+    if mtime is None:
+        return None, []
+    mods = []
+    try:
+        with os.scandir(mod_folder_path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    mods.append(entry.name)
+    except OSError:
+        return None, []
+    return mtime, sorted(mods)
+
+
+def split_source_directories(source_directory):
+    """
+    :param source_directory: 源目录，多个源目录用SOURCE_SEPARATOR分隔
+    :return: 源目录列表（绝对路径，按原来的顺序）
+    """
+    return [os.path.abspath(path.strip()) for path in source_directory.split(SOURCE_SEPARATOR) if path.strip()]
+
+
+def source_directories_exist(source_directory):
+    """
+    :return: 所有源目录是否都存在（至少有一个）
+    """
+    directories = split_source_directories(source_directory)
+    return bool(directories) and all(os.path.isdir(directory) for directory in directories)
+
+
+def get_item_directory(source_directory, workshop_id, rule=None):
+    """
+    获取创意工坊物品所在的文件夹。多个源目录中都有这个物品时按选择规则选择其中一个（与scan_libraries相同，见choose_library_copy）
+    :param source_directory: 源目录，多个源目录用SOURCE_SEPARATOR分隔
+    :param workshop_id: 创意工坊ID
+    :param rule: 选择规则，为None时使用保存的选择设置
+    :return: 创意工坊物品文件夹
+    """
+    directories = split_source_directories(source_directory)
+    if len(directories) == 1:
+        return os.path.join(directories[0], workshop_id)
+    copies = []
+    for library, directory in enumerate(directories):
+        item_path = os.path.join(directory, workshop_id)
+        mtime = get_mtime(os.path.join(item_path, "mods"))
+        if mtime is not None:
+            copies.append({"mtime": mtime, "library": library, "path": item_path})
+    if not copies:
+        return os.path.join(directories[0], workshop_id)
+    if len(copies) > 1 and rule is None:
+        rule = load_conflict_settings()["rule"]
+    return choose_library_copy(copies, rule)["path"]
+
+
+def get_mod_path(source_directory, workshop_id, mod):
+    """
+    :param source_directory: 源目录，多个源目录用SOURCE_SEPARATOR分隔
+    :param workshop_id: 创意工坊ID
+    :param mod: Mod名称
+    :return: 源Mod文件夹
+    """
+    return os.path.join(get_item_directory(source_directory, workshop_id), "mods", mod)
+
+
+def load_conflict_settings():
+    """
+    :return: 同名Mod的选择设置 {"rule": 选择规则, "pins": {mod名称: 固定使用的创意工坊ID}}
+    """
+    settings = load_json(os.path.join(get_cache_directory(), CONFLICT_SETTINGS_FILE_NAME)) or {}
+    rule = settings.get("rule")
+    return {"rule": rule if rule in CONFLICT_RULES else DEFAULT_CONFLICT_RULE, "pins": settings.get("pins") or {}}
+
+
+def save_conflict_settings(settings):
+    """
+    :param settings: 同名Mod的选择设置（见load_conflict_settings）
+    """
+    save_json(os.path.join(get_cache_directory(), CONFLICT_SETTINGS_FILE_NAME), settings, indent=2)
+
+
+def choose_workshop_item(mod, candidates, items, rule=DEFAULT_CONFLICT_RULE, pins=None):
+    """
+    多个创意工坊物品包含同名Mod时选择其中一个
+    :param mod: Mod名称
+    :param candidates: 包含这个Mod的创意工坊ID集合
+    :param items: 索引中的物品信息（提供修改时间和所在的源目录序号）
+    :param rule: 选择规则（CONFLICT_RULES中的一个）
+    :param pins: 固定选择 {mod名称: 创意工坊ID}，固定的物品仍然包含这个Mod时优先使用
+    :return: 选中的创意工坊ID
+    """
+    pinned = pins.get(mod) if pins else None
+    if pinned in candidates:
+        return pinned
+    if rule == CONFLICT_HIGHEST_ID:
+        return max(candidates)
+    if rule == CONFLICT_LIBRARY_ORDER:
+        return min(candidates, key=lambda item: (items[item].get("library", 0), -items[item]["mtime"], item))
+    return max(candidates, key=lambda item: (items[item]["mtime"], item))
+
+
+def choose_library_copy(copies, rule=DEFAULT_CONFLICT_RULE):
+    """
+    同一个创意工坊物品出现在多个源目录中时选择其中一个，与choose_workshop_item使用相同的选择规则：
+    CONFLICT_LIBRARY_ORDER时使用排在前面的源目录，其他规则使用mods文件夹修改时间最新的一个（修改时间相同时使用排在前面的源目录）。
+    固定选择针对的是创意工坊ID，同一个物品的多个副本之间不受影响。
+    :param copies: 物品信息列表，每个都包含 "mtime" 和 "library"（源目录序号）
+    :param rule: 选择规则（CONFLICT_RULES中的一个）
+    :return: 选中的物品信息
+    """
+    if rule == CONFLICT_LIBRARY_ORDER:
+        return min(copies, key=lambda info: (info["library"], -info["mtime"]))
+    return max(copies, key=lambda info: (info["mtime"], -info["library"]))
+
+
+def build_id_map(items, rule=DEFAULT_CONFLICT_RULE, pins=None, conflicts=None):
+    """
+    根据索引中的物品信息生成 mod名称 -> 创意工坊ID 的映射
+    :param items: 索引中的物品信息 {创意工坊ID: {"mtime": ..., "mods": [...]}}
+    :param rule: 多个物品包含同名Mod时的选择规则
+    :param pins: 固定选择 {mod名称: 创意工坊ID}
+    :param conflicts: 可选的字典，填入同名Mod的冲突 {mod名称: {"chosen": 创意工坊ID, "candidates": [创意工坊ID, ...],
+                      "pinned": 是否是固定的选择}}
+    :return: mod名称 -> 创意工坊ID 的字典
+    """
+    candidates = {}
+    for item in sorted(items):
+        for mod in items[item]["mods"]:
+            candidates.setdefault(mod, []).append(item)
+    id_map = {}
+    for mod, mod_items in candidates.items():
+        if len(mod_items) == 1:
+            id_map[mod] = mod_items[0]
+            continue
+        chosen = choose_workshop_item(mod, mod_items, items, rule, pins)
+        id_map[mod] = chosen
+        if conflicts is not None:
+            conflicts[mod] = {"chosen": chosen, "candidates": mod_items,
+                              "pinned": bool(pins) and pins.get(mod) == chosen}
+    return id_map
+
+
+def _check_workshop_item(item_path, item, cached_items):
+    """
+    检查单个创意工坊物品，mods文件夹的修改时间没有变化时直接使用缓存
+    :param item_path: 创意工坊物品目录
+    :param item: 创意工坊ID
+    :param cached_items: 缓存中的物品信息
+    :return: (创意工坊ID, 物品信息或None, 是否有变化)
+    """
+    mtime = get_mtime(os.path.join(item_path, "mods"))
+    if mtime is None:
+        return item, None, item in cached_items
+    cached_item = cached_items.get(item)
+    if cached_item and cached_item["mtime"] == mtime:
+        return item, cached_item, False
+    # 新增或有变化的物品，重新扫描
+    mtime, mods = scan_workshop_item(item_path)
+    if mtime is None:
+        return item, None, True
+    return item, {"mtime": mtime, "mods": mods}, True
+
+
+def scan_workshop_index(source_directory, use_cache=True, workers=DEFAULT_SCAN_WORKERS, index=None):
+    """
+    流式扫描源目录：逐个返回包含mods文件夹的创意工坊物品，扫描完成后更新磁盘上的索引缓存。
+    使用os.scandir的DirEntry类型信息，不需要对每个条目额外调用isdir/exists；
+    workers大于1时在线程池中并发扫描各个创意工坊物品（适合机械硬盘以外的磁盘和网络共享）。
+    :param source_directory: 源目录（包含Mods文件夹的目录）
+    :param use_cache: 是否使用磁盘缓存，为False时完整重建
+    :param workers: 并发扫描的线程数
+    :param index: 可选的字典，扫描完成后填入索引信息 {"version", "source_directory", "source_mtime", "items"}
+    :return: 生成 (创意工坊ID, {"mtime": ..., "mods": [...]})
+    """
+    source_directory = os.path.abspath(source_directory)
+    index_path = cache_file_path("workshop_index", source_directory)
+    cached = load_json(index_path) if use_cache else None
+    if not cached or cached.get("version") != INDEX_VERSION or cached.get("source_directory") != source_directory:
+        cached = {"items": {}}
+    cached_items = cached["items"]
+
+    with os.scandir(source_directory) as entries:
+        item_entries = [(entry.path, entry.name) for entry in entries if entry.is_dir()]
+
+    items = {}
+    changed = False
+    if workers > 1 and len(item_entries) > 1:
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mods-scan")
+        futures = [pool.submit(_check_workshop_item, path, name, cached_items) for path, name in item_entries]
+        results = (future.result() for future in as_completed(futures))
+    else:
+        pool = None
+        results = (_check_workshop_item(path, name, cached_items) for path, name in item_entries)
+    try:
+        for item, info, item_changed in results:
+            changed = changed or item_changed
+            if info is not None:
+                items[item] = info
+                yield item, info
+    finally:
+        if pool:
+            # 提前停止（例如扫描被取消）时不再启动剩余的扫描
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=True)
+
+    if len(items) != len(cached_items):
+        changed = True
+
+    result = {
+        "version": INDEX_VERSION,
+        "source_directory": source_directory,
+        "source_mtime": get_mtime(source_directory),
+        "items": items,
+    }
+    if changed or cached.get("source_mtime") != result["source_mtime"]:
+        try:
+            with span("save_index", items=len(items)):
+                save_json(index_path, result)
+        except OSError as e:
+            # 输出到标准错误，不影响命令行 --json 的输出
+            print(f"索引缓存保存失败: {e}", file=sys.stderr)
+    if index is not None:
+        index.update(result)
+
+
+def _scan_library(library, source_directory, use_cache, workers, results, stop, tracer):
+    """
+    在单独的线程中扫描一个源目录，结果放入队列，最后放入 (源目录序号, None, 索引信息或异常)
+    """
+    set_current_tracer(tracer)
+    index = {}
+    try:
+        with span("scan_library", library=source_directory):
+            for item, info in scan_workshop_index(source_directory, use_cache, workers, index):
+                if stop.is_set():
+                    return
+                results.put((library, item, info))
+        results.put((library, None, index))
+    except Exception as e:
+        results.put((library, None, e))
+    finally:
+        set_current_tracer(None)
+
+
+def scan_libraries(source_directory, use_cache=True, workers=DEFAULT_SCAN_WORKERS, index=None, rule=None):
+    """
+    流式扫描一个或多个源目录（多个Steam库），每个源目录在单独的线程中扫描并使用各自的索引缓存，
+    慢的磁盘或网络共享不会阻塞其他源目录的结果。
+    同一个创意工坊物品出现在多个源目录中时会被返回多次，合并后的索引中按选择规则使用其中一个（见choose_library_copy）。
+    :param source_directory: 源目录，多个源目录用SOURCE_SEPARATOR分隔
+    :param use_cache: 是否使用磁盘缓存
+    :param workers: 每个源目录并发扫描的线程数
+    :param index: 可选的字典，扫描完成后填入合并的索引信息
+                  {"version", "source_directory", "source_directories", "source_mtime", "items"}，
+                  items中的每个物品增加 "root"（所在的源目录）和 "library"（源目录序号）
+    :param rule: 同一个物品出现在多个源目录中时的选择规则，为None时使用保存的选择设置
+    :return: 生成 (创意工坊ID, 物品信息)
+    """
+    directories = split_source_directories(source_directory)
+    if not directories:
+        raise FileNotFoundError("没有指定源目录")
+    if len(directories) == 1:
+        for item, info in scan_workshop_index(directories[0], use_cache, workers, index):
+            yield item, dict(info, root=directories[0], library=0)
+        if index is not None:
+            index["source_directories"] = directories
+            for info in index["items"].values():
+                info.update(root=directories[0], library=0)
+        return
+
+    if rule is None:
+        rule = load_conflict_settings()["rule"]
+    results = queue.Queue()
+    stop = threading.Event()
+    tracer = get_current_tracer()
+    threads = [threading.Thread(target=_scan_library, name=f"mods-scan-library-{library}",
+                                args=(library, directory, use_cache, workers, results, stop, tracer), daemon=True)
+               for library, directory in enumerate(directories)]
+    for thread in threads:
+        thread.start()
+
+    items = {}
+    pending = len(threads)
+    try:
+        while pending:
+            library, item, info = results.get()
+            if item is None:
+                pending -= 1
+                if isinstance(info, Exception):
+                    raise info
+                continue
+            info = dict(info, root=directories[library], library=library)
+            current = items.get(item)
+            if current is None or choose_library_copy([current, info], rule) is info:
+                items[item] = info
+            yield item, info
+    finally:
+        # 提前停止或某个源目录扫描失败时通知其他线程不再继续
+        stop.set()
+
+    if index is not None:
+        index.update({
+            "version": INDEX_VERSION,
+            "source_directory": SOURCE_SEPARATOR.join(directories),
+            "source_directories": directories,
+            "source_mtime": None,
+            "items": items,
+        })
+
+
+def iter_mod_batches(source_directory, batch_size=MOD_BATCH_SIZE, use_cache=True, workers=DEFAULT_SCAN_WORKERS,
+                     index=None):
+    """
+    流式扫描源目录，按批返回找到的Mods，界面可以边扫描边显示
+    :param source_directory: 源目录，多个源目录用SOURCE_SEPARATOR分隔
+    :param batch_size: 每批的Mod数量
+    :param use_cache: 是否使用磁盘缓存
+    :param workers: 并发扫描的线程数
+    :param index: 可选的字典，扫描完成后填入索引信息
+    :return: 生成 [(mod名称, 创意工坊ID), ...]
+    """
+    batch = []
+    for item, info in scan_libraries(source_directory, use_cache, workers, index):
+        batch.extend((mod, item) for mod in info["mods"])
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_workshop_index(source_directory, use_cache=True, workers=DEFAULT_SCAN_WORKERS, rule=None):
+    """
+    加载源目录（可以是多个源目录）的 mod名称 -> 创意工坊ID 索引。
+    索引保存在缓存目录中，并记录每个创意工坊物品mods文件夹的修改时间，
+    只有修改时间变化（或新增）的物品才会重新扫描。
+    :param source_directory: 源目录（包含Mods文件夹的目录）
+    :param use_cache: 是否使用磁盘缓存，为False时完整重建
+    :param workers: 并发扫描的线程数
+    :param rule: 同一个物品出现在多个源目录中时的选择规则，为None时使用保存的选择设置
+    :return: 包含索引信息的字典 {"version", "source_directory", "source_mtime", "items"}
+    """
+    index = {}
+    for _ in scan_libraries(source_directory, use_cache, workers, index, rule):
+        pass
+    return index
+
+
+def load_id_map(source_directory, use_cache=True, conflicts=None):
+    """
+    加载源目录的 mod名称 -> 创意工坊ID 映射（一次扫描，带磁盘缓存），同名Mod按保存的选择设置处理
+    :param source_directory: 源目录，多个源目录用SOURCE_SEPARATOR分隔
+    :param use_cache: 是否使用磁盘缓存
+    :param conflicts: 可选的字典，填入同名Mod的冲突（见build_id_map）
+    :return: mod名称 -> 创意工坊ID 的字典
+    """
+    settings = load_conflict_settings()
+    items = load_workshop_index(source_directory, use_cache, rule=settings["rule"])["items"]
+    return build_id_map(items, settings["rule"], settings["pins"], conflicts)
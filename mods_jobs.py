@@ -0,0 +1,287 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from mods_trace import Tracer, format_summary, record_run, set_current_tracer
+
+# 任务状态
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_PAUSED = "paused"
+JOB_CANCELLED = "cancelled"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# 进度单位
+UNIT_ITEMS = "items"
+UNIT_BYTES = "bytes"
+
+# 计算速度时使用的时间窗口（秒）
+RATE_WINDOW = 3.0
+
+# 事件类型
+EVENT_LOG = "log"
+EVENT_DATA = "data"
+EVENT_FINISHED = "finished"
+
+
+class JobCancelled(Exception):
+    """任务被取消时在工作线程中抛出"""
+
+
+class Job:
+    """
+    在工作线程中运行的任务。
+    任务函数的第一个参数是Job本身，通过它输出日志、报告进度，
+    并在适当的位置调用 checkpoint() 以响应暂停和取消。
+    """
+
+    def __init__(self, name, target, args, kwargs, events, echo=True):
+        self.name = name
+        self.echo = echo
+        self.state = JOB_PENDING
+        self.result = None
+        self.error = None
+        self._target = target
+        self._args = args
+        self._kwargs = kwargs
+        self._events = events
+        self._cancel_event = threading.Event()
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+        self._lock = threading.Lock()
+        self._done = 0
+        self._total = 0
+        self._files_done = 0
+        self._unit = UNIT_ITEMS
+        self._status = ""
+        self._started_at = None
+        self._samples = deque()
+        self.tracer = Tracer(name)
+
+    def log(self, message):
+        """
+        输出一条日志（线程安全，由界面线程统一显示）
+        :param message: 日志消息
+        """
+        if self.echo:
+            print(message)
+        self._events.put((EVENT_LOG, self, message))
+
+    def emit(self, data):
+        """
+        把任务的中间结果交给界面线程（例如扫描时分批找到的Mods）
+        :param data: 任意数据
+        """
+        self._events.put((EVENT_DATA, self, data))
+
+    def span(self, name, **args):
+        """
+        记录一个计时区间（见mods_trace），可以嵌套，也可以在复制线程中使用
+        :param name: 区间名称
+        :param args: 附加信息（例如Mod名称）
+        :return: 上下文管理器
+        """
+        return self.tracer.span(name, **args)
+
+    def count(self, name, amount=1):
+        """
+        增加一个计数（例如 "bytes"、"files"、"mods"），显示在耗时统计中
+        :param name: 计数名称
+        :param amount: 增加的数量
+        """
+        self.tracer.count(name, amount)
+
+    def set_total(self, total, unit=None):
+        """
+        设置任务的总工作量
+        :param total: 总工作量
+        :param unit: 工作量单位，UNIT_ITEMS（个数）或 UNIT_BYTES（字节），为None时不改变
+        """
+        with self._lock:
+            self._total = total
+            if unit is not None:
+                self._unit = unit
+
+    def advance(self, amount=1, status=None, files=0):
+        """
+        增加已完成的工作量。只记录数值，界面按固定频率读取，不会每次都刷新界面。
+        :param amount: 增加的工作量
+        :param status: 当前状态描述
+        :param files: 增加的已完成文件数
+        """
+        with self._lock:
+            self._done += amount
+            self._files_done += files
+            if status is not None:
+                self._status = status
+
+    def progress(self):
+        """
+        获取当前进度快照
+        :return: (已完成工作量, 总工作量, 状态描述)
+        """
+        with self._lock:
+            return self._done, self._total, self._status
+
+    def stats(self):
+        """
+        获取进度统计，速度按最近RATE_WINDOW秒内的变化计算（由界面线程按固定频率调用）
+        :return: 字典 {"done", "total", "unit", "status", "files", "elapsed", "rate", "files_rate", "eta"}
+                 rate为每秒完成的工作量，eta为预计剩余秒数（无法估计时为None）
+        """
+        now = time.monotonic()
+        with self._lock:
+            done, total, files, unit, status = self._done, self._total, self._files_done, self._unit, self._status
+        samples = self._samples
+        samples.append((now, done, files))
+        while len(samples) > 2 and now - samples[0][0] > RATE_WINDOW:
+            samples.popleft()
+        first_time, first_done, first_files = samples[0]
+        interval = now - first_time
+        rate = (done - first_done) / interval if interval > 0 else 0.0
+        files_rate = (files - first_files) / interval if interval > 0 else 0.0
+        eta = (total - done) / rate if rate > 0 and total >= done else None
+        elapsed = now - self._started_at if self._started_at else 0.0
+        return {"done": done, "total": total, "unit": unit, "status": status, "files": files,
+                "elapsed": elapsed, "rate": rate, "files_rate": files_rate, "eta": eta}
+
+    def checkpoint(self):
+        """
+        检查点：任务被暂停时阻塞等待，被取消时抛出JobCancelled
+        """
+        self._resume_event.wait()
+        if self._cancel_event.is_set():
+            raise JobCancelled(self.name)
+
+    def sleep(self, seconds):
+        """
+        等待一段时间，期间被取消时立即抛出JobCancelled（用于轮询类的长期任务）
+        :param seconds: 等待的秒数
+        """
+        self._cancel_event.wait(seconds)
+        self.checkpoint()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+        # 暂停中的任务需要唤醒才能响应取消
+        self._resume_event.set()
+
+    def pause(self):
+        if self.state == JOB_RUNNING:
+            self._resume_event.clear()
+            self.state = JOB_PAUSED
+
+    def resume(self):
+        if self.state == JOB_PAUSED:
+            self.state = JOB_RUNNING
+            self._resume_event.set()
+
+    @property
+    def finished(self):
+        return self.state in (JOB_CANCELLED, JOB_DONE, JOB_FAILED)
+
+    def _run(self):
+        if self._cancel_event.is_set():
+            self.state = JOB_CANCELLED
+            self._events.put((EVENT_FINISHED, self))
+            return
+        self.state = JOB_RUNNING
+        self._started_at = time.monotonic()
+        # 从开始运行时计时（不包括排队等待的时间）
+        self.tracer = Tracer(self.name)
+        set_current_tracer(self.tracer)
+        try:
+            with self.tracer.span(self.name):
+                self.result = self._target(self, *self._args, **self._kwargs)
+            self.state = JOB_DONE
+        except JobCancelled:
+            self.state = JOB_CANCELLED
+        except Exception as e:
+            self.error = e
+            self.state = JOB_FAILED
+            self.log(f"任务 {self.name} 出错: {e}")
+        finally:
+            set_current_tracer(None)
+            self._finish_trace()
+            self._events.put((EVENT_FINISHED, self))
+
+    def _finish_trace(self):
+        """
+        任务记录了计数时（处理了Mods、文件或字节），保存trace和历史记录并输出耗时统计
+        """
+        if not self.tracer.has_counters():
+            return
+        try:
+            summary, path = record_run(self.tracer, self.state)
+        except OSError as e:
+            self.log(f"耗时统计保存失败: {e}")
+            return
+        self.log(format_summary(summary))
+        self.log(f"trace已保存到 {path}")
+
+
+class JobExecutor:
+    """
+    任务执行器：在后台线程池中运行复制/移动/删除等耗时操作，
+    通过线程安全的事件队列把日志和完成事件交给界面线程处理。
+    """
+
+    def __init__(self, max_workers=1, echo=True):
+        """
+        :param max_workers: 同时运行的任务数
+        :param echo: 任务日志是否同时打印到标准输出（命令行模式下由调用方自行输出日志）
+        """
+        self.echo = echo
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mods-job")
+        self.events = queue.Queue()
+        self.jobs = []
+
+    def submit(self, name, target, *args, **kwargs):
+        """
+        提交一个任务
+        :param name: 任务名称
+        :param target: 任务函数，签名为 target(job, *args, **kwargs)
+        :return: Job对象
+        """
+        job = Job(name, target, args, kwargs, self.events, self.echo)
+        self.jobs.append(job)
+        self._pool.submit(job._run)
+        return job
+
+    def active_jobs(self):
+        """
+        :return: 尚未结束的任务列表
+        """
+        self.jobs = [job for job in self.jobs if not job.finished]
+        return list(self.jobs)
+
+    def drain_events(self, max_events=1000):
+        """
+        取出队列中已有的事件（不阻塞）
+        :param max_events: 一次最多取出的事件数量，避免界面线程长时间占用
+        :return: 事件列表
+        """
+        events = []
+        while len(events) < max_events:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def shutdown(self, cancel=True):
+        """
+        关闭执行器
+        :param cancel: 是否取消所有未完成的任务
+        """
+        if cancel:
+            for job in self.jobs:
+                job.cancel()
+        self._pool.shutdown(wait=False)
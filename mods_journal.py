@@ -0,0 +1,162 @@
+import os
+import json
+import shutil
+import threading
+
+# 本程序在目标目录中使用的内部文件和文件夹都以这个前缀开头，扫描Mods时应跳过
+INTERNAL_PREFIX = ".zde_"
+# 暂存文件夹：新版本的Mod先复制到这里，完成后再通过重命名替换目标Mod
+STAGING_DIRECTORY_NAME = INTERNAL_PREFIX + "staging"
+# 替换过程中旧版本Mod文件夹的后缀
+OLD_SUFFIX = INTERNAL_PREFIX + "old"
+# 操作日志：每完成一个Mod追加一行，操作全部完成后删除
+JOURNAL_FILE_NAME = INTERNAL_PREFIX + "journal.jsonl"
+
+
+def is_internal_name(name):
+    """
+    判断目标目录中的文件或文件夹是否是本程序的内部文件（暂存文件夹、操作日志等），而不是Mod
+    :param name: 文件或文件夹名称
+    :return: 是否是内部文件
+    """
+    return name.startswith(INTERNAL_PREFIX)
+
+
+def get_staging_path(destination_mod_path):
+    """
+    获取目标Mod对应的暂存文件夹路径。暂存文件夹位于目标目录中，与目标Mod在同一个文件系统上，重命名是原子的。
+    :param destination_mod_path: 目标Mod文件夹
+    :return: 暂存文件夹路径（暂存目录不存在时自动创建）
+    """
+    directory, mod = os.path.split(destination_mod_path)
+    staging_directory = os.path.join(directory, STAGING_DIRECTORY_NAME)
+    os.makedirs(staging_directory, exist_ok=True)
+    return os.path.join(staging_directory, mod)
+
+
+def swap_in(new_path, destination_mod_path):
+    """
+    用new_path替换目标Mod文件夹：旧文件夹先改名到暂存目录，新文件夹改名到位后再删除旧文件夹。
+    任何一步中断后，目标Mod要么是完整的旧版本，要么是完整的新版本（见recover_staging）。
+    :param new_path: 新版本的Mod文件夹（暂存文件夹，或同一文件系统上移动时的源Mod文件夹）
+    :param destination_mod_path: 目标Mod文件夹
+    """
+    old_path = get_staging_path(destination_mod_path) + OLD_SUFFIX
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+    if os.path.exists(destination_mod_path):
+        os.rename(destination_mod_path, old_path)
+    try:
+        os.rename(new_path, destination_mod_path)
+    except OSError:
+        if os.path.exists(old_path):
+            os.rename(old_path, destination_mod_path)
+        raise
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def recover_staging(destination_directory):
+    """
+    清理上次中断留下的暂存文件夹：替换到一半的Mod恢复为旧版本，复制到一半的暂存文件夹直接删除
+    :param destination_directory: 目标目录（包含Mods文件夹的目录）
+    :return: 恢复为旧版本的Mods列表
+    """
+    staging_directory = os.path.join(destination_directory, STAGING_DIRECTORY_NAME)
+    if not os.path.isdir(staging_directory):
+        return []
+    restored = []
+    with os.scandir(staging_directory) as entries:
+        entries = list(entries)
+    for entry in entries:
+        if entry.name.endswith(OLD_SUFFIX):
+            mod = entry.name[:-len(OLD_SUFFIX)]
+            destination_mod_path = os.path.join(destination_directory, mod)
+            if not os.path.exists(destination_mod_path):
+                os.rename(entry.path, destination_mod_path)
+                restored.append(mod)
+                continue
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            os.remove(entry.path)
+    try:
+        os.rmdir(staging_directory)
+    except OSError:
+        pass
+    return restored
+
+
+class OperationJournal:
+    """
+    目标目录中的追加式操作日志。
+    第一行记录操作（动作和源目录），之后每完成一个Mod追加一行并立即写入磁盘。
+    进程崩溃或任务被取消后，再次执行相同的操作时可以跳过日志中已经完成的Mods；操作全部完成后删除日志。
+    """
+
+    def __init__(self, destination_directory):
+        self.destination_directory = destination_directory
+        self.path = os.path.join(destination_directory, JOURNAL_FILE_NAME)
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _read(self):
+        records = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # 最后一行可能只写了一半
+                        break
+        except OSError:
+            pass
+        return records
+
+    def open(self, action, source_directory):
+        """
+        恢复上次中断的操作并开始记录新的操作
+        :param action: 动作，'copy' 或 'move'
+        :param source_directory: 源目录
+        :return: (上次已完成的Mods {mod名称: 创意工坊ID}, 是否是继续上次相同的操作)
+        """
+        recover_staging(self.destination_directory)
+        records = self._read()
+        completed = {record["mod"]: record.get("workshop_id", "") for record in records[1:] if "mod" in record}
+        header = {"action": action, "source_directory": os.path.abspath(source_directory)}
+        resumed = bool(records) and records[0] == header
+        # 重写日志，去掉可能只写了一半的最后一行；不是相同的操作时重新开始记录
+        self._file = open(self.path, 'w', encoding='utf-8')
+        for record in records if resumed else [header]:
+            self._write(record)
+        return completed, resumed
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def record(self, mod, workshop_id):
+        """
+        记录一个已经完成的Mod
+        :param mod: Mod名称
+        :param workshop_id: 创意工坊ID
+        """
+        with self._lock:
+            self._write({"mod": mod, "workshop_id": workshop_id})
+
+    def close(self, finished=False):
+        """
+        关闭日志
+        :param finished: 操作是否全部完成，完成时删除日志和空的暂存目录
+        """
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+            if finished:
+                try:
+                    os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+                recover_staging(self.destination_directory)
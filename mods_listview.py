@@ -0,0 +1,304 @@
+import tkinter as tk
+import tkinter.font as tkfont
+from tkinter import ttk
+
+from mods_search import ModSearchIndex
+
+# 行的上下留白（像素）
+ROW_PADDING = 4
+# 鼠标滚轮每格滚动的行数
+WHEEL_ROWS = 3
+SELECTED_BACKGROUND = "#3399ff"
+SELECTED_FOREGROUND = "#ffffff"
+ACTIVE_OUTLINE = "#808080"
+ID_FOREGROUND = "#808080"
+
+
+class VirtualListView(tk.Frame):
+    """
+    可搜索、可多选的Mods列表，只绘制可见的行，上万个Mods也可以流畅地滚动和过滤。
+    点击选择一个Mod，Ctrl+点击增加或取消选择，Shift+点击选择一个范围，Ctrl+A全选当前显示的Mods。
+    选择按名称记录，过滤条件变化时保持不变；选择变化时产生 <<ListboxSelect>> 事件（与tk.Listbox相同）。
+    """
+
+    def __init__(self, master, width=50, height=10, **kwargs):
+        """
+        :param master: 父控件
+        :param width: 宽度（字符数）
+        :param height: 初始高度（行数）
+        """
+        super().__init__(master, **kwargs)
+        self.font = tkfont.nametofont("TkDefaultFont")
+        self.row_height = self.font.metrics("linespace") + ROW_PADDING
+        self.index = ModSearchIndex()
+        self.workshop_ids = {}
+        # mod名称 -> mod.info中的显示名称和ID（由set_metadata设置）
+        self.metadata = {}
+        self.rows = []
+        self.selection = set()
+        self.active = None
+        self.anchor = None
+        self.top = 0
+
+        search_frame = tk.Frame(self)
+        search_frame.pack(side=tk.TOP, fill=tk.X)
+        search_label = tk.Label(search_frame, text="搜索：")
+        search_label.pack(side=tk.LEFT)
+        self.query_var = tk.StringVar()
+        self.query_var.trace_add("write", lambda *args: self.refilter())
+        search_entry = tk.Entry(search_frame, textvariable=self.query_var)
+        search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.count_label = tk.Label(search_frame, text="")
+        self.count_label.pack(side=tk.LEFT, padx=5)
+
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas = tk.Canvas(self, width=self.font.measure("0") * width, height=self.row_height * height,
+                                background="white", highlightthickness=1, takefocus=True)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind("<Configure>", lambda event: self.render())
+        self.canvas.bind("<Button-1>", lambda event: self._on_click(event, extend=False, toggle=False))
+        self.canvas.bind("<Control-Button-1>", lambda event: self._on_click(event, extend=False, toggle=True))
+        self.canvas.bind("<Shift-Button-1>", lambda event: self._on_click(event, extend=True, toggle=False))
+        self.canvas.bind("<MouseWheel>", self._on_mouse_wheel)
+        self.canvas.bind("<Button-4>", lambda event: self.scroll(-WHEEL_ROWS))
+        self.canvas.bind("<Button-5>", lambda event: self.scroll(WHEEL_ROWS))
+        self.canvas.bind("<Up>", lambda event: self._move_active(-1, event))
+        self.canvas.bind("<Down>", lambda event: self._move_active(1, event))
+        self.canvas.bind("<Prior>", lambda event: self._move_active(-self.visible_rows(), event))
+        self.canvas.bind("<Next>", lambda event: self._move_active(self.visible_rows(), event))
+        self.canvas.bind("<Control-a>", lambda event: self.select_all())
+
+    # ---- 数据 ----
+
+    def set_items(self, items):
+        """
+        替换所有条目
+        :param items: [(mod名称, 创意工坊ID), ...]
+        """
+        self.index.clear()
+        self.workshop_ids.clear()
+        self.metadata.clear()
+        self.rows = []
+        self.selection.clear()
+        self.active = self.anchor = None
+        self.top = 0
+        self.add_items(items)
+
+    def clear(self):
+        self.set_items([])
+
+    def add_items(self, items):
+        """
+        加入条目，已存在的条目只更新创意工坊ID
+        :param items: [(mod名称, 创意工坊ID), ...]
+        """
+        query = self.query_var.get()
+        for name, workshop_id in items:
+            is_new = name not in self.index
+            self.index.add(name, workshop_id or "", self._search_text(name))
+            self.workshop_ids[name] = workshop_id or ""
+            if is_new and (not query or self.index.matches(name, query)):
+                self.rows.append(name)
+        self.render()
+
+    def set_metadata(self, metadata):
+        """
+        设置Mods的mod.info元数据，列表中在Mod名称后面显示mod.info中的名称，搜索时也可以匹配mod.info中的名称和ID
+        :param metadata: {mod名称: 元数据}（见mods_metadata.ModCatalog.get），只更新其中包含的Mods
+        """
+        for name, entry in metadata.items():
+            if name not in self.index or not entry:
+                continue
+            self.metadata[name] = entry
+            self.index.add(name, self.workshop_ids.get(name, ""), self._search_text(name))
+        if self.query_var.get():
+            # 新的搜索文本可能让更多的Mods匹配当前的搜索词
+            self.refilter()
+        else:
+            self.render()
+
+    def _search_text(self, name):
+        entry = self.metadata.get(name)
+        return f"{entry['name']}\0{entry['id']}" if entry else ""
+
+    def remove_items(self, names):
+        """
+        删除条目
+        :param names: Mod名称列表
+        """
+        names = set(names)
+        if not names:
+            return
+        for name in names:
+            self.index.remove(name)
+            self.workshop_ids.pop(name, None)
+            self.metadata.pop(name, None)
+        self.rows = [name for name in self.rows if name not in names]
+        selection_changed = bool(self.selection & names)
+        self.selection -= names
+        if self.active in names:
+            self.active = None
+        self.render()
+        if selection_changed:
+            self.event_generate("<<ListboxSelect>>")
+
+    def names(self):
+        """
+        :return: 所有Mod名称（不受过滤条件影响）
+        """
+        return self.index.names()
+
+    def size(self):
+        return len(self.index)
+
+    def refilter(self):
+        """
+        按搜索框的内容重新过滤
+        """
+        self.rows = self.index.search(self.query_var.get())
+        self.top = 0
+        self.render()
+
+    # ---- 选择 ----
+
+    def get_selection(self):
+        """
+        :return: 选中的Mod名称列表（按加入的顺序，包括被过滤隐藏的已选Mods）
+        """
+        if not self.selection:
+            return []
+        return [name for name in self.index.names() if name in self.selection]
+
+    def get_active(self):
+        """
+        :return: 最后点击（或用方向键移动到）的Mod名称，没有时返回None
+        """
+        return self.active
+
+    def neighbours(self, name, count):
+        """
+        :return: 当前显示的列表中与name相邻的最多count*2个Mod名称（用于预加载封面）
+        """
+        try:
+            position = self.rows.index(name, max(0, self.top - count))
+        except ValueError:
+            return []
+        return [self.rows[i] for i in range(max(0, position - count), min(len(self.rows), position + count + 1))
+                if i != position]
+
+    def select_all(self):
+        """
+        选中当前显示的所有Mods
+        """
+        self.selection.update(self.rows)
+        self.render()
+        self.event_generate("<<ListboxSelect>>")
+        return "break"
+
+    def _select(self, position, extend, toggle):
+        name = self.rows[position]
+        if extend and self.anchor is not None and self.anchor in self.index:
+            try:
+                anchor_position = self.rows.index(self.anchor)
+            except ValueError:
+                anchor_position = position
+            low, high = sorted((anchor_position, position))
+            self.selection = set(self.rows[low:high + 1])
+        elif toggle:
+            self.selection ^= {name}
+            self.anchor = name
+        else:
+            self.selection = {name}
+            self.anchor = name
+        self.active = name
+        self.see(position)
+        self.render()
+        self.event_generate("<<ListboxSelect>>")
+
+    def _on_click(self, event, extend, toggle):
+        self.canvas.focus_set()
+        position = self.top + event.y // self.row_height
+        if position < len(self.rows):
+            self._select(position, extend, toggle)
+        return "break"
+
+    def _move_active(self, amount, event):
+        if not self.rows:
+            return "break"
+        try:
+            position = self.rows.index(self.active) + amount
+        except ValueError:
+            position = self.top
+        position = min(max(position, 0), len(self.rows) - 1)
+        self._select(position, extend=bool(event.state & 0x0001), toggle=False)
+        return "break"
+
+    # ---- 滚动和绘制 ----
+
+    def visible_rows(self):
+        return max(1, self.canvas.winfo_height() // self.row_height)
+
+    def see(self, position):
+        """
+        滚动到可以看到第position行
+        """
+        visible = self.visible_rows()
+        if position < self.top:
+            self.top = position
+        elif position >= self.top + visible:
+            self.top = position - visible + 1
+
+    def scroll(self, amount):
+        self.top += amount
+        self.render()
+
+    def _on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.rows))
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= self.visible_rows()
+            self.top += amount
+        self.render()
+
+    def _on_mouse_wheel(self, event):
+        # Windows上每格为120，macOS上为较小的数值
+        steps = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        self.scroll(-steps * WHEEL_ROWS)
+
+    def render(self):
+        """
+        只绘制可见的行
+        """
+        visible = self.visible_rows()
+        total = len(self.rows)
+        self.top = min(max(self.top, 0), max(0, total - visible))
+        canvas = self.canvas
+        canvas.delete("all")
+        width = canvas.winfo_width()
+        for offset, name in enumerate(self.rows[self.top:self.top + visible + 1]):
+            y = offset * self.row_height
+            selected = name in self.selection
+            if selected or name == self.active:
+                canvas.create_rectangle(0, y, width, y + self.row_height - 1,
+                                        fill=SELECTED_BACKGROUND if selected else "",
+                                        outline=ACTIVE_OUTLINE if name == self.active else "")
+            canvas.create_text(4, y + ROW_PADDING // 2, anchor="nw", text=name, font=self.font,
+                               fill=SELECTED_FOREGROUND if selected else "black")
+            entry = self.metadata.get(name)
+            if entry and entry["name"] and entry["name"] != name:
+                canvas.create_text(4 + self.font.measure(name + "  "), y + ROW_PADDING // 2, anchor="nw",
+                                   text=entry["name"], font=self.font,
+                                   fill=SELECTED_FOREGROUND if selected else ID_FOREGROUND)
+            workshop_id = self.workshop_ids.get(name)
+            if workshop_id:
+                canvas.create_text(width - 4, y + ROW_PADDING // 2, anchor="ne", text=workshop_id, font=self.font,
+                                   fill=SELECTED_FOREGROUND if selected else ID_FOREGROUND)
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + visible) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        self.count_label.config(text=f"{len(self.selection)}/{total}" if self.selection else str(total))
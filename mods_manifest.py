@@ -0,0 +1,240 @@
+import os
+import hashlib
+
+from mods_cache import load_json, save_json
+from mods_hash import HASH_ALGORITHM, DEFAULT_HASH_WORKERS, HashCache, hash_files
+from mods_jobs import UNIT_BYTES
+from mods_journal import is_internal_name
+from mods_trace import count, span
+
+MODS_INFO_FILE_NAME = "mods_info.json"
+# 清单格式版本：
+# 1 - {"mods_count", "mods": {mod名称: 创意工坊ID}}
+# 2 - 在版本1的基础上增加 "format_version"、"hash_algorithm" 和 "details"，
+#     details 记录每个Mod的大小、修改时间、内容哈希以及（可选）每个文件的信息。
+#     "mods" 字段保持不变，旧版本程序仍然可以读取。
+MANIFEST_VERSION = 2
+
+
+def new_manifest():
+    """
+    :return: 空的清单
+    """
+    return {"format_version": MANIFEST_VERSION, "hash_algorithm": HASH_ALGORITHM,
+            "mods_count": 0, "mods": {}, "details": {}}
+
+
+def normalize_manifest(manifest):
+    """
+    把读取到的清单（版本1或版本2）转换为版本2的结构
+    :param manifest: 读取到的清单字典
+    :return: 版本2结构的清单
+    """
+    if not manifest or not isinstance(manifest.get("mods"), dict):
+        return new_manifest()
+    manifest.setdefault("details", {})
+    manifest.setdefault("hash_algorithm", HASH_ALGORITHM)
+    manifest["format_version"] = MANIFEST_VERSION
+    manifest["mods_count"] = len(manifest["mods"])
+    return manifest
+
+
+def load_manifest(json_path):
+    """
+    读取清单文件，兼容旧的 {"mods_count", "mods"} 格式
+    :param json_path: 清单文件路径
+    :return: 版本2结构的清单，文件不存在时返回空清单
+    """
+    return normalize_manifest(load_json(json_path))
+
+
+def save_manifest(json_path, manifest):
+    """
+    更新mods_count并原子地保存清单
+    :param json_path: 清单文件路径
+    :param manifest: 清单
+    """
+    manifest["mods_count"] = len(manifest["mods"])
+    save_json(json_path, manifest, indent=4)
+
+
+def read_mods_info(destination_directory):
+    """
+    读取目标目录中的mods_info.json（兼容旧格式），不存在时返回空的结构
+    :param destination_directory: 目标目录（包含Mods文件夹的目录）
+    :return: mods_info字典
+    """
+    return load_manifest(os.path.join(destination_directory, MODS_INFO_FILE_NAME))
+
+
+def write_mods_info(destination_directory, mods_info):
+    """
+    更新mods_count并保存mods_info.json
+    :param destination_directory: 目标目录（包含Mods文件夹的目录）
+    :param mods_info: mods_info字典
+    """
+    with span("write_manifest", mods=len(mods_info["mods"])):
+        save_manifest(os.path.join(destination_directory, MODS_INFO_FILE_NAME), mods_info)
+
+
+def set_mod_entry(manifest, mod, workshop_id, details=None):
+    """
+    更新清单中的一个Mod。没有提供details时清除旧的详细信息，避免清单中留下过期的哈希。
+    :param manifest: 清单
+    :param mod: Mod名称
+    :param workshop_id: 创意工坊ID
+    :param details: Mod的详细信息（见build_mod_details）
+    """
+    manifest["mods"][mod] = workshop_id
+    if details is None:
+        manifest.setdefault("details", {}).pop(mod, None)
+    else:
+        manifest.setdefault("details", {})[mod] = details
+
+
+def remove_mod_entry(manifest, mod):
+    """
+    从清单中删除一个Mod
+    :param manifest: 清单
+    :param mod: Mod名称
+    """
+    manifest["mods"].pop(mod, None)
+    manifest.setdefault("details", {}).pop(mod, None)
+
+
+class UnsafePathError(ValueError):
+    """清单或Mods包中的Mod名称或相对路径指向Mod文件夹以外的位置"""
+
+
+def _is_safe_name(name):
+    # 不允许路径分隔符、盘符（以及Windows的备用数据流）和空字符
+    return bool(name) and name not in (".", "..") and not any(char in name for char in "/\\:\0")
+
+
+def check_mod_name(mod):
+    """
+    检查从清单或Mods包中读到的Mod名称，只能是目标目录下的一个文件夹名称
+    :param mod: Mod名称
+    :return: Mod名称，不安全时抛出UnsafePathError
+    """
+    if not isinstance(mod, str) or not _is_safe_name(mod) or os.path.isabs(mod) or is_internal_name(mod):
+        raise UnsafePathError(f"不安全的Mod名称：{mod!r}")
+    return mod
+
+
+def join_mod_file(mod_path, rel_path):
+    """
+    把从清单或Mods包中读到的相对路径拼接到Mod文件夹下，拒绝指向Mod文件夹以外的路径
+    （包括 ..、空的路径段、盘符和指向外部的符号链接）
+    :param mod_path: Mod文件夹
+    :param rel_path: 相对路径（'/'分隔）
+    :return: 文件路径，不安全时抛出UnsafePathError
+    """
+    if not isinstance(rel_path, str) or not all(_is_safe_name(part) for part in rel_path.split("/")):
+        raise UnsafePathError(f"不安全的文件路径：{rel_path!r}")
+    path = os.path.join(mod_path, *rel_path.split("/"))
+    if not os.path.realpath(path).startswith(os.path.realpath(mod_path) + os.sep):
+        raise UnsafePathError(f"不安全的文件路径：{rel_path!r}")
+    return path
+
+
+def list_mod_files(mod_path, prefix=""):
+    """
+    递归列出Mod文件夹中的所有文件
+    :param mod_path: Mod文件夹
+    :param prefix: 相对路径前缀
+    :return: [(相对路径, 绝对路径, os.stat_result), ...]，相对路径统一使用'/'分隔
+    """
+    files = []
+    with os.scandir(mod_path) as entries:
+        for entry in entries:
+            rel_path = prefix + entry.name
+            if entry.is_dir():
+                files.extend(list_mod_files(entry.path, rel_path + "/"))
+            else:
+                files.append((rel_path, entry.path, entry.stat()))
+    return files
+
+
+def build_mod_details(files, hashes, include_files=False):
+    """
+    根据文件列表和文件哈希生成一个Mod的详细信息
+    :param files: list_mod_files的返回值
+    :param hashes: {绝对路径: 哈希字符串}
+    :param include_files: 是否记录每个文件的信息
+    :return: {"size", "mtime", "file_count", "hash", ["files"]}
+    """
+    files = sorted(files)
+    mod_digest = hashlib.blake2b(digest_size=16)
+    for rel_path, path, stat in files:
+        mod_digest.update(f"{rel_path}\0{hashes[path]}\n".encode('utf-8'))
+    details = {
+        "size": sum(stat.st_size for _, _, stat in files),
+        "mtime": max((int(stat.st_mtime) for _, _, stat in files), default=0),
+        "file_count": len(files),
+        "hash": mod_digest.hexdigest(),
+    }
+    if include_files:
+        details["files"] = {rel_path: [stat.st_size, int(stat.st_mtime), hashes[path]]
+                            for rel_path, path, stat in files}
+    return details
+
+
+def details_match(mod_path, details):
+    """
+    只比较文件数量、总大小和最新的修改时间（不读取文件内容），判断Mod文件夹是否仍然与清单中记录的详细信息一致。
+    本程序自己复制、解包或增量同步的Mod也会被目录监视报告为有变化，这时记录的详细信息仍然有效，不需要清除。
+    :param mod_path: Mod文件夹
+    :param details: 清单中的详细信息（见build_mod_details）
+    :return: 是否一致，Mod文件夹无法读取时返回False
+    """
+    try:
+        files = list_mod_files(mod_path)
+    except OSError:
+        return False
+    return (len(files) == details.get("file_count")
+            and sum(stat.st_size for _, _, stat in files) == details.get("size")
+            and max((int(stat.st_mtime) for _, _, stat in files), default=0) == details.get("mtime"))
+
+
+def generate_manifest(destination_directory, id_map, include_files=False, workers=DEFAULT_HASH_WORKERS,
+                      cache=None, job=None):
+    """
+    扫描目标目录并生成版本2的清单。文件哈希在线程池中计算，并通过HashCache缓存，
+    重新生成清单时只有发生变化的文件需要重新计算哈希。
+    :param destination_directory: 目标目录（包含Mods文件夹的目录）
+    :param id_map: Mod与创意工坊ID的映射字典
+    :param include_files: 是否记录每个文件的信息
+    :param workers: 计算哈希的线程数
+    :param cache: HashCache对象，为None时使用默认的磁盘缓存
+    :param job: 当前任务（可选），用于响应取消和报告进度（以字节为单位）
+    :return: 清单
+    """
+    cache = cache if cache is not None else HashCache()
+    mod_files = {}
+    with span("list_files"), os.scandir(destination_directory) as entries:
+        for entry in entries:
+            if entry.is_dir() and not is_internal_name(entry.name):
+                mod_files[entry.name] = list_mod_files(entry.path)
+
+    all_files = [(path, stat) for files in mod_files.values() for _, path, stat in files]
+    total_size = sum(stat.st_size for _, stat in all_files)
+    if job:
+        job.set_total(total_size, UNIT_BYTES)
+    count("files", len(all_files))
+    count("bytes", total_size)
+    try:
+        with span("hash", files=len(all_files)):
+            hashes = hash_files(all_files, cache, workers, job)
+    finally:
+        with span("save_hash_cache"):
+            cache.save()
+
+    manifest = new_manifest()
+    with span("build_manifest"):
+        for mod in sorted(mod_files):
+            set_mod_entry(manifest, mod, id_map.get(mod, ""),
+                          build_mod_details(mod_files[mod], hashes, include_files))
+    count("mods", len(mod_files))
+    manifest["mods_count"] = len(manifest["mods"])
+    return manifest
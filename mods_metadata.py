@@ -0,0 +1,257 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from mods_cache import get_cache_directory, load_json, save_json
+
+MOD_INFO_FILE_NAME = "mod.info"
+DEFAULT_METADATA_WORKERS = 8
+# 缓存格式版本，解析规则变化时增加
+CATALOG_VERSION = 1
+
+
+def parse_mod_info(path):
+    """
+    解析mod.info文件（每行一个 键=值，键不区分大小写）
+    :param path: mod.info文件路径
+    :return: {"id", "name", "require": [依赖的Mod ID], "poster": [封面图片相对路径]}
+    """
+    metadata = {"id": "", "name": "", "require": [], "poster": []}
+    with open(path, 'r', encoding='utf-8-sig', errors='replace') as file:
+        for line in file:
+            key, separator, value = line.partition('=')
+            if not separator:
+                continue
+            key = key.strip().lower()
+            value = value.strip()
+            if key in ("id", "name"):
+                # 只使用第一次出现的值
+                if not metadata[key]:
+                    metadata[key] = value
+            elif key == "require":
+                # 新版本的格式中依赖的ID前面带有反斜杠，例如 require=\modA,\modB
+                metadata["require"].extend(mod_id.strip().lstrip('\\') for mod_id in value.split(',')
+                                           if mod_id.strip().lstrip('\\'))
+            elif key == "poster" and value:
+                metadata["poster"].append(value)
+    return metadata
+
+
+def find_mod_info(mod_directory):
+    """
+    查找Mod的mod.info文件，Mod文件夹中没有时在版本子文件夹（例如 42/、common/）中查找
+    :param mod_directory: Mod文件夹
+    :return: mod.info文件路径，找不到时返回None
+    """
+    path = os.path.join(mod_directory, MOD_INFO_FILE_NAME)
+    if os.path.isfile(path):
+        return path
+    try:
+        with os.scandir(mod_directory) as entries:
+            subdirectories = sorted((entry.name for entry in entries if entry.is_dir()), reverse=True)
+    except OSError:
+        return None
+    for name in subdirectories:
+        path = os.path.join(mod_directory, name, MOD_INFO_FILE_NAME)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def find_first_image(mod_directory):
+    """
+    :param mod_directory: Mod文件夹
+    :return: Mod文件夹中第一张png图片的路径，找不到时返回None
+    """
+    try:
+        with os.scandir(mod_directory) as entries:
+            for entry in entries:
+                if entry.name.lower().endswith('.png') and entry.is_file():
+                    return entry.path
+    except OSError:
+        pass
+    return None
+
+
+class ModCatalog:
+    """
+    mod.info元数据目录。每个Mod记录解析结果以及mod.info的大小和修改时间，
+    只要mod.info没有变化就直接使用缓存的结果，校验时每个Mod只需要stat一次。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_cache_directory(), "mod_catalog.json")
+        self._lock = threading.Lock()
+        data = load_json(self.path, {}) if self.path else {}
+        if data.get("version") != CATALOG_VERSION:
+            data = {}
+        self._entries = data.get("mods", {})
+        self._dirty = False
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    @staticmethod
+    def _is_valid(entry):
+        info_path = entry.get("path")
+        try:
+            if info_path is None:
+                # 上次没有找到mod.info，Mod文件夹没有变化时仍然没有
+                stat = os.stat(entry["directory"])
+                return stat.st_mtime_ns == entry["mtime"]
+            stat = os.stat(info_path)
+        except OSError:
+            return False
+        return stat.st_mtime_ns == entry["mtime"] and stat.st_size == entry["size"]
+
+    def get(self, mod_directory):
+        """
+        获取Mod的元数据，优先使用缓存
+        :param mod_directory: Mod文件夹
+        :return: {"id", "name", "require", "poster"（封面图片的完整路径，没有时为None）}，
+                 没有mod.info或无法读取时返回None
+        """
+        key = self._key(mod_directory)
+        entry = self._entries.get(key)
+        if entry is None or not self._is_valid(entry):
+            entry = self._load(mod_directory)
+            with self._lock:
+                self._entries[key] = entry
+                self._dirty = True
+        return entry["metadata"]
+
+    @staticmethod
+    def _load(mod_directory):
+        info_path = find_mod_info(mod_directory)
+        try:
+            if info_path is None:
+                return {"directory": mod_directory, "path": None, "mtime": os.stat(mod_directory).st_mtime_ns,
+                        "size": 0, "metadata": None}
+            stat = os.stat(info_path)
+            metadata = parse_mod_info(info_path)
+        except OSError:
+            return {"directory": mod_directory, "path": None, "mtime": None, "size": 0, "metadata": None}
+        # 封面图片的路径相对于mod.info所在的文件夹
+        info_directory = os.path.dirname(info_path)
+        poster = None
+        for name in metadata["poster"]:
+            path = os.path.join(info_directory, name)
+            if os.path.isfile(path):
+                poster = path
+                break
+        metadata = {"id": metadata["id"] or os.path.basename(mod_directory), "name": metadata["name"],
+                    "require": metadata["require"], "poster": poster}
+        return {"directory": mod_directory, "path": info_path, "mtime": stat.st_mtime_ns, "size": stat.st_size,
+                "metadata": metadata}
+
+    def get_many(self, mod_directories, workers=DEFAULT_METADATA_WORKERS):
+        """
+        并发获取多个Mod的元数据
+        :param mod_directories: Mod文件夹列表
+        :param workers: 线程数
+        :return: {Mod文件夹: 元数据或None}
+        """
+        result = {}
+        missing = []
+        # 先在当前线程中校验缓存（每个Mod只需要stat一次），只有变化的Mod才交给线程池解析
+        for path in dict.fromkeys(mod_directories):
+            entry = self._entries.get(self._key(path))
+            if entry is not None and self._is_valid(entry):
+                result[path] = entry["metadata"]
+            else:
+                missing.append(path)
+        if len(missing) <= 1 or workers <= 1:
+            result.update((path, self.get(path)) for path in missing)
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mods-metadata") as pool:
+                result.update(zip(missing, pool.map(self.get, missing)))
+        return result
+
+    def save(self):
+        """
+        保存缓存到磁盘（没有变化时不写入）
+        """
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            save_json(self.path, {"version": CATALOG_VERSION, "mods": self._entries})
+            self._dirty = False
+
+
+_shared_catalog = None
+_shared_catalog_lock = threading.Lock()
+
+
+def get_mod_catalog():
+    """
+    :return: 进程内共享的ModCatalog对象
+    """
+    global _shared_catalog
+    with _shared_catalog_lock:
+        if _shared_catalog is None:
+            _shared_catalog = ModCatalog()
+        return _shared_catalog
+
+
+def load_mods_metadata(mod_paths, workers=DEFAULT_METADATA_WORKERS):
+    """
+    获取多个Mod的元数据并保存缓存
+    :param mod_paths: {mod名称: Mod文件夹}
+    :param workers: 线程数
+    :return: {mod名称: 元数据}（没有mod.info的Mod不包含在内）
+    """
+    catalog = get_mod_catalog()
+    metadata = catalog.get_many(mod_paths.values(), workers)
+    catalog.save()
+    return {mod: metadata[path] for mod, path in mod_paths.items() if metadata.get(path)}
+
+
+def find_cover_image(mod_directory):
+    """
+    查找Mod的封面图片：优先使用mod.info中的poster，没有时使用Mod文件夹中的第一张png图片
+    :param mod_directory: Mod文件夹
+    :return: 封面图片路径，找不到时返回None
+    """
+    metadata = get_mod_catalog().get(mod_directory)
+    if metadata and metadata["poster"]:
+        return metadata["poster"]
+    return find_first_image(mod_directory)
+
+
+def get_mod_id(mod, metadata):
+    """
+    :param mod: Mod名称（文件夹名称）
+    :param metadata: {mod名称: 元数据}
+    :return: mod.info中的ID（服务器配置中Mods=使用的ID），没有mod.info时使用文件夹名称
+    """
+    entry = metadata.get(mod)
+    return entry["id"] if entry else mod
+
+
+def build_server_config(mods, id_map, metadata):
+    """
+    生成服务器配置中的Mods=和WorkshopItems=
+    :param mods: Mod名称列表
+    :param id_map: mod名称 -> 创意工坊ID
+    :param metadata: {mod名称: 元数据}
+    :return: {"mods": [Mod ID], "workshop_items": [创意工坊ID], "missing_requires": [(Mod ID, 缺少的依赖ID)]}
+    """
+    mod_ids = list(dict.fromkeys(get_mod_id(mod, metadata) for mod in mods))
+    workshop_items = list(dict.fromkeys(id_map[mod] for mod in mods if mod in id_map))
+    selected = set(mod_ids)
+    missing_requires = []
+    for mod in mods:
+        entry = metadata.get(mod)
+        for required in entry["require"] if entry else ():
+            if required not in selected:
+                missing_requires.append((entry["id"], required))
+    return {"mods": mod_ids, "workshop_items": workshop_items, "missing_requires": missing_requires}
+
+
+def format_server_config(config):
+    """
+    :param config: build_server_config的返回值
+    :return: 可以直接粘贴到服务器配置文件中的文本
+    """
+    return f"WorkshopItems={';'.join(config['workshop_items'])}\nMods={';'.join(config['mods'])}\n"
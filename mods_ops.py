@@ -0,0 +1,488 @@
+import os
+import shutil
+
+from mods_copy import (copy_mods_parallel, format_size, get_tree_size, iter_delta_files, new_delta_stats,
+                        progress_copy_function, replace_file_function, sync_mod_tree)
+from mods_deploy import (DEPLOY_AUTO, DEPLOY_COPY, DEPLOY_NO_HARDLINK, DEPLOY_STORE, FileDeployer,
+                         probe_space_free_method)
+from mods_diff import build_id_plan
+from mods_index import (MOD_BATCH_SIZE, build_id_map, get_mod_path, iter_mod_batches, load_conflict_settings,
+                        load_id_map, load_workshop_index)
+from mods_jobs import UNIT_BYTES
+from mods_journal import OperationJournal, get_staging_path, swap_in
+from mods_size import check_free_space, get_size_cache, same_device
+from mods_store import ObjectStore, StoreDeployer
+from mods_trash import trash_mods_job
+from mods_verify import VerificationFailed, verify_and_repair
+from mods_metadata import get_mod_catalog, load_mods_metadata
+from mods_manifest import (MODS_INFO_FILE_NAME, details_match, generate_manifest, read_mods_info, remove_mod_entry,
+                           set_mod_entry, write_mods_info)
+
+
+def generate_mods_info_job(job, destination_directory, id_map, include_files=False, source_directory=None):
+    """
+    （在工作线程中运行）扫描目标目录，计算内容哈希并生成mods_info.json
+    :param job: 当前任务
+    :param destination_directory: 目标目录（包含Mods文件夹的目录）
+    :param id_map: Mod与创意工坊ID的映射字典，为None时从source_directory加载（使用索引缓存）
+    :param include_files: 是否记录每个文件的大小、修改时间和哈希
+    :param source_directory: 源目录，多个源目录用mods_index.SOURCE_SEPARATOR分隔
+    :return: 生成的mods_info
+    """
+    if id_map is None:
+        with job.span("load_index"):
+            id_map = load_id_map(source_directory)
+    mods_info = generate_manifest(destination_directory, id_map, include_files, job=job)
+    write_mods_info(destination_directory, mods_info)
+    job.log(f"已生成 {os.path.join(destination_directory, MODS_INFO_FILE_NAME)}，共 {mods_info['mods_count']} 个Mods")
+    return mods_info
+
+
+def copy_mod_tree(job, source_path, destination_path, copy_function=None):
+    """
+    复制一个Mod文件夹，按块报告字节进度，可以在复制中途暂停或取消
+    :param job: 当前任务
+    :param source_path: 源Mod文件夹
+    :param destination_path: 目标Mod文件夹
+    :param copy_function: 复制单个文件的函数，为None时使用报告字节进度的分块复制
+    """
+    try:
+        shutil.copytree(source_path, destination_path, copy_function=copy_function or progress_copy_function(job))
+    except BaseException:
+        # 取消或出错时清理复制了一半的目录
+        shutil.rmtree(destination_path, ignore_errors=True)
+        raise
+
+
+def transfer_mod(job, mod_item_path, destination_mod_path, action, delta=False, use_hash=False, copy_function=None):
+    """
+    复制或移动单个Mod，目标已存在时覆盖（增量模式下只同步有变化的文件）。
+    覆盖时先复制到暂存文件夹，完成后通过重命名替换目标Mod，中途中断不会留下复制了一半的Mod。
+    :param job: 当前任务
+    :param mod_item_path: 源Mod文件夹
+    :param destination_mod_path: 目标Mod文件夹
+    :param action: 动作，'copy' 或 'move'
+    :param delta: 目标已存在时是否增量同步
+    :param use_hash: 增量同步时是否比较内容哈希
+    :param copy_function: 复制单个文件的函数
+    :return: 增量同步的统计信息，没有进行增量同步时返回None
+    """
+    if action == 'copy' and delta and os.path.isdir(destination_mod_path):
+        return sync_mod_tree(job, mod_item_path, destination_mod_path, use_hash, copy_function)
+    if action == 'move' and same_device(mod_item_path, os.path.dirname(destination_mod_path)):
+        # 同一文件系统上移动只是重命名，不需要暂存
+        size, count = get_tree_size(mod_item_path)
+        swap_in(mod_item_path, destination_mod_path)
+        job.advance(size, files=count)
+        return None
+    staging_path = get_staging_path(destination_mod_path)
+    if os.path.exists(staging_path):
+        shutil.rmtree(staging_path)
+    copy_mod_tree(job, mod_item_path, staging_path, copy_function)
+    swap_in(staging_path, destination_mod_path)
+    if action == 'move':
+        # 跨文件系统移动：目标替换完成后才删除源Mod
+        shutil.rmtree(mod_item_path)
+    return None
+
+
+def measure_mods(job, mod_paths):
+    """
+    预先计算需要处理的Mods的大小（并发计算并使用缓存），并以字节为单位设置任务的总工作量
+    :param job: 当前任务
+    :param mod_paths: 源Mod文件夹列表
+    :return: {源Mod文件夹: 字节数}
+    """
+    job.checkpoint()
+    size_cache = get_size_cache()
+    with job.span("measure", mods=len(mod_paths)):
+        sizes = {path: size for path, (size, _) in size_cache.get_sizes(mod_paths).items()}
+        size_cache.save()
+    job.set_total(sum(sizes.values()), UNIT_BYTES)
+    return sizes
+
+
+def scan_mods_job(job, source_directory, batch_size=MOD_BATCH_SIZE):
+    """
+    （在工作线程中运行）流式扫描源目录，每找到一批Mods就通过job.emit交给界面显示
+    :param job: 当前任务
+    :param source_directory: 源目录，多个源目录用mods_index.SOURCE_SEPARATOR分隔
+    :param batch_size: 每批的Mod数量
+    :return: 扫描完成后的索引信息（见mods_index.load_workshop_index），
+             另外包含 "metadata"：{创意工坊ID: {mod名称: mod.info元数据}}
+    """
+    index = {}
+    with job.span("scan"):
+        for batch in iter_mod_batches(source_directory, batch_size, index=index):
+            job.checkpoint()
+            job.emit(batch)
+            job.advance(len(batch))
+            job.count("mods", len(batch))
+    with job.span("metadata"):
+        index["metadata"] = load_index_metadata(index["items"])
+    return index
+
+
+def load_index_metadata(items):
+    """
+    读取索引中所有Mods的mod.info（mod.info没有变化的Mod使用缓存）
+    :param items: 索引中的物品信息 {创意工坊ID: {"root": ..., "mods": [...]}}
+    :return: {创意工坊ID: {mod名称: 元数据}}
+    """
+    mod_paths = {(item, mod): os.path.join(info["root"], item, "mods", mod)
+                 for item, info in items.items() for mod in info["mods"]}
+    catalog = get_mod_catalog()
+    metadata = catalog.get_many(mod_paths.values())
+    catalog.save()
+    result = {}
+    for (item, mod), path in mod_paths.items():
+        if metadata.get(path):
+            result.setdefault(item, {})[mod] = metadata[path]
+    return result
+
+
+def load_metadata_job(job, mod_paths):
+    """
+    （在工作线程中运行）读取多个Mod的mod.info元数据
+    :param job: 当前任务
+    :param mod_paths: {mod名称: Mod文件夹}
+    :return: {mod名称: 元数据}
+    """
+    with job.span("metadata"):
+        return load_mods_metadata(mod_paths)
+
+
+def calculate_mods_size_job(job, mod_paths):
+    """
+    （在工作线程中运行）计算选定Mods的总大小（并发计算并使用缓存）
+    :param job: 当前任务
+    :param mod_paths: 源Mod文件夹列表
+    :return: (总字节数, 文件数)
+    """
+    size_cache = get_size_cache()
+    sizes = size_cache.get_sizes(mod_paths)
+    size_cache.save()
+    return sum(size for size, _ in sizes.values()), sum(count for _, count in sizes.values())
+
+
+def find_first_file(directories):
+    """
+    :param directories: 文件夹列表
+    :return: 第一个找到的普通文件的路径，都没有文件时返回None
+    """
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.isfile(path) and not os.path.islink(path):
+                    return path
+    return None
+
+
+def preflight_disk_space(job, transfers, sizes, destination_directory, action='copy', deploy_mode=DEPLOY_COPY,
+                         store_directory=None):
+    """
+    在写入任何文件之前检查目标磁盘空间是否足够，不足时抛出InsufficientDiskSpace
+    :param job: 当前任务
+    :param transfers: [(源Mod文件夹, 目标Mod文件夹), ...]
+    :param sizes: measure_mods的返回值
+    :param destination_directory: 目标目录
+    :param action: 动作，'copy' 或 'move'（同一磁盘上的移动不占用额外空间）
+    :param deploy_mode: 部署方式，同一磁盘上确认可以使用reflink或硬链接时几乎不占用额外空间
+    :param store_directory: 共享存储目录（deploy_mode为DEPLOY_STORE时）
+    :return: 需要的字节数
+    """
+    if transfers and same_device(transfers[0][0], destination_directory):
+        if action == 'move':
+            return 0
+        if deploy_mode in (DEPLOY_AUTO, DEPLOY_NO_HARDLINK):
+            # 同一磁盘上也可能不支持reflink和硬链接，FileDeployer会改用复制，只有试验成功时才跳过检查
+            source_file = find_first_file(source_path for source_path, _ in transfers)
+            method = source_file and probe_space_free_method(source_file, destination_directory, deploy_mode)
+            if method:
+                job.log(f"目标磁盘支持{method}，不需要额外的磁盘空间")
+                return 0
+    if deploy_mode == DEPLOY_STORE and same_device(store_directory, destination_directory):
+        # 使用共享存储时只有存储中没有的内容占用空间，无法预先估计，跳过检查
+        return 0
+    size_cache = get_size_cache()
+    required = 0
+    for source_path, destination_path in transfers:
+        # 覆盖已存在的Mod时，旧文件占用的空间会被释放或复用
+        existing = size_cache.get_size(destination_path)[0] if os.path.isdir(destination_path) else 0
+        required += max(0, sizes.get(source_path, 0) - existing)
+    free = check_free_space(destination_directory, required)
+    job.log(f"需要写入 {format_size(required)}，目标磁盘剩余 {format_size(free)}")
+    return required
+
+
+def log_delta_stats(job, stats):
+    """
+    输出增量同步的统计信息
+    :param job: 当前任务
+    :param stats: 统计信息字典
+    """
+    job.log(f"增量同步：复制 {stats['copied_files']} 个文件（{format_size(stats['copied_bytes'])}），"
+            f"跳过未变化的 {stats['skipped_files']} 个文件（{format_size(stats['skipped_bytes'])}），"
+            f"删除 {stats['deleted_files']} 个多余文件")
+
+
+def move_or_copy_mods_job(job, source_directory, destination_directory, selected_mods, id_map, action='copy', workers=1,
+                          delta=False, use_hash=False, deploy_mode=DEPLOY_COPY, store_directory=None, verify=False):
+    """
+    （在工作线程中运行）复制或移动选定的Mods到目标目录，并更新mods_info.json
+    :param job: 当前任务
+    :param source_directory: 源目录，多个源目录用mods_index.SOURCE_SEPARATOR分隔
+    :param destination_directory: 目标目录（将Mods复制到的地方）
+    :param selected_mods: 选定的Mods列表
+    :param id_map: Mod与创意工坊ID的映射字典
+    :param action: 动作，'copy' 或 'move'
+    :param workers: 复制线程数，大于1时多个Mod并发复制
+    :param delta: 目标已存在时是否只复制新增或有变化的文件，而不是删除后整个重新复制
+    :param use_hash: 增量同步时是否比较内容哈希（更准确但需要读取文件内容）
+    :param deploy_mode: 部署方式（见mods_deploy），同一磁盘上可以使用reflink或硬链接代替复制
+    :param store_directory: 共享存储目录（deploy_mode为DEPLOY_STORE时使用），为None时使用默认目录
+    :param verify: 复制完成后是否重新读取源文件和目标文件进行校验，只重新复制不一致的文件
+    :return: 已处理的Mods列表
+    """
+    # 恢复上次中断的操作：日志中已经完成的Mods写入mods_info，相同的操作会跳过这些Mods
+    journal = OperationJournal(destination_directory)
+    completed, resumed = journal.open(action, source_directory)
+    mods_info = read_mods_info(destination_directory)
+    for mod, workshop_id in completed.items():
+        set_mod_entry(mods_info, mod, workshop_id)
+    processed = []
+    if resumed:
+        processed = [mod for mod in selected_mods if mod in completed]
+        selected_mods = [mod for mod in selected_mods if mod not in completed]
+        if processed:
+            job.log(f"继续上次没有完成的{action}，跳过已完成的 {len(processed)} 个Mods")
+
+    if deploy_mode == DEPLOY_STORE and action == 'copy':
+        store = ObjectStore(store_directory)
+        store_directory = store.directory
+        deployer = StoreDeployer(job, store)
+        if not same_device(store_directory, destination_directory):
+            job.log(f"共享存储 {store_directory} 与目标目录不在同一个文件系统上，无法使用硬链接，改为普通复制（不存入共享存储）")
+    else:
+        deployer = FileDeployer(job, deploy_mode)
+    stats = new_delta_stats()
+    delta = delta and action == 'copy'
+    verification = None
+    finished = False
+    try:
+        with job.span("id_lookup", mods=len(selected_mods)):
+            source_paths = {mod: get_mod_path(source_directory, id_map[mod], mod) for mod in selected_mods}
+        sizes = measure_mods(job, list(source_paths.values()))
+        with job.span("preflight"):
+            preflight_disk_space(job, [(source_paths[mod], os.path.join(destination_directory, mod))
+                                       for mod in selected_mods if os.path.exists(source_paths[mod])],
+                                 sizes, destination_directory, action, deploy_mode, store_directory)
+        if action == 'copy' and workers > 1:
+            transfers = []
+            for mod in selected_mods:
+                mod_item_path = source_paths[mod]
+                if os.path.exists(mod_item_path):
+                    destination_mod_path = os.path.join(destination_directory, mod)
+                    if not delta or not os.path.isdir(destination_mod_path):
+                        # 先复制到暂存文件夹，完成后再替换目标Mod
+                        staging_path = get_staging_path(destination_mod_path)
+                        if os.path.exists(staging_path):
+                            shutil.rmtree(staging_path)
+                        destination_mod_path = staging_path
+                    transfers.append((mod, mod_item_path, destination_mod_path))
+
+            source_paths = {mod: mod_item_path for mod, mod_item_path, _ in transfers}
+            copied_paths = {mod: destination_mod_path for mod, _, destination_mod_path in transfers}
+
+            def on_mod_done(mod):
+                destination_mod_path = os.path.join(destination_directory, mod)
+                if copied_paths[mod] != destination_mod_path:
+                    swap_in(copied_paths[mod], destination_mod_path)
+                journal.record(mod, id_map.get(mod, ""))
+                job.log(f"已{action} {source_paths[mod]} 到 {destination_mod_path}")
+                set_mod_entry(mods_info, mod, id_map.get(mod, ""))
+                processed.append(mod)
+                job.count("mods")
+                job.count("bytes", sizes.get(source_paths[mod], 0))
+                job.advance(0, mod)
+
+            if delta:
+                # 已存在的目标Mod直接增量写入，每个文件先写入临时文件再替换
+                copy_mods_parallel(job, transfers, on_mod_done, workers, copy_function=replace_file_function(deployer),
+                                   cleanup_incomplete=False,
+                                   file_iterator=lambda src, dst: iter_delta_files(src, dst, stats, use_hash, job))
+            else:
+                copy_mods_parallel(job, transfers, on_mod_done, workers, copy_function=deployer)
+        else:
+            for mod in selected_mods:
+                job.checkpoint()
+                mod_item_path = source_paths[mod]
+                if os.path.exists(mod_item_path):
+                    destination_mod_path = os.path.join(destination_directory, mod)
+                    with job.span(f"{action}_mod", mod=mod):
+                        mod_stats = transfer_mod(job, mod_item_path, destination_mod_path, action, delta, use_hash,
+                                                 deployer)
+                    job.count("mods")
+                    job.count("bytes", sizes.get(mod_item_path, 0))
+                    journal.record(mod, id_map.get(mod, ""))
+                    if mod_stats:
+                        for key, value in mod_stats.items():
+                            stats[key] += value
+                    job.log(f"已{action} {mod_item_path} 到 {destination_mod_path}")
+
+                    # 更新mods_info
+                    set_mod_entry(mods_info, mod, id_map.get(mod, ""))
+                    processed.append(mod)
+                job.advance(0, mod)
+        if verify and processed:
+            if action == 'copy':
+                with job.span("verify", mods=len(processed)):
+                    verification = verify_and_repair(job, [(mod, get_mod_path(source_directory, id_map[mod], mod),
+                                                            os.path.join(destination_directory, mod))
+                                                           for mod in processed],
+                                                     linked_sources=deployer.linked_sources)
+                # 修复后仍然不一致的Mods不记录到mods_info中，下次比较时会显示为缺少
+                for mod in verification["failed"]:
+                    remove_mod_entry(mods_info, mod)
+            else:
+                job.log("移动后源Mods已不存在，跳过校验")
+        finished = True
+    finally:
+        # 即使取消或出错，也保存已经完成的部分；没有完成时保留操作日志，下次可以继续
+        write_mods_info(destination_directory, mods_info)
+        journal.close(finished)
+        deployer.close()
+    if delta:
+        log_delta_stats(job, stats)
+    if action == 'copy':
+        job.log(f"部署方式：{deployer.describe()}")
+    if verification and verification["failed"]:
+        raise VerificationFailed(verification["failed"])
+    return processed
+
+
+def plan_mods_by_id_job(job, source_directory, destination_directory, workshop_ids, action='move'):
+    """
+    （在工作线程中运行）根据创意工坊ID列表生成计划，并计算需要处理的数据量（使用大小缓存），不修改任何文件
+    :param job: 当前任务
+    :param source_directory: 源目录，多个源目录用mods_index.SOURCE_SEPARATOR分隔
+    :param destination_directory: 目标目录
+    :param workshop_ids: 创意工坊ID列表（也可以是Mod名称）
+    :param action: 'move' 或 'copy'
+    :return: 计划（见mods_diff.build_id_plan），另外包含 "size" 和 "files"
+    """
+    with job.span("scan"):
+        items = load_workshop_index(source_directory)["items"]
+    settings = load_conflict_settings()
+    plan = build_id_plan(workshop_ids, items, build_id_map(items, settings["rule"], settings["pins"]),
+                         source_directory, destination_directory, action)
+    mod_paths = [get_mod_path(source_directory, workshop_id, mod) for mod, workshop_id in plan["copy"].items()]
+    job.set_total(len(mod_paths))
+    size_cache = get_size_cache()
+    with job.span("measure", mods=len(mod_paths)):
+        sizes = size_cache.get_sizes(mod_paths)
+        size_cache.save()
+    job.advance(len(mod_paths))
+    plan["size"] = sum(size for size, _ in sizes.values())
+    plan["files"] = sum(count for _, count in sizes.values())
+    return plan
+
+
+def delete_mods_job(job, destination_directory, selected_mods):
+    """
+    （在工作线程中运行）删除目标目录中的选定Mods，并更新mods_info.json
+    :param job: 当前任务
+    :param destination_directory: 目标目录（包含Mods文件夹的目录）
+    :param selected_mods: 选定的Mods列表
+    :return: 已删除的Mods列表
+    """
+    job.set_total(len(selected_mods))
+    deleted = []
+    try:
+        for mod in selected_mods:
+            job.checkpoint()
+            mod_path = os.path.join(destination_directory, mod)
+            if os.path.exists(mod_path):
+                with job.span("delete_mod", mod=mod):
+                    shutil.rmtree(mod_path)  # 删除mods
+                job.count("mods")
+                job.log(f"已删除 {mod_path}")
+            deleted.append(mod)
+            job.advance(1, mod)
+    finally:
+        # 更新mods_info.json
+        json_path = os.path.join(destination_directory, MODS_INFO_FILE_NAME)
+        if os.path.exists(json_path):
+            mods_info = read_mods_info(destination_directory)
+            for mod in deleted:
+                remove_mod_entry(mods_info, mod)
+            write_mods_info(destination_directory, mods_info)
+    return deleted
+
+
+def apply_destination_changes_job(job, destination_directory, added, removed, changed):
+    """
+    （在工作线程中运行）把监视到的目标目录变化写入mods_info.json，只修改变化的Mods，不重新扫描整个目录。
+    mods_info.json不存在时不创建（仍需要先生成）。
+    :param job: 当前任务
+    :param destination_directory: 目标目录（包含Mods文件夹的目录）
+    :param added: 新出现的Mods {mod名称: 创意工坊ID}
+    :param removed: 已经不存在的Mods列表
+    :param changed: 内容有变化的Mods列表，文件数量、大小或修改时间与记录的不同时清除其过期的大小和哈希
+                    （本程序自己写入的Mods也会被报告为有变化，这时保留刚写入的详细信息）
+    :return: 是否修改了mods_info.json
+    """
+    if not os.path.exists(os.path.join(destination_directory, MODS_INFO_FILE_NAME)):
+        return False
+    mods_info = read_mods_info(destination_directory)
+    modified = False
+    for mod in removed:
+        if mod in mods_info["mods"]:
+            remove_mod_entry(mods_info, mod)
+            modified = True
+    for mod, workshop_id in added.items():
+        # 由本程序复制的Mod已经在mods_info中，保留原有信息
+        if mod not in mods_info["mods"]:
+            set_mod_entry(mods_info, mod, workshop_id)
+            modified = True
+    stale = 0
+    for mod in changed:
+        details = mods_info.get("details", {}).get(mod)
+        mod_path = os.path.join(destination_directory, mod)
+        if mod in mods_info["mods"] and details and not details_match(mod_path, details):
+            set_mod_entry(mods_info, mod, mods_info["mods"][mod])
+            stale += 1
+            modified = True
+    if modified:
+        write_mods_info(destination_directory, mods_info)
+        job.log(f"已根据目录变化更新mods_info.json：新增 {len(added)}，删除 {len(removed)}，变化 {stale}")
+    return modified
+
+
+def run_sync_plan_job(job, plan, workers=1, delta=True, use_hash=False, deploy_mode=DEPLOY_COPY, verify=False):
+    """
+    （在工作线程中运行）执行同步计划（见mods_diff.build_sync_plan和build_id_plan）：先复制（或移动）缺少和内容不同的Mods，
+    再把多余的Mods移到回收站。所有Mods在同一个任务中批量处理，共用一次大小计算、空间检查和mods_info.json写入
+    :param job: 当前任务
+    :param plan: 同步计划
+    :param workers: 复制线程数
+    :param delta: 目标已存在时是否只复制有变化的文件
+    :param use_hash: 增量同步时是否比较内容哈希
+    :param deploy_mode: 部署方式（见mods_deploy）
+    :param verify: 复制完成后是否校验
+    :return: {"copied": [...], "deleted": [...]}（删除的Mods移到了回收站，可以撤销）
+    """
+    copied = []
+    deleted = []
+    if plan["copy"]:
+        copied = move_or_copy_mods_job(job, plan["source_directory"], plan["destination_directory"],
+                                       sorted(plan["copy"]), plan["copy"], plan.get("action", 'copy'), workers, delta,
+                                       use_hash, deploy_mode, verify=verify)
+    if plan["delete"]:
+        deleted = trash_mods_job(job, plan["destination_directory"], plan["delete"])["trashed"]
+    for mod, reason in plan["skipped"].items():
+        job.log(f"跳过 {mod}：{reason}")
+    for workshop_id in plan.get("missing", []):
+        job.log(f"源目录中找不到创意工坊ID {workshop_id}")
+    return {"copied": copied, "deleted": deleted}
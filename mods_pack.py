@@ -0,0 +1,359 @@
+import os
+import json
+import time
+import zlib
+import shutil
+import struct
+
+from mods_copy import COPY_CHUNK_SIZE
+from mods_hash import HashCache, hash_files
+from mods_jobs import UNIT_BYTES
+from mods_journal import get_staging_path, recover_staging, swap_in
+from mods_manifest import (MODS_INFO_FILE_NAME, UnsafePathError, build_mod_details, check_mod_name, join_mod_file,
+                           list_mod_files, load_manifest, save_manifest, set_mod_entry)
+
+# Mods包格式：
+#   文件头   HEADER_STRUCT（魔数、索引位置、索引长度），打包完成后回填
+#   数据块   每个Mod一个：BLOCK_STRUCT（块头长度、压缩数据长度）+ 块头JSON + 压缩数据
+#            压缩数据是该Mod所有文件内容按块头中的顺序拼接后的zlib流，小文件可以一起压缩
+#   索引     zlib压缩的JSON：{"format_version", "created", "mods": {mod名称: {"offset", ...}}}
+# 顺序读取时根据每个数据块的块头就可以边读边解压；随机读取时根据文件头找到索引，直接跳到需要的Mod。
+PACK_MAGIC = b"ZDEPACK1"
+PACK_FORMAT_VERSION = 1
+PACK_EXTENSION = ".zdepack"
+HEADER_STRUCT = struct.Struct("<8sQQ")
+BLOCK_STRUCT = struct.Struct("<IQ")
+DEFAULT_COMPRESS_LEVEL = 6
+# 解包时保存mods_info.json的最短间隔（秒）
+MANIFEST_SAVE_INTERVAL = 2.0
+
+
+class PackError(Exception):
+    """Mods包格式错误或不完整"""
+
+
+def _read_exact(file, size):
+    data = file.read(size)
+    if len(data) != size:
+        raise PackError("Mods包不完整")
+    return data
+
+
+def _write_block(job, pack, mod, workshop_id, files, hashes, level):
+    """
+    写入一个Mod的数据块
+    :param files: list_mod_files的返回值（已排序）
+    :param hashes: {绝对路径: 哈希字符串}
+    :return: 索引中的条目
+    """
+    header = {
+        "mod": mod,
+        "workshop_id": workshop_id,
+        "details": build_mod_details(files, hashes),
+        "files": [[rel_path, stat.st_size, stat.st_mtime] for rel_path, _, stat in files],
+    }
+    header_data = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    offset = pack.tell()
+    pack.write(BLOCK_STRUCT.pack(len(header_data), 0))
+    pack.write(header_data)
+    compressor = zlib.compressobj(level)
+    compressed_size = 0
+    buffer = bytearray(COPY_CHUNK_SIZE)
+    view = memoryview(buffer)
+    for rel_path, path, stat in files:
+        # 只读取块头中记录的大小，文件在打包过程中被修改时报错，避免数据与文件列表不一致
+        remaining = stat.st_size
+        with open(path, 'rb') as file:
+            while remaining:
+                length = file.readinto(view[:min(COPY_CHUNK_SIZE, remaining)])
+                if not length:
+                    raise PackError(f"{mod}/{rel_path} 在打包过程中被修改，请重新打包")
+                data = compressor.compress(view[:length])
+                pack.write(data)
+                compressed_size += len(data)
+                remaining -= length
+                job.advance(length)
+                job.checkpoint()
+    data = compressor.flush()
+    pack.write(data)
+    compressed_size += len(data)
+    # 回填压缩数据长度
+    end = pack.tell()
+    pack.seek(offset)
+    pack.write(BLOCK_STRUCT.pack(len(header_data), compressed_size))
+    pack.seek(end)
+    return {"offset": offset, "compressed_size": compressed_size, "workshop_id": workshop_id,
+            "size": header["details"]["size"], "file_count": len(files)}
+
+
+def pack_mods_job(job, pack_path, mods, level=DEFAULT_COMPRESS_LEVEL):
+    """
+    （在工作线程中运行）把多个Mod打包为一个压缩的Mods包
+    :param job: 当前任务
+    :param pack_path: Mods包路径
+    :param mods: [(mod名称, Mod文件夹, 创意工坊ID), ...]
+    :param level: zlib压缩级别
+    :return: {"mods_count", "size", "pack_size"}
+    """
+    mod_files = []
+    for mod, mod_path, workshop_id in mods:
+        job.checkpoint()
+        mod_files.append((mod, workshop_id, sorted(list_mod_files(mod_path))))
+    total = sum(stat.st_size for _, _, files in mod_files for _, _, stat in files)
+    # 进度包括计算哈希（有缓存时很快）和压缩两部分
+    job.set_total(total * 2, UNIT_BYTES)
+    hash_cache = HashCache()
+    index = {"format_version": PACK_FORMAT_VERSION, "created": int(time.time()), "mods": {}}
+    temp_path = pack_path + ".tmp"
+    try:
+        with open(temp_path, 'wb') as pack:
+            pack.write(HEADER_STRUCT.pack(PACK_MAGIC, 0, 0))
+            for mod, workshop_id, files in mod_files:
+                hashes = hash_files([(path, stat) for _, path, stat in files], hash_cache, job=job)
+                index["mods"][mod] = _write_block(job, pack, mod, workshop_id, files, hashes, level)
+                job.advance(0, mod)
+                job.log(f"已打包 {mod}")
+            index_data = zlib.compress(json.dumps(index, ensure_ascii=False).encode('utf-8'))
+            index_offset = pack.tell()
+            pack.write(index_data)
+            pack.seek(0)
+            pack.write(HEADER_STRUCT.pack(PACK_MAGIC, index_offset, len(index_data)))
+        os.replace(temp_path, pack_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        hash_cache.save()
+    pack_size = os.path.getsize(pack_path)
+    job.log(f"Mods包已保存到 {pack_path}，共 {len(mod_files)} 个Mods")
+    return {"mods_count": len(mod_files), "size": total, "pack_size": pack_size}
+
+
+def read_pack_header(file):
+    """
+    读取Mods包的文件头
+    :param file: 以二进制方式打开的Mods包
+    :return: (索引位置, 索引长度)
+    """
+    magic, index_offset, index_length = HEADER_STRUCT.unpack(_read_exact(file, HEADER_STRUCT.size))
+    if magic != PACK_MAGIC:
+        raise PackError("不是Mods包文件")
+    if not index_offset:
+        raise PackError("Mods包没有打包完成")
+    return index_offset, index_length
+
+
+def read_pack_index(pack_path):
+    """
+    读取Mods包的索引（只读取文件头和索引，不读取数据）
+    :param pack_path: Mods包路径
+    :return: 索引字典
+    """
+    with open(pack_path, 'rb') as file:
+        index_offset, index_length = read_pack_header(file)
+        file.seek(index_offset)
+        index = json.loads(zlib.decompress(_read_exact(file, index_length)).decode('utf-8'))
+    if index.get("format_version", 0) > PACK_FORMAT_VERSION:
+        raise PackError("Mods包格式版本过高，请更新程序")
+    return index
+
+
+def _read_block_header(file):
+    header_length, compressed_size = BLOCK_STRUCT.unpack(_read_exact(file, BLOCK_STRUCT.size))
+    header = json.loads(_read_exact(file, header_length).decode('utf-8'))
+    return header, compressed_size
+
+
+def _iter_block_data(file, compressed_size):
+    """
+    边读边解压一个数据块
+    :return: 生成解压后的数据
+    """
+    decompressor = zlib.decompressobj()
+    remaining = compressed_size
+    while remaining:
+        data = _read_exact(file, min(COPY_CHUNK_SIZE, remaining))
+        remaining -= len(data)
+        chunk = decompressor.decompress(data)
+        if chunk:
+            yield chunk
+    chunk = decompressor.flush()
+    if chunk:
+        yield chunk
+    if not decompressor.eof:
+        raise PackError("Mods包数据损坏")
+
+
+def _write_block_files(job, mod_path, entries, chunks):
+    """
+    把解压后的数据按块头中的文件列表切分并写入Mod文件夹
+    :param mod_path: Mod文件夹
+    :param entries: 块头中的文件列表 [[相对路径, 大小, 修改时间], ...]
+    :param chunks: 解压后的数据
+    """
+    entries = iter(entries)
+    out = None
+    entry = None
+    remaining = 0
+
+    def open_entry(entry):
+        path = join_mod_file(mod_path, entry[0])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return open(path, 'wb')
+
+    def close_entry(out, entry):
+        out.close()
+        os.utime(out.name, (entry[2], entry[2]))
+        job.advance(0, files=1)
+
+    for chunk in chunks:
+        view = memoryview(chunk)
+        while len(view):
+            while out is None or remaining == 0:
+                if out is not None:
+                    close_entry(out, entry)
+                entry = next(entries, None)
+                if entry is None:
+                    raise PackError("Mods包数据与文件列表不一致")
+                out = open_entry(entry)
+                remaining = entry[1]
+            length = min(remaining, len(view))
+            out.write(view[:length])
+            view = view[length:]
+            remaining -= length
+            job.advance(length)
+        job.checkpoint()
+    if out is not None:
+        close_entry(out, entry)
+    if remaining:
+        raise PackError("Mods包数据与文件列表不一致")
+    # 剩下的只能是空文件
+    for entry in entries:
+        if entry[1]:
+            raise PackError("Mods包数据与文件列表不一致")
+        close_entry(open_entry(entry), entry)
+
+
+def check_pack_paths(mod, rel_paths):
+    """
+    检查Mods包中的Mod名称和文件路径（Mods包可能来自其他人，不能写入目标目录以外的位置）
+    :param mod: Mod名称
+    :param rel_paths: 文件相对路径列表
+    :return: Mod名称，不安全时抛出PackError
+    """
+    try:
+        check_mod_name(mod)
+        for rel_path in rel_paths:
+            join_mod_file(mod, rel_path)
+    except UnsafePathError as e:
+        raise PackError(f"Mods包包含目标目录以外的路径：{e}")
+    return mod
+
+
+def _extract_block(job, file, destination_directory):
+    """
+    从当前位置读取一个数据块，解压到暂存文件夹后替换目标Mod
+    :return: 块头
+    """
+    header, compressed_size = _read_block_header(file)
+    destination_mod_path = os.path.join(destination_directory, check_pack_paths(header["mod"],
+                                                                                  [entry[0] for entry in header["files"]]))
+    staging_path = get_staging_path(destination_mod_path)
+    if os.path.exists(staging_path):
+        shutil.rmtree(staging_path)
+    os.makedirs(staging_path)
+    try:
+        _write_block_files(job, staging_path, header["files"], _iter_block_data(file, compressed_size))
+    except BaseException:
+        shutil.rmtree(staging_path, ignore_errors=True)
+        raise
+    swap_in(staging_path, destination_mod_path)
+    return header
+
+
+def unpack_pack_job(job, pack_path, destination_directory, mods=None):
+    """
+    （在工作线程中运行）把Mods包解压到目标目录：每个Mod先解压到暂存文件夹再替换，并随时更新mods_info.json。
+    解压全部Mods时按顺序流式读取整个文件；只解压部分Mods时通过索引直接跳到对应的数据块。
+    :param job: 当前任务
+    :param pack_path: Mods包路径
+    :param destination_directory: 目标目录
+    :param mods: 需要解压的Mod名称列表，为None时解压全部
+    :return: 已解压的Mods列表
+    """
+    os.makedirs(destination_directory, exist_ok=True)
+    recover_staging(destination_directory)
+    index = read_pack_index(pack_path)
+    if mods is not None:
+        missing = [mod for mod in mods if mod not in index["mods"]]
+        if missing:
+            raise PackError(f"Mods包中没有这些Mods：{', '.join(missing)}")
+    selected = list(index["mods"]) if mods is None else list(mods)
+    job.set_total(sum(index["mods"][mod]["size"] for mod in selected), UNIT_BYTES)
+
+    json_path = os.path.join(destination_directory, MODS_INFO_FILE_NAME)
+    mods_info = load_manifest(json_path)
+    extracted = []
+    last_save = time.monotonic()
+    try:
+        with open(pack_path, 'rb') as file:
+            index_offset, _ = read_pack_header(file)
+            if mods is None:
+                offsets = None
+            else:
+                offsets = sorted(index["mods"][mod]["offset"] for mod in selected)
+            while True:
+                if offsets is not None:
+                    if not offsets:
+                        break
+                    file.seek(offsets.pop(0))
+                elif file.tell() >= index_offset:
+                    break
+                job.checkpoint()
+                header = _extract_block(job, file, destination_directory)
+                set_mod_entry(mods_info, header["mod"], header["workshop_id"], header["details"])
+                extracted.append(header["mod"])
+                job.advance(0, header["mod"])
+                job.log(f"已解压 {header['mod']}")
+                if time.monotonic() - last_save >= MANIFEST_SAVE_INTERVAL:
+                    save_manifest(json_path, mods_info)
+                    last_save = time.monotonic()
+    finally:
+        save_manifest(json_path, mods_info)
+        recover_staging(destination_directory)
+    return extracted
+
+
+def read_pack_file(pack_path, mod, rel_path):
+    """
+    从Mods包中读取单个文件（只读取该Mod的数据块，读到该文件为止）
+    :param pack_path: Mods包路径
+    :param mod: Mod名称
+    :param rel_path: 文件在Mod中的相对路径（'/'分隔）
+    :return: 文件内容
+    """
+    check_pack_paths(mod, [rel_path])
+    index = read_pack_index(pack_path)
+    if mod not in index["mods"]:
+        raise PackError(f"Mods包中没有 {mod}")
+    with open(pack_path, 'rb') as file:
+        file.seek(index["mods"][mod]["offset"])
+        header, compressed_size = _read_block_header(file)
+        start = 0
+        for entry_path, size, _ in header["files"]:
+            if entry_path == rel_path:
+                break
+            start += size
+        else:
+            raise PackError(f"{mod} 中没有 {rel_path}")
+        end = start + size
+        data = bytearray()
+        position = 0
+        for chunk in _iter_block_data(file, compressed_size):
+            if position + len(chunk) > start:
+                data += chunk[max(0, start - position):end - position]
+            position += len(chunk)
+            if position >= end:
+                break
+        return bytes(data)
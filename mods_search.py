@@ -0,0 +1,120 @@
+import itertools
+
+# 子串索引使用的n-gram长度，更短的搜索词直接在上一次的结果或全部条目中查找
+GRAM_SIZE = 3
+
+
+def iter_grams(text):
+    """
+    :param text: 文本（已转换为小写）
+    :return: 生成文本中所有长度为GRAM_SIZE的子串
+    """
+    for start in range(len(text) - GRAM_SIZE + 1):
+        yield text[start:start + GRAM_SIZE]
+
+
+class ModSearchIndex:
+    """
+    Mod名称和创意工坊ID的搜索索引，支持逐个增加和删除条目。
+    搜索时不区分大小写，名称以搜索词开头的条目排在前面，其余按加入的顺序排列。
+    长度不少于GRAM_SIZE的搜索词先通过三元组索引取交集得到候选条目；
+    在上一次的搜索词后继续输入时只在上一次的结果中查找。
+    """
+
+    def __init__(self):
+        # 名称 -> (加入顺序, 搜索用的小写文本)
+        self._entries = {}
+        self._grams = {}
+        self._counter = itertools.count()
+        self._version = 0
+        self._last = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def names(self):
+        """
+        :return: 所有名称（按加入的顺序）
+        """
+        return list(self._entries)
+
+    def add(self, name, workshop_id="", extra=""):
+        """
+        加入或更新一个条目（已存在的条目保留原来的位置）
+        :param name: Mod名称
+        :param workshop_id: 创意工坊ID，也可以用来搜索
+        :param extra: 其他可以用来搜索的文本（例如mod.info中的名称和ID）
+        """
+        key = f"{name}\0{workshop_id}\0{extra}".lower() if extra else f"{name}\0{workshop_id}".lower()
+        entry = self._entries.get(name)
+        if entry is not None:
+            if entry[1] == key:
+                return
+            self._remove_grams(name, entry[1])
+            order = entry[0]
+        else:
+            order = next(self._counter)
+        self._entries[name] = (order, key)
+        for gram in set(iter_grams(key)):
+            self._grams.setdefault(gram, set()).add(name)
+        self._version += 1
+
+    def remove(self, name):
+        """
+        删除一个条目（不存在时忽略）
+        :param name: Mod名称
+        """
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            self._remove_grams(name, entry[1])
+            self._version += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._grams.clear()
+        self._version += 1
+
+    def _remove_grams(self, name, key):
+        for gram in set(iter_grams(key)):
+            names = self._grams.get(gram)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self._grams[gram]
+
+    def matches(self, name, query):
+        """
+        :return: 条目是否与搜索词匹配（条目不存在时为False）
+        """
+        entry = self._entries.get(name)
+        return entry is not None and query.strip().lower() in entry[1]
+
+    def search(self, query):
+        """
+        :param query: 搜索词（匹配名称或创意工坊ID的任意部分）
+        :return: 匹配的名称列表，名称以搜索词开头的排在前面
+        """
+        query = query.strip().lower()
+        if not query:
+            return list(self._entries)
+        last = self._last
+        if last and last[0] == self._version and last[1] in query:
+            # 继续输入时结果只会变少，在上一次的结果中查找即可
+            candidates = last[2]
+        elif len(query) >= GRAM_SIZE:
+            gram_sets = sorted((self._grams.get(gram, ()) for gram in set(iter_grams(query))), key=len)
+            candidates = set(gram_sets[0]).intersection(*gram_sets[1:])
+            candidates = sorted(candidates, key=lambda name: self._entries[name][0])
+        else:
+            candidates = self._entries
+        entries = self._entries
+        matched = [name for name in candidates if query in entries[name][1]]
+        self._last = (self._version, query, matched)
+        prefix = [name for name in matched if entries[name][1].startswith(query)]
+        if not prefix or len(prefix) == len(matched):
+            return list(matched)
+        prefix_set = set(prefix)
+        return prefix + [name for name in matched if name not in prefix_set]
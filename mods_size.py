@@ -0,0 +1,152 @@
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from mods_cache import get_cache_directory, load_json, save_json
+from mods_copy import format_size
+
+DEFAULT_SIZE_WORKERS = 8
+# 预留的磁盘空间（字节），复制后至少保留这么多空闲空间
+DISK_SPACE_RESERVE = 64 * 1024 * 1024
+
+
+class InsufficientDiskSpace(Exception):
+    """目标磁盘空间不足"""
+
+    def __init__(self, directory, required, free):
+        self.directory = directory
+        self.required = required
+        self.free = free
+        super().__init__(f"目标磁盘空间不足：需要 {format_size(required)}，{directory} 所在磁盘只剩 {format_size(free)}")
+
+
+def scan_tree_size(path, prefix=""):
+    """
+    使用os.scandir计算文件夹的总大小，同时记录每个子文件夹的修改时间
+    :param path: 文件夹路径
+    :param prefix: 相对路径前缀
+    :return: (总字节数, 文件数, {相对文件夹路径: 修改时间})
+    """
+    total = 0
+    count = 0
+    dirs = {prefix: os.stat(path).st_mtime_ns}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                sub_total, sub_count, sub_dirs = scan_tree_size(entry.path, prefix + entry.name + "/")
+                total += sub_total
+                count += sub_count
+                dirs.update(sub_dirs)
+            else:
+                total += entry.stat().st_size
+                count += 1
+    return total, count, dirs
+
+
+class SizeCache:
+    """
+    Mod大小缓存。每个Mod记录总大小、文件数以及所有子文件夹的修改时间，
+    只要这些文件夹的修改时间都没有变化（没有新增、删除或替换文件），就直接使用缓存的大小，
+    校验时只需要stat文件夹而不需要遍历所有文件。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_cache_directory(), "size_cache.json")
+        self._lock = threading.Lock()
+        self._entries = load_json(self.path, {}) if self.path else {}
+        self._dirty = False
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def _is_valid(self, path, entry):
+        for rel_path, mtime in entry["dirs"].items():
+            try:
+                if os.stat(os.path.join(path, rel_path)).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def get_size(self, path):
+        """
+        获取文件夹大小，优先使用缓存
+        :param path: 文件夹路径
+        :return: (总字节数, 文件数)，文件夹不存在时返回 (0, 0)
+        """
+        key = self._key(path)
+        entry = self._entries.get(key)
+        if entry and self._is_valid(path, entry):
+            return entry["size"], entry["files"]
+        try:
+            size, files, dirs = scan_tree_size(path)
+        except OSError:
+            return 0, 0
+        with self._lock:
+            self._entries[key] = {"size": size, "files": files, "dirs": dirs}
+            self._dirty = True
+        return size, files
+
+    def get_sizes(self, paths, workers=DEFAULT_SIZE_WORKERS):
+        """
+        并发获取多个文件夹的大小
+        :param paths: 文件夹路径列表
+        :param workers: 线程数
+        :return: {路径: (总字节数, 文件数)}
+        """
+        paths = list(dict.fromkeys(paths))
+        if len(paths) <= 1 or workers <= 1:
+            return {path: self.get_size(path) for path in paths}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mods-size") as pool:
+            return dict(zip(paths, pool.map(self.get_size, paths)))
+
+    def save(self):
+        """
+        保存缓存到磁盘（没有变化时不写入）
+        """
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            save_json(self.path, self._entries)
+            self._dirty = False
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_size_cache():
+    """
+    :return: 进程内共享的SizeCache对象
+    """
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = SizeCache()
+        return _shared_cache
+
+
+def same_device(path_a, path_b):
+    """
+    判断两个路径是否在同一个文件系统上（此时移动只是重命名，不占用额外空间）
+    """
+    try:
+        return os.stat(path_a).st_dev == os.stat(path_b).st_dev
+    except OSError:
+        return False
+
+
+def check_free_space(directory, required, reserve=DISK_SPACE_RESERVE):
+    """
+    检查目录所在磁盘是否有足够的空闲空间，不足时抛出InsufficientDiskSpace
+    :param directory: 目标目录
+    :param required: 需要写入的字节数
+    :param reserve: 额外预留的字节数
+    :return: 磁盘空闲字节数
+    """
+    free = shutil.disk_usage(directory).free
+    if required > 0 and required + reserve > free:
+        raise InsufficientDiskSpace(directory, required, free)
+    return free
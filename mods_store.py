@@ -0,0 +1,216 @@
+import os
+import time
+import shutil
+import threading
+import uuid
+
+from mods_cache import get_cache_directory
+from mods_copy import copy_file_with_progress, format_size
+from mods_deploy import METHOD_BUFFERED, METHOD_HARDLINK
+from mods_hash import HashCache
+from mods_size import same_device
+
+# 共享存储中的对象按内容哈希（与mods_hash相同的BLAKE2b）保存，前两位作为子目录
+OBJECTS_DIRECTORY_NAME = "objects"
+TEMP_DIRECTORY_NAME = "tmp"
+# 垃圾回收时跳过最近创建或链接的对象和临时文件（秒）：正在部署的任务可能刚把对象加入存储、还没有创建硬链接，
+# 或者正在写入临时文件
+GC_GRACE_PERIOD = 3600
+
+
+def get_default_store_directory():
+    """
+    :return: 默认的共享存储目录（缓存目录下的store）。目标目录必须与共享存储在同一个文件系统上才能使用硬链接
+    """
+    return get_cache_directory("store")
+
+
+class ObjectStore:
+    """
+    内容寻址的共享存储：相同内容的文件只保存一份，目标目录中的Mod文件是指向存储对象的硬链接。
+    对象的链接数为1时说明已经没有任何Mod使用它，可以被垃圾回收，不需要扫描各个目标目录。
+    """
+
+    def __init__(self, directory=None):
+        self.directory = os.path.abspath(directory or get_default_store_directory())
+        self.objects_directory = os.path.join(self.directory, OBJECTS_DIRECTORY_NAME)
+        self.temp_directory = os.path.join(self.directory, TEMP_DIRECTORY_NAME)
+        os.makedirs(self.objects_directory, exist_ok=True)
+        os.makedirs(self.temp_directory, exist_ok=True)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_directory, digest[:2], digest[2:])
+
+    def add(self, source_file, digest):
+        """
+        把文件加入共享存储（已经存在相同内容的对象时不复制）。先复制到临时文件再重命名，多个线程同时加入同一个对象也是安全的。
+        :param source_file: 文件路径
+        :param digest: 文件内容的哈希
+        :return: (对象路径, 是否新加入)
+        """
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            return path, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = os.path.join(self.temp_directory, uuid.uuid4().hex)
+        try:
+            shutil.copy2(source_file, temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return path, True
+
+    def iter_objects(self):
+        """
+        :return: 生成 (对象路径, os.stat_result)
+        """
+        with os.scandir(self.objects_directory) as prefixes:
+            for prefix in prefixes:
+                if not prefix.is_dir():
+                    continue
+                with os.scandir(prefix.path) as entries:
+                    for entry in entries:
+                        yield entry.path, entry.stat()
+
+    def report(self):
+        """
+        统计共享存储的使用情况
+        :return: {"objects", "stored_bytes", "referenced_bytes", "saved_bytes", "unreferenced_objects", "unreferenced_bytes"}
+                 referenced_bytes为所有目标目录中链接到存储的文件总大小，saved_bytes为与每个Mod单独复制相比节省的空间
+        """
+        result = {"objects": 0, "stored_bytes": 0, "referenced_bytes": 0, "saved_bytes": 0,
+                  "unreferenced_objects": 0, "unreferenced_bytes": 0}
+        for _, stat in self.iter_objects():
+            # 存储本身占一个链接
+            links = stat.st_nlink - 1
+            result["objects"] += 1
+            result["stored_bytes"] += stat.st_size
+            result["referenced_bytes"] += stat.st_size * links
+            if links == 0:
+                result["unreferenced_objects"] += 1
+                result["unreferenced_bytes"] += stat.st_size
+        result["saved_bytes"] = result["referenced_bytes"] - (result["stored_bytes"] - result["unreferenced_bytes"])
+        return result
+
+    def collect_garbage(self, job=None, grace_period=GC_GRACE_PERIOD):
+        """
+        删除没有任何Mod使用的对象（链接数为1）以及中断留下的临时文件。
+        最近grace_period秒内创建、链接或写入过的对象和临时文件属于可能正在进行的部署，不会删除。
+        :param job: 当前任务（可选），用于响应取消
+        :param grace_period: 跳过最近变化的对象和临时文件的时间（秒）
+        :return: (删除的对象数, 释放的字节数)
+        """
+        # 对象的修改时间是源文件的修改时间，加入存储和创建硬链接只会更新ctime
+        cutoff = time.time() - grace_period
+        count = 0
+        freed = 0
+        for path, stat in self.iter_objects():
+            if job:
+                job.checkpoint()
+            if stat.st_nlink <= 1 and max(stat.st_mtime, stat.st_ctime) < cutoff:
+                os.remove(path)
+                count += 1
+                freed += stat.st_size
+        with os.scandir(self.temp_directory) as entries:
+            for entry in entries:
+                stat = entry.stat()
+                if max(stat.st_mtime, stat.st_ctime) < cutoff:
+                    os.remove(entry.path)
+        return count, freed
+
+
+class StoreDeployer:
+    """
+    使用共享存储部署文件：计算文件哈希，把内容加入共享存储，再在目标位置创建指向存储对象的硬链接。
+    目标目录与共享存储不在同一个文件系统上时直接从源文件普通复制，不加入共享存储（否则每个文件都要写入两个磁盘）。
+    可以直接作为copy_function使用，签名为 deployer(src, dst)。
+    linked_sources记录链接到共享存储的源文件（与FileDeployer相同），复制后的校验跳过它们。
+    """
+
+    def __init__(self, job, store, hash_cache=None):
+        self.job = job
+        self.store = store
+        self.hash_cache = hash_cache if hash_cache is not None else HashCache()
+        self.counts = {}
+        self.added_bytes = 0
+        self.linked_sources = set()
+        self._link_supported = {}
+        self._lock = threading.Lock()
+
+    def _can_link(self, destination_file):
+        directory = os.path.dirname(destination_file)
+        with self._lock:
+            supported = self._link_supported.get(directory)
+        if supported is None:
+            supported = same_device(directory, self.store.directory)
+            with self._lock:
+                self._link_supported[directory] = supported
+        return supported
+
+    def __call__(self, src, dst):
+        self.job.checkpoint()
+        # 目标文件可能是指向旧对象的硬链接，先删除，不能直接覆盖写入
+        if os.path.lexists(dst):
+            os.remove(dst)
+        if not self._can_link(dst):
+            copy_file_with_progress(self.job, src, dst)
+            self._record(METHOD_BUFFERED, src, False, 0)
+            return dst
+        stat = os.stat(src)
+        digest = self.hash_cache.hash(src, stat)
+        object_path, added = self.store.add(src, digest)
+        method = METHOD_HARDLINK
+        try:
+            os.link(object_path, dst)
+        except OSError:
+            method = METHOD_BUFFERED
+            shutil.copy2(object_path, dst)
+        self._record(method, src, added, stat.st_size)
+        self.job.advance(stat.st_size, files=1)
+        return dst
+
+    def _record(self, method, src, added, size):
+        with self._lock:
+            self.counts[method] = self.counts.get(method, 0) + 1
+            if method == METHOD_HARDLINK:
+                self.linked_sources.add(src)
+            if added:
+                self.added_bytes += size
+
+    def describe(self):
+        """
+        :return: 部署情况的描述
+        """
+        with self._lock:
+            methods = "，".join(f"{method} {count} 个文件" for method, count in self.counts.items()) or "没有复制文件"
+        return f"共享存储（{methods}，新存入 {format_size(self.added_bytes)}）"
+
+    def close(self):
+        self.hash_cache.save()
+
+
+def store_report_job(job, store_directory=None):
+    """
+    （在工作线程中运行）统计共享存储的使用情况
+    :param job: 当前任务
+    :param store_directory: 共享存储目录，为None时使用默认目录
+    :return: 见ObjectStore.report
+    """
+    return ObjectStore(store_directory).report()
+
+
+def store_gc_job(job, store_directory=None):
+    """
+    （在工作线程中运行）清理共享存储中不再使用的对象
+    :param job: 当前任务
+    :param store_directory: 共享存储目录，为None时使用默认目录
+    :return: 清理后的统计信息（见ObjectStore.report），另加 "removed_objects" 和 "freed_bytes"
+    """
+    store = ObjectStore(store_directory)
+    count, freed = store.collect_garbage(job)
+    job.log(f"已删除 {count} 个不再使用的对象")
+    result = store.report()
+    result["removed_objects"] = count
+    result["freed_bytes"] = freed
+    return result
@@ -0,0 +1,425 @@
+import os
+import re
+import json
+import time
+import shutil
+import threading
+import http.client
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mods_hash import HashCache, hash_file, hash_files
+from mods_jobs import JobCancelled, UNIT_BYTES
+from mods_journal import INTERNAL_PREFIX, is_internal_name
+from mods_manifest import (MODS_INFO_FILE_NAME, UnsafePathError, check_mod_name, generate_manifest, join_mod_file,
+                           list_mod_files, load_manifest, save_manifest, set_mod_entry)
+from mods_trash import trash_mods_job
+
+DEFAULT_PORT = 8765
+DEFAULT_DOWNLOAD_WORKERS = 4
+# 下载时每次读取的字节数，每读取一块报告一次进度
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# 服务端重新扫描目录生成清单的最短间隔（秒）
+MANIFEST_TTL = 10.0
+HTTP_TIMEOUT = 30
+# 获取清单的超时时间（秒）：服务端第一次生成清单时需要计算目标目录中所有文件的哈希
+MANIFEST_TIMEOUT = 600
+# 连接断开时的重试次数（从已下载的位置继续）
+MAX_RETRIES = 3
+# 下载中的文件保存在目标目录的这个文件夹中，中断后可以继续下载
+DOWNLOAD_DIRECTORY_NAME = INTERNAL_PREFIX + "download"
+PART_SUFFIX = ".part"
+# 服务端文件下载地址的前缀
+FILES_PREFIX = "/files/"
+
+RANGE_PATTERN = re.compile(r"bytes=(\d+)-(\d*)$")
+
+
+class SyncError(Exception):
+    """同步失败（服务端返回错误、清单不完整或下载的文件校验失败）"""
+
+
+class ModsServer(ThreadingHTTPServer):
+    """
+    提供目标目录中的Mods和清单的HTTP服务端。
+    GET /mods_info.json 返回包含每个文件哈希的清单，GET /files/<mod>/<相对路径> 返回文件内容（支持Range请求）。
+    """
+    daemon_threads = True
+
+    def __init__(self, address, mods_directory):
+        super().__init__(address, ModsRequestHandler)
+        self.mods_directory = os.path.abspath(mods_directory)
+        self.hash_cache = HashCache()
+        self._manifest = None
+        self._manifest_time = 0.0
+        self._lock = threading.Lock()
+
+    def get_manifest_bytes(self):
+        """
+        :return: 清单的JSON字节串。清单在MANIFEST_TTL秒内只生成一次，文件哈希通过HashCache缓存
+        """
+        with self._lock:
+            if self._manifest is None or time.monotonic() - self._manifest_time > MANIFEST_TTL:
+                id_map = load_manifest(os.path.join(self.mods_directory, MODS_INFO_FILE_NAME))["mods"]
+                manifest = generate_manifest(self.mods_directory, id_map, include_files=True, cache=self.hash_cache)
+                self._manifest = json.dumps(manifest, ensure_ascii=False).encode('utf-8')
+                self._manifest_time = time.monotonic()
+            return self._manifest
+
+    def resolve_file(self, mod, rel_path):
+        """
+        把请求中的Mod名称和相对路径转换为本地文件路径，拒绝访问Mods以外的文件
+        :return: 文件路径，不存在或不允许访问时返回None
+        """
+        if not mod or is_internal_name(mod) or mod in (".", ".."):
+            return None
+        mod_path = os.path.join(self.mods_directory, mod)
+        path = os.path.realpath(os.path.join(mod_path, *rel_path.split("/")))
+        if not path.startswith(os.path.realpath(mod_path) + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+
+class ModsRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1：客户端可以在同一个连接上连续下载多个文件
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        if path == "/" + MODS_INFO_FILE_NAME:
+            body = self.server.get_manifest_bytes()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif path.startswith(FILES_PREFIX) and "/" in path[len(FILES_PREFIX):]:
+            mod, rel_path = path[len(FILES_PREFIX):].split("/", 1)
+            file_path = self.server.resolve_file(mod, rel_path)
+            if file_path is None:
+                self.send_error(404)
+            else:
+                self.send_file(file_path)
+        else:
+            self.send_error(404)
+
+    def send_file(self, path):
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = RANGE_PATTERN.match(self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            if match.group(2):
+                end = min(int(match.group(2)), size - 1)
+            if start >= size and size > 0:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        length = max(0, end - start + 1)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        with open(path, 'rb') as file:
+            file.seek(start)
+            while length > 0:
+                chunk = file.read(min(DOWNLOAD_CHUNK_SIZE, length))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                length -= len(chunk)
+
+
+def serve_mods(mods_directory, host="0.0.0.0", port=DEFAULT_PORT):
+    """
+    启动服务端并一直运行，直到按下Ctrl+C
+    :param mods_directory: 提供下载的Mods目录（目标目录）
+    :param host: 监听地址
+    :param port: 监听端口
+    """
+    with ModsServer((host, port), mods_directory) as server:
+        print(f"正在提供 {server.mods_directory} 中的Mods：http://{host}:{server.server_address[1]}/")
+        # 在后台预先生成清单（第一次需要计算所有文件的哈希），客户端的第一次请求不需要等待太久
+        threading.Thread(target=server.get_manifest_bytes, name="mods-manifest-warmup", daemon=True).start()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.hash_cache.save()
+
+
+class ModsServerClient:
+    """
+    同步服务端的客户端。每个线程复用一个保持连接（keep-alive）的HTTP连接，连接断开时自动重连。
+    """
+
+    def __init__(self, url, timeout=HTTP_TIMEOUT):
+        parts = urllib.parse.urlsplit(url if "://" in url else "http://" + url)
+        if parts.scheme not in ("http", "https"):
+            raise SyncError(f"不支持的地址：{url}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self, renew=False):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and renew:
+            connection.close()
+            connection = None
+        if connection is None:
+            connection_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            connection = connection_class(self.host, self.port, timeout=self.timeout)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def request(self, path, headers=None, timeout=None):
+        """
+        发送GET请求，连接已被服务端关闭时重连一次
+        :param path: 路径（不包含基础地址）
+        :param headers: 请求头
+        :param timeout: 这个请求的超时时间（秒），为None时使用创建客户端时的设置
+        :return: http.client.HTTPResponse，调用方需要读完响应内容后才能发送下一个请求
+        """
+        url = self.base_path + urllib.parse.quote(path)
+        for attempt in range(2):
+            connection = self._connection(renew=attempt > 0)
+            connection.timeout = timeout or self.timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(connection.timeout)
+            try:
+                connection.request("GET", url, headers=headers or {})
+                return connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if attempt:
+                    raise
+
+    def get_manifest(self):
+        """
+        :return: 服务端的清单
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = self.request("/" + MODS_INFO_FILE_NAME, timeout=MANIFEST_TIMEOUT)
+                body = response.read()
+                break
+            except (OSError, http.client.HTTPException):
+                if attempt == MAX_RETRIES:
+                    raise
+                self._connection(renew=True)
+        if response.status != 200:
+            raise SyncError(f"获取清单失败：HTTP {response.status}")
+        return json.loads(body.decode('utf-8'))
+
+    def download(self, job, mod, rel_path, part_path, size):
+        """
+        下载一个文件到part_path，part_path已存在时从已下载的位置继续
+        :param job: 当前任务
+        :param mod: Mod名称
+        :param rel_path: 文件在Mod中的相对路径（'/'分隔）
+        :param part_path: 下载中的文件路径
+        :param size: 文件大小
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else None
+            if offset == size:
+                return
+            offset = offset or 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            try:
+                response = self.request(f"{FILES_PREFIX}{mod}/{rel_path}", headers)
+                if response.status not in (200, 206):
+                    response.read()
+                    raise SyncError(f"下载 {mod}/{rel_path} 失败：HTTP {response.status}")
+                if response.status == 200 and offset:
+                    # 服务端不支持Range，从头下载
+                    job.advance(-offset)
+                    offset = 0
+                with open(part_path, 'ab' if offset else 'wb') as file:
+                    while True:
+                        chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        file.write(chunk)
+                        job.advance(len(chunk))
+                        job.checkpoint()
+                return
+            except (OSError, http.client.HTTPException):
+                if attempt == MAX_RETRIES:
+                    raise
+                self._connection(renew=True)
+            except JobCancelled:
+                # 响应没有读完，这个连接不能再使用
+                self._connection(renew=True)
+                raise
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+
+def plan_sync(remote_manifest, destination_directory, hash_cache=None, mods=None):
+    """
+    比较服务端清单和本地文件，找出需要下载和删除的文件。大小不同的文件直接判定为有变化，大小相同时比较哈希。
+    :param remote_manifest: 服务端清单（必须包含每个文件的信息）
+    :param destination_directory: 本地Mods目录
+    :param hash_cache: HashCache对象
+    :param mods: 只同步这些Mods，为None时同步服务端的所有Mods
+    :return: {"download": [(mod, 相对路径, 大小, 修改时间, 哈希), ...], "delete": [(mod, 相对路径), ...],
+              "unchanged": [mod, ...]}
+    """
+    details = remote_manifest.get("details", {})
+    candidates = []
+    plan = {"download": [], "delete": [], "unchanged": []}
+    for mod in sorted(remote_manifest["mods"] if mods is None else mods):
+        remote_files = details.get(mod, {}).get("files")
+        if remote_files is None:
+            raise SyncError(f"服务端清单没有记录 {mod} 的文件信息")
+        # 清单来自网络，写入任何文件之前先确认所有路径都在本地Mods目录中
+        try:
+            mod_path = os.path.join(destination_directory, check_mod_name(mod))
+            for rel_path in remote_files:
+                join_mod_file(mod_path, rel_path)
+        except UnsafePathError as e:
+            raise SyncError(f"服务端清单包含Mods目录以外的路径：{e}")
+        local_files = {rel_path: (path, stat) for rel_path, path, stat in list_mod_files(mod_path)} \
+            if os.path.isdir(mod_path) else {}
+        for rel_path, (size, mtime, digest) in remote_files.items():
+            local = local_files.get(rel_path)
+            if local is not None and local[1].st_size == size:
+                candidates.append((mod, rel_path, size, mtime, digest, local))
+            else:
+                plan["download"].append((mod, rel_path, size, mtime, digest))
+        plan["delete"].extend((mod, rel_path) for rel_path in sorted(local_files.keys() - remote_files.keys()))
+
+    hashes = hash_files([local for *_, local in candidates], hash_cache)
+    for mod, rel_path, size, mtime, digest, (path, _) in candidates:
+        if hashes[path] != digest:
+            plan["download"].append((mod, rel_path, size, mtime, digest))
+    changed = {mod for mod, *_ in plan["download"]} | {mod for mod, _ in plan["delete"]}
+    plan["unchanged"] = sorted(mod for mod in (remote_manifest["mods"] if mods is None else mods) if mod not in changed)
+    return plan
+
+
+def remove_empty_directories(directory, mod_path):
+    """
+    删除文件后，从文件所在的文件夹开始向上删除空文件夹，直到Mod文件夹（不删除Mod文件夹本身）
+    :param directory: 被删除文件所在的文件夹
+    :param mod_path: Mod文件夹
+    """
+    mod_path = os.path.abspath(mod_path)
+    directory = os.path.abspath(directory)
+    while directory != mod_path and directory.startswith(mod_path + os.sep):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            return  # 文件夹不是空的
+        directory = os.path.dirname(directory)
+
+
+def sync_from_server_job(job, url, destination_directory, workers=DEFAULT_DOWNLOAD_WORKERS, prune=False):
+    """
+    （在工作线程中运行）从服务端同步Mods：获取清单，只下载缺少或有变化的文件，删除多余的文件，并更新本地mods_info.json。
+    下载中断后再次运行会从已下载的位置继续。
+    :param job: 当前任务
+    :param url: 服务端地址，例如 http://192.168.1.10:8765
+    :param destination_directory: 本地Mods目录
+    :param workers: 并发下载的线程数（每个线程使用一个保持连接）
+    :param prune: 是否把服务端没有的本地Mods移到回收站
+    :return: {"downloaded", "downloaded_bytes", "deleted", "updated_mods", "removed_mods"}
+    """
+    os.makedirs(destination_directory, exist_ok=True)
+    client = ModsServerClient(url)
+    hash_cache = HashCache()
+    try:
+        remote_manifest = client.get_manifest()
+        job.log(f"服务端共有 {len(remote_manifest['mods'])} 个Mods")
+        plan = plan_sync(remote_manifest, destination_directory, hash_cache)
+        downloads = plan["download"]
+        total = sum(size for _, _, size, _, _ in downloads)
+        job.set_total(total, UNIT_BYTES)
+        job.log(f"需要下载 {len(downloads)} 个文件，删除 {len(plan['delete'])} 个多余文件，"
+                f"{len(plan['unchanged'])} 个Mods没有变化")
+        download_directory = os.path.join(destination_directory, DOWNLOAD_DIRECTORY_NAME)
+
+        def download_one(item):
+            mod, rel_path, size, mtime, digest = item
+            job.checkpoint()
+            part_path = join_mod_file(os.path.join(download_directory, mod), rel_path) + PART_SUFFIX
+            os.makedirs(os.path.dirname(part_path), exist_ok=True)
+            if os.path.exists(part_path):
+                if os.path.getsize(part_path) > size:
+                    os.remove(part_path)
+                else:
+                    # 上次已经下载的部分
+                    job.advance(os.path.getsize(part_path))
+            client.download(job, mod, rel_path, part_path, size)
+            if hash_file(part_path) != digest:
+                os.remove(part_path)
+                raise SyncError(f"{mod}/{rel_path} 校验失败，请重新同步")
+            target = join_mod_file(os.path.join(destination_directory, mod), rel_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(part_path, target)
+            os.utime(target, (mtime, mtime))
+            hash_cache.put(target, os.stat(target), digest)
+            job.advance(0, f"{mod}/{rel_path}", files=1)
+
+        pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="mods-download")
+        futures = [pool.submit(download_one, item) for item in downloads]
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=True)
+
+        for mod, rel_path in plan["delete"]:
+            mod_path = os.path.join(destination_directory, mod)
+            path = join_mod_file(mod_path, rel_path)
+            os.remove(path)
+            remove_empty_directories(os.path.dirname(path), mod_path)
+        shutil.rmtree(download_directory, ignore_errors=True)
+
+        # 更新本地清单
+        mods_info = load_manifest(os.path.join(destination_directory, MODS_INFO_FILE_NAME))
+        for mod, workshop_id in remote_manifest["mods"].items():
+            set_mod_entry(mods_info, mod, workshop_id, remote_manifest["details"][mod])
+        save_manifest(os.path.join(destination_directory, MODS_INFO_FILE_NAME), mods_info)
+        removed = []
+        stale_mods = sorted(set(mods_info["mods"]) - set(remote_manifest["mods"]))
+        if prune and stale_mods:
+            # 服务端没有的Mods移到回收站而不是直接删除，服务端清单有误时可以撤销
+            try:
+                removed = trash_mods_job(job, destination_directory, stale_mods)["trashed"]
+            except OSError as e:
+                job.log(f"把服务端没有的Mods移到回收站失败：{e}")
+                raise
+            for mod in removed:
+                job.log(f"已将服务端没有的Mod移到回收站：{mod}")
+    except JobCancelled:
+        job.log("同步已取消，下次同步时会从已下载的位置继续")
+        raise
+    finally:
+        client.close()
+        hash_cache.save()
+    updated = sorted({mod for mod, *_ in downloads} | {mod for mod, _ in plan["delete"]})
+    job.log(f"同步完成：下载 {len(downloads)} 个文件，删除 {len(plan['delete'])} 个多余文件，更新 {len(updated)} 个Mods")
+    return {"downloaded": len(downloads), "downloaded_bytes": total, "deleted": len(plan["delete"]),
+            "updated_mods": updated, "removed_mods": removed}
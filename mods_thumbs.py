@@ -0,0 +1,158 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from mods_cache import get_cache_directory
+from mods_metadata import find_cover_image
+
+THUMBNAIL_SIZE = (200, 200)
+# 内存中最多缓存的缩略图数量
+MEMORY_CACHE_SIZE = 128
+# 解码缩略图的线程数
+THUMBNAIL_WORKERS = 2
+# 磁盘缓存的大小上限（字节），超过时删除最久没有使用的缩略图
+DISK_CACHE_SIZE = 64 * 1024 * 1024
+
+
+def make_thumbnail(cover_path, size=THUMBNAIL_SIZE):
+    """
+    解码图片并缩放为缩略图。JPEG使用draft在解码时直接缩小，
+    其他格式先用reduce快速缩小到接近目标尺寸，再用LANCZOS缩放。
+    :param cover_path: 图片路径
+    :param size: 缩略图尺寸
+    :return: PIL图片
+    """
+    with Image.open(cover_path) as image:
+        image.draft("RGB", size)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+
+class ThumbnailCache:
+    """
+    两级缩略图缓存：内存中的LRU缓存 + 磁盘缓存，都以封面图片的路径、大小和修改时间为键，
+    封面图片被替换或mod.info改用其他图片后不会显示旧的缩略图。
+    查找封面、解码和缩放都在后台线程中进行，界面线程只需要把结果转换为PhotoImage。
+    磁盘缓存超过disk_size时在后台删除最久没有使用的缩略图。
+    """
+
+    def __init__(self, size=THUMBNAIL_SIZE, memory_size=MEMORY_CACHE_SIZE, disk_directory=None,
+                 workers=THUMBNAIL_WORKERS, disk_size=DISK_CACHE_SIZE):
+        self.size = size
+        self.memory_size = memory_size
+        self.disk_directory = disk_directory or get_cache_directory("thumbnails")
+        self.disk_size = disk_size
+        self._memory = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mods-thumb")
+        self._pool.submit(self.prune_disk)
+
+    def _key(self, cover_path, stat):
+        return (os.path.normcase(os.path.abspath(cover_path)), stat.st_size, stat.st_mtime_ns)
+
+    def _disk_path(self, key):
+        key = f"{key[0]}|{key[1]}|{key[2]}|{self.size[0]}x{self.size[1]}"
+        return os.path.join(self.disk_directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + ".png")
+
+    def _get_memory(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return True, self._memory[key]
+        return False, None
+
+    def _remember(self, key, image):
+        with self._lock:
+            self._memory[key] = image
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _load(self, mod_directory):
+        """
+        （在后台线程中运行）加载Mod的封面缩略图：依次查内存缓存和磁盘缓存，都没有时解码原图并写入磁盘缓存
+        :return: PIL图片，Mod没有封面时返回None
+        """
+        try:
+            cover_path = find_cover_image(mod_directory)
+            if cover_path is None:
+                return None
+            key = self._key(cover_path, os.stat(cover_path))
+            hit, image = self._get_memory(key)
+            if hit:
+                return image
+            disk_path = self._disk_path(key)
+            try:
+                with Image.open(disk_path) as cached:
+                    image = cached.copy()
+                # 修改时间用来记录最近一次使用，清理磁盘缓存时先删除最久没有使用的
+                os.utime(disk_path)
+            except OSError:
+                image = make_thumbnail(cover_path, self.size)
+                try:
+                    image.save(disk_path + ".tmp", format="PNG")
+                    os.replace(disk_path + ".tmp", disk_path)
+                except OSError:
+                    pass  # 磁盘缓存写入失败不影响显示，下次重新解码
+            self._remember(key, image)
+            return image
+        finally:
+            with self._lock:
+                self._pending.pop(mod_directory, None)
+
+    def request(self, mod_directory):
+        """
+        请求Mod的封面缩略图
+        :param mod_directory: Mod文件夹
+        :return: Future，结果为PIL图片（没有封面时为None）
+        """
+        with self._lock:
+            future = self._pending.get(mod_directory)
+            if future is None:
+                future = self._pool.submit(self._load, mod_directory)
+                self._pending[mod_directory] = future
+        return future
+
+    def prefetch(self, mod_directories):
+        """
+        在后台预先加载一组Mod的封面缩略图（例如列表中与选中项相邻的Mods）
+        :param mod_directories: Mod文件夹列表
+        """
+        for mod_directory in mod_directories:
+            self.request(mod_directory)
+
+    def prune_disk(self):
+        """
+        磁盘缓存超过大小上限时删除最久没有使用的缩略图（包括写入中断留下的临时文件）
+        :return: 删除的文件数量
+        """
+        files = []
+        try:
+            with os.scandir(self.disk_directory) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        except OSError:
+            return 0
+        total_size = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total_size <= self.disk_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+            removed += 1
+        return removed
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
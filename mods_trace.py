@@ -0,0 +1,327 @@
+"""
+耗时统计：记录任务中嵌套的计时区间（扫描、索引、逐个Mod复制、哈希、写入清单等）和计数（字节数、文件数），
+导出为Chrome trace-event格式（可以在 chrome://tracing 或 https://ui.perfetto.dev 中打开），
+并把每次运行的摘要追加到历史记录中，用来观察多次部署的吞吐量变化。
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+from mods_cache import get_cache_directory, save_json
+
+# 保存的trace文件数量上限，超过时删除最旧的
+MAX_TRACE_FILES = 20
+# 历史记录文件超过这个大小时只保留后一半
+MAX_HISTORY_BYTES = 1024 * 1024
+HISTORY_FILE_NAME = "trace_history.jsonl"
+
+_local = threading.local()
+
+
+class Tracer:
+    """
+    一次运行（一个任务）的计时记录，线程安全。
+    时间使用time.perf_counter，导出时换算为相对于开始时间的微秒数。
+    """
+
+    def __init__(self, name):
+        """
+        :param name: 运行名称（例如任务名称）
+        """
+        self.name = name
+        self.started = time.time()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._events = []
+        self._threads = {}
+        # 区间名称 -> [次数, 总耗时, 最长耗时]
+        self._spans = {}
+        self._counters = {}
+        self._counters_changed = False
+
+    def _timestamp(self, value):
+        return round((value - self._origin) * 1e6, 1)
+
+    @contextmanager
+    def span(self, name, **args):
+        """
+        记录一个计时区间，可以嵌套
+        :param name: 区间名称，同名区间在摘要中合并统计
+        :param args: 附加信息（例如Mod名称），显示在trace中
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter(), args)
+
+    def add_span(self, name, start, end, args=None, async_id=None):
+        """
+        记录一个已经结束的计时区间
+        :param name: 区间名称
+        :param start: 开始时间（time.perf_counter）
+        :param end: 结束时间（time.perf_counter）
+        :param args: 附加信息
+        :param async_id: 不为None时作为异步区间记录（开始和结束不在同一个线程，例如并发复制的Mod）
+        """
+        thread = threading.current_thread()
+        event = {"name": name, "pid": os.getpid(), "tid": thread.ident, "ts": self._timestamp(start)}
+        if args:
+            event["args"] = args
+        duration = end - start
+        with self._lock:
+            self._threads.setdefault(thread.ident, thread.name)
+            if async_id is None:
+                event.update(ph="X", dur=round(duration * 1e6, 1))
+                self._events.append(event)
+            else:
+                event.update(ph="b", cat="async", id=str(async_id))
+                self._events.append(event)
+                self._events.append({"name": name, "pid": event["pid"], "tid": event["tid"], "ph": "e",
+                                     "cat": "async", "id": event["id"], "ts": self._timestamp(end)})
+            stats = self._spans.get(name)
+            if stats is None:
+                self._spans[name] = [1, duration, duration]
+            else:
+                stats[0] += 1
+                stats[1] += duration
+                stats[2] = max(stats[2], duration)
+            if self._counters_changed:
+                # 计数只在区间结束时写入trace，避免逐个文件产生大量事件
+                self._events.append({"name": "counters", "pid": event["pid"], "ph": "C",
+                                     "ts": self._timestamp(end), "args": dict(self._counters)})
+                self._counters_changed = False
+
+    def count(self, name, amount=1):
+        """
+        增加一个计数（例如 "bytes"、"files"、"mods"）
+        :param name: 计数名称
+        :param amount: 增加的数量
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+            self._counters_changed = True
+
+    def has_counters(self):
+        """
+        :return: 是否记录过计数（只有计时区间、没有处理任何数据的运行不需要保存）
+        """
+        with self._lock:
+            return bool(self._counters)
+
+    def to_chrome_trace(self):
+        """
+        :return: Chrome trace-event格式的字典
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": self.name}}]
+            events += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}}
+                       for tid, thread_name in self._threads.items()]
+            events += self._events
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"name": self.name, "started": time.strftime("%Y-%m-%dT%H:%M:%S",
+                                                                      time.localtime(self.started))},
+        }
+
+    def summary(self, state=None):
+        """
+        :param state: 运行结束时的状态（例如任务状态）
+        :return: 摘要 {"name", "started", "state", "wall", "spans": {名称: {"count", "total", "max"}}, "counters"}
+        """
+        with self._lock:
+            spans = {name: {"count": count, "total": round(total, 6), "max": round(longest, 6)}
+                     for name, (count, total, longest) in self._spans.items()}
+            counters = dict(self._counters)
+        return {
+            "name": self.name,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "state": state,
+            "wall": round(time.perf_counter() - self._origin, 6),
+            "spans": spans,
+            "counters": counters,
+        }
+
+
+def get_current_tracer():
+    """
+    :return: 当前线程正在记录的Tracer（由任务在工作线程中设置），没有时返回None
+    """
+    return getattr(_local, "tracer", None)
+
+
+def set_current_tracer(tracer):
+    """
+    设置当前线程的Tracer，使不直接接收任务对象的函数也能记录计时区间
+    :param tracer: Tracer对象，为None时清除
+    """
+    _local.tracer = tracer
+
+
+def span(name, **args):
+    """
+    在当前线程的Tracer中记录一个计时区间，没有Tracer时什么也不做
+    :param name: 区间名称
+    :param args: 附加信息
+    :return: 上下文管理器
+    """
+    tracer = get_current_tracer()
+    return tracer.span(name, **args) if tracer is not None else nullcontext()
+
+
+def count(name, amount=1):
+    """
+    在当前线程的Tracer中增加一个计数，没有Tracer时什么也不做
+    """
+    tracer = get_current_tracer()
+    if tracer is not None:
+        tracer.count(name, amount)
+
+
+def throughput(summary):
+    """
+    :return: 摘要中每秒处理的字节数，没有字节计数时返回None
+    """
+    size = summary["counters"].get("bytes")
+    if not size or not summary["wall"]:
+        return None
+    return size / summary["wall"]
+
+
+def format_megabytes(size):
+    """
+    :return: 以MB为单位的文本（表格中统一使用MB，方便比较）
+    """
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def format_summary(summary):
+    """
+    生成摘要表格的文本：每个区间的次数、总耗时、占总耗时的比例和最长一次的耗时
+    :param summary: Tracer.summary的返回值
+    :return: 文本
+    """
+    wall = summary["wall"]
+    lines = [f"耗时统计（{summary['name']}，共 {wall:.3f}s）：",
+             f"{'阶段':<16}{'次数':>8}{'总耗时':>12}{'占比':>8}{'最长':>12}"]
+    for name, stats in sorted(summary["spans"].items(), key=lambda item: -item[1]["total"]):
+        if name == summary["name"]:
+            continue
+        share = stats["total"] / wall * 100 if wall else 0.0
+        lines.append(f"{name:<16}{stats['count']:>8}{stats['total']:>11.3f}s{share:>7.1f}%{stats['max']:>11.3f}s")
+    counters = summary["counters"]
+    if counters:
+        lines.append("计数：" + "，".join(f"{name} {format_megabytes(value) if name.endswith('bytes') else value}"
+                                          for name, value in sorted(counters.items())))
+    rate = throughput(summary)
+    if rate is not None:
+        lines.append(f"吞吐量：{format_megabytes(rate)}/s")
+    return "\n".join(lines)
+
+
+def save_chrome_trace(tracer, path):
+    """
+    把Tracer保存为Chrome trace-event格式的JSON文件
+    :param tracer: Tracer对象
+    :param path: 文件路径
+    """
+    save_json(path, tracer.to_chrome_trace())
+
+
+def get_trace_directory():
+    return get_cache_directory("traces")
+
+
+def save_run_trace(tracer):
+    """
+    把一次运行的trace保存到缓存目录的traces文件夹中，只保留最近的MAX_TRACE_FILES个
+    :param tracer: Tracer对象
+    :return: 文件路径
+    """
+    directory = get_trace_directory()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(tracer.started))
+    path = os.path.join(directory, f"{stamp}-{int(tracer.started * 1000) % 1000:03d}-{os.getpid()}.json")
+    save_chrome_trace(tracer, path)
+    traces = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+    for name in traces[:-MAX_TRACE_FILES]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+    return path
+
+
+def get_history_path():
+    return os.path.join(get_cache_directory(), HISTORY_FILE_NAME)
+
+
+def append_run_history(summary):
+    """
+    把一次运行的摘要追加到历史记录（JSON Lines），文件过大时只保留后一半
+    :param summary: Tracer.summary的返回值
+    """
+    path = get_history_path()
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(summary, ensure_ascii=False) + "\n")
+    if os.path.getsize(path) > MAX_HISTORY_BYTES:
+        with open(path, 'r', encoding='utf-8') as file:
+            lines = file.readlines()
+        with open(path + ".tmp", 'w', encoding='utf-8') as file:
+            file.writelines(lines[len(lines) // 2:])
+        os.replace(path + ".tmp", path)
+
+
+def load_run_history(name=None, limit=None):
+    """
+    读取历史记录
+    :param name: 只返回这个名称的运行，为None时返回全部
+    :param limit: 最多返回最近的多少条
+    :return: 摘要列表（按时间顺序），损坏的行会被忽略
+    """
+    entries = []
+    try:
+        with open(get_history_path(), 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if name is None or entry.get("name") == name:
+                    entries.append(entry)
+    except FileNotFoundError:
+        return []
+    return entries[-limit:] if limit else entries
+
+
+def format_history(entries):
+    """
+    生成历史记录表格的文本：每次运行的耗时、数据量和吞吐量
+    :param entries: load_run_history的返回值
+    :return: 文本
+    """
+    lines = [f"{'时间':<21}{'任务':<20}{'状态':<10}{'耗时':>10}{'Mods':>8}{'数据量':>12}{'吞吐量':>14}"]
+    for entry in entries:
+        counters = entry.get("counters", {})
+        rate = throughput(entry)
+        lines.append(f"{entry.get('started', ''):<21}{entry.get('name', ''):<20}{entry.get('state') or '':<10}"
+                     f"{entry.get('wall', 0):>9.2f}s{counters.get('mods', ''):>8}"
+                     f"{format_megabytes(counters['bytes']) if 'bytes' in counters else '':>12}"
+                     f"{format_megabytes(rate) + '/s' if rate is not None else '':>14}")
+    return "\n".join(lines)
+
+
+def record_run(tracer, state=None):
+    """
+    运行结束时保存trace并追加历史记录
+    :param tracer: Tracer对象
+    :param state: 运行结束时的状态
+    :return: (摘要, trace文件路径)
+    """
+    summary = tracer.summary(state)
+    path = save_run_trace(tracer)
+    append_run_history(summary)
+    return summary, path
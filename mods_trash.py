@@ -0,0 +1,341 @@
+"""
+目标目录的回收站：删除Mod时只把Mod文件夹重命名到目标目录中的回收站（同一文件系统上的重命名，与Mod大小无关），
+真正的删除由后台的清理任务在保留时间过后按限定的速度进行，清理之前可以撤销删除。
+"""
+import os
+import time
+import uuid
+import threading
+
+from mods_cache import load_json, save_json
+from mods_journal import INTERNAL_PREFIX
+from mods_manifest import MODS_INFO_FILE_NAME, read_mods_info, remove_mod_entry, set_mod_entry, write_mods_info
+
+TRASH_DIRECTORY_NAME = INTERNAL_PREFIX + "trash"
+TRASH_INDEX_FILE_NAME = "trash.json"
+TRASH_INDEX_VERSION = 1
+# 删除的Mods在回收站中保留的时间（秒），过后由后台清理任务删除
+DEFAULT_TRASH_RETENTION = 30 * 60
+# 清理时每秒最多删除的文件数，避免大量删除操作占满磁盘影响游戏服务器或正在进行的复制
+DEFAULT_PURGE_FILES_PER_SECOND = 2000
+# 清理时每删除这么多文件检查一次取消和速度
+PURGE_BATCH_SIZE = 100
+# 后台清理任务检查过期条目的间隔（秒）
+PURGE_CHECK_INTERVAL = 60
+
+# 同一进程中的删除、撤销和清理任务可能同时修改回收站索引
+_index_lock = threading.Lock()
+
+
+class TrashBin:
+    """
+    目标目录中的回收站：<目标目录>/.zde_trash/<批次>/<Mod名称>，以及记录每个Mod的创意工坊ID、
+    在mods_info.json中的详细信息和删除时间的索引文件 trash.json。
+    一次删除操作中的Mods属于同一个批次，撤销时按批次恢复。
+    """
+
+    def __init__(self, destination_directory):
+        """
+        :param destination_directory: 目标目录（包含Mods文件夹的目录）
+        """
+        self.destination_directory = destination_directory
+        self.directory = os.path.join(destination_directory, TRASH_DIRECTORY_NAME)
+        self.index_path = os.path.join(self.directory, TRASH_INDEX_FILE_NAME)
+
+    def _load(self):
+        index = load_json(self.index_path)
+        if not index or index.get("version") != TRASH_INDEX_VERSION:
+            return {"version": TRASH_INDEX_VERSION, "entries": []}
+        return index
+
+    def _save(self, index):
+        save_json(self.index_path, index, indent=2)
+
+    def entry_path(self, entry):
+        return os.path.join(self.directory, entry["batch"], entry["mod"])
+
+    def entries(self):
+        """
+        :return: 回收站中的条目列表 [{"batch", "mod", "workshop_id", "details", "deleted_at", ["purging"]}, ...]
+        """
+        with _index_lock:
+            return self._load()["entries"]
+
+    def batches(self):
+        """
+        :return: 可以恢复的批次 [(批次, [mod名称, ...], 删除时间), ...]，最近删除的在前
+        """
+        batches = {}
+        for entry in self.entries():
+            if not entry.get("purging"):
+                batch = batches.setdefault(entry["batch"], ([], entry["deleted_at"]))
+                batch[0].append(entry["mod"])
+        return sorted(((batch, mods, deleted_at) for batch, (mods, deleted_at) in batches.items()),
+                      key=lambda item: item[2], reverse=True)
+
+    def add_entries(self, entries):
+        """
+        把条目加入索引
+        :param entries: 条目列表
+        """
+        with _index_lock:
+            index = self._load()
+            index["entries"].extend(entries)
+            self._save(index)
+
+    def new_batch(self):
+        """
+        :return: 新的批次名称
+        """
+        return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+    def move_to_trash(self, mods, batch, mods_info):
+        """
+        把Mods重命名到回收站，并记录恢复时需要的信息
+        :param mods: [(mod名称, Mod文件夹), ...]
+        :param batch: 批次名称
+        :param mods_info: 目标目录的mods_info（用于记录创意工坊ID和详细信息）
+        :return: 已移到回收站的Mods列表
+        """
+        batch_directory = os.path.join(self.directory, batch)
+        os.makedirs(batch_directory, exist_ok=True)
+        trashed = []
+        entries = []
+        try:
+            for mod, mod_path in mods:
+                os.rename(mod_path, os.path.join(batch_directory, mod))
+                trashed.append(mod)
+                entries.append({"batch": batch, "mod": mod, "workshop_id": mods_info["mods"].get(mod, ""),
+                                "details": mods_info.get("details", {}).get(mod), "deleted_at": time.time()})
+        finally:
+            # 出错时也记录已经移动的Mods，保证它们可以恢复
+            if entries:
+                self.add_entries(entries)
+        return trashed
+
+    def take_batch(self, batch):
+        """
+        从索引中取出一个批次的条目（正在清理的条目不能恢复）
+        :param batch: 批次名称
+        :return: 条目列表
+        """
+        with _index_lock:
+            index = self._load()
+            taken = [entry for entry in index["entries"] if entry["batch"] == batch and not entry.get("purging")]
+            index["entries"] = [entry for entry in index["entries"] if entry not in taken]
+            self._save(index)
+        return taken
+
+    def mark_expired(self, retention):
+        """
+        把超过保留时间的条目标记为正在清理（之后不能再恢复）
+        :param retention: 保留时间（秒）
+        :return: 标记的条目列表（包括上次清理没有完成的条目）
+        """
+        now = time.time()
+        with _index_lock:
+            index = self._load()
+            expired = []
+            for entry in index["entries"]:
+                if entry.get("purging") or now - entry["deleted_at"] >= retention:
+                    entry["purging"] = True
+                    expired.append(entry)
+            if expired:
+                self._save(index)
+        return expired
+
+    def forget(self, entry):
+        """
+        清理完成后从索引中删除条目，并删除已经空了的批次文件夹
+        :param entry: 条目
+        """
+        with _index_lock:
+            index = self._load()
+            index["entries"] = [item for item in index["entries"]
+                                if (item["batch"], item["mod"]) != (entry["batch"], entry["mod"])]
+            self._save(index)
+        try:
+            os.rmdir(os.path.join(self.directory, entry["batch"]))
+        except OSError:
+            pass
+
+
+class DeleteBudget:
+    """
+    删除速度预算：整个清理任务（而不是单个Mod）每秒最多删除files_per_second个文件
+    """
+
+    def __init__(self, files_per_second=DEFAULT_PURGE_FILES_PER_SECOND):
+        """
+        :param files_per_second: 每秒最多删除的文件数，为None或0时不限速
+        """
+        self.files_per_second = files_per_second
+        self.started = time.monotonic()
+        self.removed = 0
+
+    def consume(self, job):
+        """
+        记录删除了一个文件，删除得比预算快时等待（等待期间可以取消任务）
+        :param job: 当前任务
+        """
+        self.removed += 1
+        if self.removed % PURGE_BATCH_SIZE:
+            return
+        job.checkpoint()
+        if self.files_per_second:
+            ahead = self.removed / self.files_per_second - (time.monotonic() - self.started)
+            if ahead > 0:
+                job.sleep(ahead)
+
+
+def remove_tree_throttled(job, path, budget):
+    """
+    按删除速度预算删除文件夹，可以在中途取消（已删除的部分不会恢复）
+    :param job: 当前任务
+    :param path: 文件夹
+    :param budget: DeleteBudget对象
+    :return: (删除的文件数, 释放的字节数)
+    """
+    removed = 0
+    freed = 0
+    for directory, directories, files in os.walk(path, topdown=False):
+        for name in files:
+            file_path = os.path.join(directory, name)
+            try:
+                freed += os.lstat(file_path).st_size
+                os.remove(file_path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            budget.consume(job)
+        for name in directories:
+            child = os.path.join(directory, name)
+            if os.path.islink(child):
+                os.remove(child)
+            else:
+                os.rmdir(child)
+    if os.path.isdir(path):
+        os.rmdir(path)
+    return removed, freed
+
+
+def trash_mods_job(job, destination_directory, selected_mods):
+    """
+    （在工作线程中运行）把目标目录中的选定Mods移到回收站，并更新mods_info.json
+    :param job: 当前任务
+    :param destination_directory: 目标目录（包含Mods文件夹的目录）
+    :param selected_mods: 选定的Mods列表
+    :return: {"batch": 批次名称, "trashed": [已移到回收站的Mods]}
+    """
+    trash = TrashBin(destination_directory)
+    json_path = os.path.join(destination_directory, MODS_INFO_FILE_NAME)
+    mods_info = read_mods_info(destination_directory)
+    batch = trash.new_batch()
+    mods = [(mod, os.path.join(destination_directory, mod)) for mod in selected_mods]
+    job.set_total(len(mods))
+    trashed = []
+    try:
+        with job.span("move_to_trash", mods=len(mods)):
+            trashed = trash.move_to_trash([(mod, path) for mod, path in mods if os.path.exists(path)], batch, mods_info)
+        job.count("mods", len(trashed))
+        job.advance(len(mods))
+    finally:
+        if os.path.exists(json_path):
+            # 已移到回收站（包括出错前已经移动）的Mods以及本来就不存在的Mods都从mods_info中删除
+            for mod, path in mods:
+                if not os.path.exists(path):
+                    remove_mod_entry(mods_info, mod)
+            write_mods_info(destination_directory, mods_info)
+    job.log(f"已将 {len(trashed)} 个Mods移到回收站，清理之前可以撤销")
+    return {"batch": batch, "trashed": trashed}
+
+
+def restore_mods_job(job, destination_directory, batch=None):
+    """
+    （在工作线程中运行）从回收站恢复一个批次的Mods，并把它们原来的信息写回mods_info.json
+    :param job: 当前任务
+    :param destination_directory: 目标目录（包含Mods文件夹的目录）
+    :param batch: 批次名称，为None时恢复最近删除的批次
+    :return: 已恢复的Mods列表
+    """
+    trash = TrashBin(destination_directory)
+    if batch is None:
+        batches = trash.batches()
+        if not batches:
+            job.log("回收站中没有可以恢复的Mods")
+            return []
+        batch = batches[0][0]
+    entries = trash.take_batch(batch)
+    json_path = os.path.join(destination_directory, MODS_INFO_FILE_NAME)
+    mods_info = read_mods_info(destination_directory) if os.path.exists(json_path) else None
+    restored = []
+    kept = []
+    for entry in entries:
+        mod_path = os.path.join(destination_directory, entry["mod"])
+        if os.path.exists(mod_path):
+            # 删除之后又复制了同名的Mod，保留新的Mod，回收站中的旧版本留待清理
+            job.log(f"{entry['mod']} 已经存在，没有恢复")
+            kept.append(entry)
+            continue
+        os.rename(trash.entry_path(entry), mod_path)
+        restored.append(entry["mod"])
+        if mods_info is not None:
+            set_mod_entry(mods_info, entry["mod"], entry["workshop_id"], entry.get("details"))
+    if kept:
+        trash.add_entries(kept)
+    else:
+        try:
+            os.rmdir(os.path.join(trash.directory, batch))
+        except OSError:
+            pass
+    if mods_info is not None and restored:
+        write_mods_info(destination_directory, mods_info)
+    job.count("mods", len(restored))
+    job.log(f"已从回收站恢复 {len(restored)} 个Mods")
+    return restored
+
+
+def purge_trash_job(job, destination_directory, retention=0, files_per_second=DEFAULT_PURGE_FILES_PER_SECOND):
+    """
+    （在工作线程中运行）删除回收站中超过保留时间的Mods
+    :param job: 当前任务
+    :param destination_directory: 目标目录（包含Mods文件夹的目录）
+    :param retention: 保留时间（秒），为0时清空回收站
+    :param files_per_second: 每秒最多删除的文件数，为None时不限速
+    :return: {"purged": [mod名称, ...], "removed_files": 文件数, "freed_bytes": 字节数}
+    """
+    trash = TrashBin(destination_directory)
+    result = {"purged": [], "removed_files": 0, "freed_bytes": 0}
+    if not os.path.isdir(trash.directory):
+        return result
+    expired = trash.mark_expired(retention)
+    job.set_total(len(expired))
+    budget = DeleteBudget(files_per_second)
+    for entry in expired:
+        job.checkpoint()
+        with job.span("purge_mod", mod=entry["mod"]):
+            removed, freed = remove_tree_throttled(job, trash.entry_path(entry), budget)
+        trash.forget(entry)
+        result["purged"].append(entry["mod"])
+        result["removed_files"] += removed
+        result["freed_bytes"] += freed
+        job.count("files", removed)
+        job.count("bytes", freed)
+        job.advance(1, entry["mod"])
+    if expired:
+        job.log(f"已从回收站清理 {len(expired)} 个Mods")
+    return result
+
+
+def trash_purger_job(job, destination_directory, retention=DEFAULT_TRASH_RETENTION,
+                     files_per_second=DEFAULT_PURGE_FILES_PER_SECOND):
+    """
+    （在工作线程中运行，直到被取消）定期清理回收站中超过保留时间的Mods
+    :param job: 当前任务
+    :param destination_directory: 目标目录（包含Mods文件夹的目录）
+    :param retention: 保留时间（秒）
+    :param files_per_second: 每秒最多删除的文件数
+    """
+    while True:
+        purge_trash_job(job, destination_directory, retention, files_per_second)
+        job.sleep(PURGE_CHECK_INTERVAL)
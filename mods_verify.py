@@ -0,0 +1,301 @@
+"""
+完整性校验：复制完成后重新读取源文件和目标文件，比较大小和内容哈希，只重新复制不一致的文件；
+也可以单独按mods_info.json中记录的哈希审计目标目录（U盘、网络共享等不可靠的存储上复制后可能出现损坏的文件）。
+哈希在进程池中计算，大文件使用内存映射读取。校验不使用哈希缓存：缓存只按大小和修改时间判断，无法发现内容损坏。
+"""
+import os
+import mmap
+import shutil
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from mods_hash import HASH_CHUNK_SIZE, hash_file
+from mods_jobs import UNIT_BYTES
+from mods_journal import INTERNAL_PREFIX
+from mods_manifest import (MODS_INFO_FILE_NAME, build_mod_details, list_mod_files, load_manifest, save_manifest,
+                           set_mod_entry)
+from mods_trace import count
+
+DEFAULT_VERIFY_WORKERS = min(4, os.cpu_count() or 1)
+# 不小于这个大小的文件使用内存映射读取
+MMAP_MIN_SIZE = 4 * 1024 * 1024
+# 每次交给工作进程的一批文件（减少进程间通信的次数）
+VERIFY_BATCH_BYTES = 64 * 1024 * 1024
+VERIFY_BATCH_FILES = 256
+# 修复时先复制到这个前缀的临时文件，再替换目标文件
+REPAIR_PREFIX = INTERNAL_PREFIX + "repair-"
+
+
+class VerificationFailed(Exception):
+    """重新复制后仍然与源文件不一致（例如存储设备损坏）"""
+
+    def __init__(self, failed):
+        """
+        :param failed: {mod名称: [相对路径, ...]}
+        """
+        self.failed = failed
+        files = sum(len(paths) for paths in failed.values())
+        super().__init__(f"{len(failed)} 个Mods的 {files} 个文件重新复制后仍然与源文件不一致："
+                         f"{', '.join(sorted(failed))}")
+
+
+def hash_file_mapped(path):
+    """
+    计算文件内容的哈希（与mods_hash.hash_file的结果相同），大文件使用内存映射读取
+    :param path: 文件路径
+    :return: 十六进制哈希字符串
+    """
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size < MMAP_MIN_SIZE:
+            return hash_file(path)
+        digest = hashlib.blake2b(digest_size=16)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, size, HASH_CHUNK_SIZE):
+                    digest.update(view[offset:offset + HASH_CHUNK_SIZE])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+
+def _hash_batch(paths):
+    """
+    （在工作进程中运行）计算一批文件的哈希
+    :param paths: 文件路径列表
+    :return: [(文件路径, 哈希字符串), ...]，无法读取的文件哈希为None
+    """
+    results = []
+    for path in paths:
+        try:
+            results.append((path, hash_file_mapped(path)))
+        except (OSError, ValueError):
+            results.append((path, None))
+    return results
+
+
+def _make_batches(files):
+    batches = []
+    batch, batch_size = [], 0
+    for path, size in files:
+        batch.append((path, size))
+        batch_size += size
+        if batch_size >= VERIFY_BATCH_BYTES or len(batch) >= VERIFY_BATCH_FILES:
+            batches.append(batch)
+            batch, batch_size = [], 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _create_pool(workers):
+    try:
+        # 在工作线程中创建进程池时界面、监视和复制线程都在运行，fork会复制其他线程持有的锁，
+        # 子进程可能死锁，因此使用spawn启动全新的进程
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    except (OSError, NotImplementedError):
+        # 不支持多进程的环境改用线程（hashlib计算大块数据时会释放GIL）
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mods-verify")
+
+
+def hash_paths(job, files, workers=DEFAULT_VERIFY_WORKERS):
+    """
+    在进程池中重新读取文件并计算哈希，按字节报告进度，可以暂停或取消
+    :param job: 当前任务
+    :param files: [(文件路径, 字节数), ...]
+    :param workers: 进程数
+    :return: {文件路径: 哈希字符串或None}
+    """
+    results = {}
+    batches = _make_batches(files)
+    if not batches:
+        return results
+    with _create_pool(max(1, workers)) as pool:
+        futures = {pool.submit(_hash_batch, [path for path, _ in batch]): batch for batch in batches}
+        try:
+            for future in as_completed(futures):
+                job.checkpoint()
+                batch = futures[future]
+                results.update(future.result())
+                job.advance(sum(size for _, size in batch), files=len(batch))
+        finally:
+            # 取消或出错时不再启动剩余的批次
+            for future in futures:
+                future.cancel()
+    count("verified_files", len(files))
+    count("verified_bytes", sum(size for _, size in files))
+    return results
+
+
+def add_to_total(job, amount):
+    """
+    在任务已有的工作量上增加校验需要读取的字节数（复制后的校验阶段接着复制的进度）
+    """
+    _, total, _ = job.progress()
+    job.set_total(total + amount, UNIT_BYTES)
+
+
+def verify_mods(job, transfers, workers=DEFAULT_VERIFY_WORKERS, linked_sources=()):
+    """
+    比较源Mods和目标Mods中的每个文件：大小不同的文件直接判定为不一致，大小相同的文件比较内容哈希。
+    目标中多出的文件不算作不一致（增量同步会删除它们）。
+    通过reflink或硬链接部署的文件与源文件共享数据，比较内容只是读取同一份数据两次，这些文件只检查大小。
+    :param job: 当前任务
+    :param transfers: [(mod名称, 源Mod文件夹, 目标Mod文件夹), ...]
+    :param workers: 进程数
+    :param linked_sources: 通过reflink或硬链接部署的源文件（见FileDeployer.linked_sources），不比较内容
+    :return: 不一致的文件 {mod名称: [相对路径, ...]}
+    """
+    mismatches = {}
+    checks = []
+    files = []
+    skipped = 0
+    for mod, source_path, destination_path in transfers:
+        job.checkpoint()
+        destination_files = {}
+        if os.path.isdir(destination_path):
+            destination_files = {rel_path: (path, stat) for rel_path, path, stat in list_mod_files(destination_path)}
+        for rel_path, path, stat in list_mod_files(source_path):
+            destination = destination_files.get(rel_path)
+            if destination is None or destination[1].st_size != stat.st_size:
+                mismatches.setdefault(mod, []).append(rel_path)
+                continue
+            if path in linked_sources or os.path.samestat(stat, destination[1]):
+                skipped += 1
+                continue
+            checks.append((mod, rel_path, path, destination[0]))
+            files.append((path, stat.st_size))
+            files.append((destination[0], stat.st_size))
+    if skipped:
+        job.log(f"跳过 {skipped} 个通过reflink或硬链接部署的文件（与源文件共享数据，比较内容没有意义）")
+    add_to_total(job, sum(size for _, size in files))
+    hashes = hash_paths(job, files, workers)
+    for mod, rel_path, source_file, destination_file in checks:
+        digest = hashes.get(source_file)
+        if digest is None or digest != hashes.get(destination_file):
+            mismatches.setdefault(mod, []).append(rel_path)
+    return {mod: sorted(rel_paths) for mod, rel_paths in mismatches.items()}
+
+
+def repair_mod_files(job, source_path, destination_path, rel_paths):
+    """
+    从源Mod重新复制指定的文件：先复制到临时文件，再替换目标文件（也会断开指向共享存储的硬链接）
+    :param job: 当前任务
+    :param source_path: 源Mod文件夹
+    :param destination_path: 目标Mod文件夹
+    :param rel_paths: 需要重新复制的文件（相对路径，'/'分隔）
+    """
+    for rel_path in rel_paths:
+        job.checkpoint()
+        source_file = os.path.join(source_path, *rel_path.split("/"))
+        destination_file = os.path.join(destination_path, *rel_path.split("/"))
+        directory, name = os.path.split(destination_file)
+        os.makedirs(directory, exist_ok=True)
+        temp_path = os.path.join(directory, REPAIR_PREFIX + name)
+        try:
+            shutil.copy2(source_file, temp_path)
+            os.replace(temp_path, destination_file)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+def verify_and_repair(job, transfers, workers=DEFAULT_VERIFY_WORKERS, linked_sources=()):
+    """
+    校验复制结果，只重新复制不一致的文件，然后再校验一次
+    :param job: 当前任务
+    :param transfers: [(mod名称, 源Mod文件夹, 目标Mod文件夹), ...]
+    :param workers: 进程数
+    :param linked_sources: 通过reflink或硬链接部署的源文件，不比较内容（见verify_mods）
+    :return: {"verified": 校验的Mod数量, "repaired": {mod名称: [相对路径, ...]}, "failed": {mod名称: [相对路径, ...]}}
+    """
+    job.log(f"正在校验 {len(transfers)} 个Mods……")
+    mismatches = verify_mods(job, transfers, workers, linked_sources)
+    failed = {}
+    if mismatches:
+        paths = {mod: (source_path, destination_path) for mod, source_path, destination_path in transfers}
+        for mod, rel_paths in sorted(mismatches.items()):
+            job.log(f"{mod} 有 {len(rel_paths)} 个文件与源文件不一致，重新复制：{', '.join(rel_paths[:10])}"
+                    + (" ……" if len(rel_paths) > 10 else ""))
+            repair_mod_files(job, paths[mod][0], paths[mod][1], rel_paths)
+        count("repaired_files", sum(len(rel_paths) for rel_paths in mismatches.values()))
+        # 只重新校验修复过的Mods
+        failed = verify_mods(job, [(mod, *paths[mod]) for mod in mismatches], workers, linked_sources)
+        for mod, rel_paths in failed.items():
+            job.log(f"错误：{mod} 的 {len(rel_paths)} 个文件重新复制后仍然不一致")
+    job.log(f"校验完成：{len(transfers)} 个Mods，重新复制了 {len(mismatches)} 个Mods中不一致的文件")
+    return {"verified": len(transfers), "repaired": mismatches, "failed": failed}
+
+
+def audit_destination_job(job, destination_directory, source_paths=None, workers=DEFAULT_VERIFY_WORKERS):
+    """
+    （在工作线程中运行）按mods_info.json中记录的哈希审计目标目录：重新读取每个文件并计算哈希。
+    清单记录了每个文件的哈希时可以找出具体的文件，否则按整个Mod的哈希比较。
+    提供源Mods时从源目录重新复制不一致的文件，并更新清单中这些Mods的信息。
+    :param job: 当前任务
+    :param destination_directory: 目标目录（包含Mods文件夹的目录）
+    :param source_paths: 可选的 {mod名称: 源Mod文件夹}，用于修复
+    :param workers: 进程数
+    :return: {"ok": [mod, ...], "mismatched": {mod名称: [相对路径, ...]}（"*"表示无法确定具体文件）,
+              "missing": [mod, ...], "unverifiable": [mod, ...]（清单中没有哈希）,
+              "repaired": {mod名称: [相对路径, ...]}, "failed": {mod名称: [相对路径, ...]}}
+    """
+    json_path = os.path.join(destination_directory, MODS_INFO_FILE_NAME)
+    if not os.path.exists(json_path):
+        raise FileNotFoundError(f"{json_path} 不存在，请先生成mods_info.json")
+    manifest = load_manifest(json_path)
+    details = manifest["details"]
+    report = {"ok": [], "mismatched": {}, "missing": [], "unverifiable": [], "repaired": {}, "failed": {}}
+    mod_files = {}
+    for mod in sorted(manifest["mods"]):
+        mod_path = os.path.join(destination_directory, mod)
+        if not os.path.isdir(mod_path):
+            report["missing"].append(mod)
+        elif not details.get(mod, {}).get("hash"):
+            report["unverifiable"].append(mod)
+        else:
+            mod_files[mod] = list_mod_files(mod_path)
+    files = [(path, stat.st_size) for entries in mod_files.values() for _, path, stat in entries]
+    job.set_total(sum(size for _, size in files), UNIT_BYTES)
+    with job.span("audit", mods=len(mod_files)):
+        hashes = hash_paths(job, files, workers)
+
+    for mod, entries in mod_files.items():
+        expected = details[mod]
+        if "files" in expected:
+            actual = {rel_path: [stat.st_size, hashes.get(path)] for rel_path, path, stat in entries}
+            bad = [rel_path for rel_path, (size, _, digest) in expected["files"].items()
+                   if actual.get(rel_path) != [size, digest]]
+            bad += [rel_path for rel_path in actual if rel_path not in expected["files"]]
+        else:
+            bad = [] if build_mod_details(entries, hashes)["hash"] == expected["hash"] else ["*"]
+        if bad:
+            report["mismatched"][mod] = sorted(bad)
+            job.log(f"{mod} 与mods_info.json不一致：{', '.join(sorted(bad)[:10])}")
+        else:
+            report["ok"].append(mod)
+    for mod in report["missing"]:
+        job.log(f"{mod} 在目标目录中不存在")
+    job.log(f"审计完成：{len(report['ok'])} 个一致，{len(report['mismatched'])} 个不一致，"
+            f"{len(report['missing'])} 个缺少，{len(report['unverifiable'])} 个没有记录哈希")
+
+    repairable = [(mod, source_paths[mod], os.path.join(destination_directory, mod))
+                  for mod in report["mismatched"] if source_paths and os.path.isdir(source_paths.get(mod) or "")]
+    if repairable:
+        result = verify_and_repair(job, repairable, workers)
+        report["repaired"], report["failed"] = result["repaired"], result["failed"]
+        # 修复后的Mod与源Mod一致，重新记录它的信息
+        for mod, _, destination_path in repairable:
+            if mod in report["failed"]:
+                continue
+            entries = list_mod_files(destination_path)
+            files = [(path, stat.st_size) for _, path, stat in entries]
+            add_to_total(job, sum(size for _, size in files))
+            hashes = hash_paths(job, files, workers)
+            set_mod_entry(manifest, mod, manifest["mods"][mod],
+                          build_mod_details(entries, hashes, "files" in details.get(mod, {})))
+        save_manifest(json_path, manifest)
+    return report
@@ -0,0 +1,421 @@
+import os
+import sys
+import errno
+import select
+import struct
+
+from mods_index import (DEFAULT_CONFLICT_RULE, choose_workshop_item, get_mtime, scan_workshop_item,
+                        split_source_directories)
+from mods_journal import is_internal_name
+
+# 轮询目录修改时间的间隔（秒）
+POLL_INTERVAL = 2.0
+# 等待inotify事件时检查取消的间隔（秒）
+WAIT_SLICE = 0.5
+# 收到事件后再等待一会儿，把一批文件操作（例如复制整个Mod）合并为一次更新
+SETTLE_DELAY = 0.3
+
+# inotify常量（linux/inotify.h）
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+# 只关心会改变目录修改时间的事件，与轮询方式检测到的变化一致
+WATCH_MASK = (IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+              | IN_ONLYDIR)
+INOTIFY_EVENT = struct.Struct("iIII")
+INOTIFY_READ_SIZE = 64 * 1024
+
+# 监视的目录类型
+WATCH_SOURCE = "source"                          # 源目录，创意工坊物品的新增和删除
+WATCH_SOURCE_ITEM = "source_item"                # 创意工坊物品目录，mods文件夹的新增和删除
+WATCH_SOURCE_ITEM_MODS = "source_item_mods"      # 创意工坊物品的mods文件夹，Mod的新增和删除
+WATCH_DESTINATION = "destination"                # 目标目录，Mod的新增和删除
+WATCH_DESTINATION_MOD = "destination_mod"        # 目标目录中的Mod文件夹，Mod内容的变化
+
+
+class PollingMonitor:
+    """
+    定时检查目录的修改时间（所有平台都可用）
+    """
+    name = "定时检查"
+
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self.paths = {}
+
+    def add(self, path):
+        self.paths[path] = get_mtime(path)
+
+    def remove(self, path):
+        self.paths.pop(path, None)
+
+    def wait(self, job):
+        """
+        等待目录变化
+        :param job: 当前任务，等待期间可以取消
+        :return: 修改时间有变化的目录集合
+        """
+        job.sleep(self.interval)
+        dirty = set()
+        for path, mtime in self.paths.items():
+            current = get_mtime(path)
+            if current != mtime:
+                self.paths[path] = current
+                dirty.add(path)
+        return dirty
+
+    def close(self):
+        pass
+
+
+class InotifyMonitor:
+    """
+    使用Linux的inotify接收目录变化通知，没有变化时不需要访问磁盘，处理时间只与变化的数量有关
+    """
+    name = "inotify"
+
+    def __init__(self):
+        import ctypes
+        self._ctypes = ctypes
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.watches = {}
+        self.paths = {}
+
+    def add(self, path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = self._ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                # 目录还不存在或已经被删除，由上一级目录的事件处理
+                return
+            raise OSError(error, os.strerror(error), path)
+        self.watches[wd] = path
+        self.paths[path] = wd
+
+    def remove(self, path):
+        wd = self.paths.pop(path, None)
+        if wd is not None and self.watches.get(wd) == path:
+            del self.watches[wd]
+            self._libc.inotify_rm_watch(self.fd, wd)
+
+    def wait(self, job):
+        """
+        等待目录变化
+        :param job: 当前任务，等待期间可以取消
+        :return: 有变化的目录集合，事件队列溢出时返回None（需要检查所有目录）
+        """
+        while not select.select([self.fd], [], [], WAIT_SLICE)[0]:
+            job.checkpoint()
+        job.sleep(SETTLE_DELAY)
+        dirty = set()
+        while True:
+            try:
+                data = os.read(self.fd, INOTIFY_READ_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    dirty = None
+                    continue
+                path = self.watches.get(wd)
+                if path is None:
+                    continue
+                if mask & IN_IGNORED:
+                    # 目录已被删除，监视自动移除
+                    del self.watches[wd]
+                    if self.paths.get(path) == wd:
+                        del self.paths[path]
+                if dirty is None:
+                    continue
+                dirty.add(path)
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                    dirty.add(os.path.dirname(path))
+        return dirty
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_monitor():
+    """
+    :return: 当前平台可用的目录监视器，支持inotify时使用InotifyMonitor，否则定时检查目录的修改时间
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyMonitor()
+        except (OSError, AttributeError):
+            pass
+    return PollingMonitor()
+
+
+class ModsWatcher:
+    """
+    记录源目录和目标目录的Mods状态，根据有变化的目录增量计算新增、删除和变化的Mods。
+    只检查有变化的目录：创意工坊物品只在mods文件夹的修改时间变化时重新扫描，
+    目标目录中的Mod以文件夹的inode和修改时间判断是否被替换或修改（只检测Mod文件夹第一层的变化）。
+    """
+
+    def __init__(self, source_directory=None, items=None, destination_directory=None, destination_mods=(),
+                 rule=DEFAULT_CONFLICT_RULE, pins=None):
+        """
+        :param source_directory: 源目录（单个），为None时不监视
+        :param items: 源目录的索引信息 {创意工坊ID: {"mtime": ..., "mods": [...]}}（见mods_index），作为对比的基准
+        :param destination_directory: 目标目录，为None时不监视
+        :param destination_mods: 界面上已经显示的目标Mods（通常来自mods_info.json），作为对比的基准
+        :param rule: 多个物品包含同名Mod时的选择规则（见mods_index.CONFLICT_RULES）
+        :param pins: 固定选择 {mod名称: 创意工坊ID}
+        """
+        self.rule = rule
+        self.pins = pins or {}
+        self.monitor = None
+        self.paths = {}
+        self.source_directory = os.path.abspath(source_directory) if source_directory else None
+        self.items = {item: {"mtime": info["mtime"], "mods": list(info["mods"])} for item, info in (items or {}).items()}
+        self.known_items = set(self.items)
+        self.mod_items = {}
+        for item, info in self.items.items():
+            for mod in info["mods"]:
+                self.mod_items.setdefault(mod, set()).add(item)
+        self.destination_directory = os.path.abspath(destination_directory) if destination_directory else None
+        # Mod名称 -> (inode, 修改时间)，基准中的Mods在第一次检查时记录
+        self.destination_mods = dict.fromkeys(destination_mods)
+
+        if self.source_directory:
+            self._watch(self.source_directory, WATCH_SOURCE)
+            for item in self.known_items:
+                self._watch_item(item)
+        if self.destination_directory:
+            self._watch(self.destination_directory, WATCH_DESTINATION)
+            for mod in self.destination_mods:
+                self._watch(os.path.join(self.destination_directory, mod), WATCH_DESTINATION_MOD, mod)
+
+    def set_monitor(self, monitor):
+        """
+        使用新的目录监视器，并注册所有需要监视的目录
+        :param monitor: PollingMonitor或InotifyMonitor
+        """
+        self.monitor = monitor
+        for path in list(self.paths):
+            monitor.add(path)
+
+    def _watch(self, path, kind, name=None):
+        self.paths[path] = (kind, name)
+        if self.monitor:
+            self.monitor.add(path)
+
+    def _unwatch(self, path):
+        self.paths.pop(path, None)
+        if self.monitor:
+            self.monitor.remove(path)
+
+    def _watch_item(self, item):
+        item_path = os.path.join(self.source_directory, item)
+        self._watch(item_path, WATCH_SOURCE_ITEM, item)
+        self._watch(os.path.join(item_path, "mods"), WATCH_SOURCE_ITEM_MODS, item)
+
+    def _unwatch_item(self, item):
+        item_path = os.path.join(self.source_directory, item)
+        self._unwatch(os.path.join(item_path, "mods"))
+        self._unwatch(item_path)
+
+    def resolve(self, mod):
+        """
+        :return: Mod对应的创意工坊ID（多个物品包含同名Mod时与build_id_map的结果相同），不存在时返回None
+        """
+        items = self.mod_items.get(mod)
+        return choose_workshop_item(mod, items, self.items, self.rule, self.pins) if items else None
+
+    def check(self, dirty=None):
+        """
+        检查有变化的目录
+        :param dirty: 有变化的目录集合，为None时检查所有监视的目录
+        :return: 变化的Mods，没有变化时返回None。格式为
+                 {"source": {"added": {mod: 创意工坊ID}, "removed": [mod, ...], "moved": {mod: 新的创意工坊ID}},
+                  "destination": {"added": [mod, ...], "removed": [mod, ...], "changed": [mod, ...]}}
+        """
+        if dirty is None:
+            dirty = set(self.paths)
+        items_to_check = set()
+        mods_to_check = set()
+        destination = {"added": set(), "removed": set(), "changed": set()}
+        for path in dirty:
+            kind, name = self.paths.get(path, (None, None))
+            if kind == WATCH_SOURCE:
+                items_to_check |= self._check_source_directory()
+            elif kind in (WATCH_SOURCE_ITEM, WATCH_SOURCE_ITEM_MODS):
+                items_to_check.add(name)
+            elif kind == WATCH_DESTINATION:
+                self._check_destination_directory(destination)
+            elif kind == WATCH_DESTINATION_MOD:
+                mods_to_check.add(name)
+
+        # Mod名称 -> 变化前的创意工坊ID
+        touched = {}
+        for item in items_to_check:
+            self._check_item(item, touched)
+        for mod in mods_to_check - destination["added"] - destination["removed"]:
+            self._check_destination_mod(mod, destination)
+
+        changes = {}
+        source = {"added": {}, "removed": [], "moved": {}}
+        for mod, before in touched.items():
+            after = self.resolve(mod)
+            if before is None and after is not None:
+                source["added"][mod] = after
+            elif before is not None and after is None:
+                source["removed"].append(mod)
+            elif before != after:
+                source["moved"][mod] = after
+        if any(source.values()):
+            changes["source"] = source
+        if any(destination.values()):
+            changes["destination"] = {key: sorted(mods) for key, mods in destination.items()}
+        return changes or None
+
+    def _check_source_directory(self):
+        """
+        :return: 新增或删除的创意工坊物品
+        """
+        try:
+            with os.scandir(self.source_directory) as entries:
+                current = {entry.name for entry in entries if entry.is_dir() and not is_internal_name(entry.name)}
+        except OSError:
+            current = set()
+        changed = current ^ self.known_items
+        for item in current - self.known_items:
+            self._watch_item(item)
+            self.known_items.add(item)
+        for item in self.known_items - current:
+            self._unwatch_item(item)
+            self.known_items.discard(item)
+        return changed
+
+    def _check_item(self, item, touched):
+        old = self.items.get(item)
+        if item in self.known_items:
+            item_path = os.path.join(self.source_directory, item)
+            mods_path = os.path.join(item_path, "mods")
+            mtime = get_mtime(mods_path)
+            if old and old["mtime"] == mtime:
+                return
+            if mtime is not None and self.monitor:
+                # mods文件夹可能是刚创建的，重新注册监视
+                self.monitor.add(mods_path)
+            mtime, mods = scan_workshop_item(item_path)
+        else:
+            mtime, mods = None, []
+        old_mods = set(old["mods"]) if old else set()
+        # 修改时间变化也可能改变同名Mod的选择，因此记录物品中所有Mods变化前的结果
+        for mod in old_mods.union(mods):
+            if mod not in touched:
+                touched[mod] = self.resolve(mod)
+        if mtime is None:
+            self.items.pop(item, None)
+        else:
+            self.items[item] = {"mtime": mtime, "mods": mods}
+        for mod in old_mods.symmetric_difference(mods):
+            if mod in old_mods:
+                self.mod_items[mod].discard(item)
+                if not self.mod_items[mod]:
+                    del self.mod_items[mod]
+            else:
+                self.mod_items.setdefault(mod, set()).add(item)
+
+    def _check_destination_directory(self, destination):
+        try:
+            with os.scandir(self.destination_directory) as entries:
+                current = {entry.name: entry.inode() for entry in entries
+                           if entry.is_dir() and not is_internal_name(entry.name)}
+        except OSError:
+            current = {}
+        for mod in [mod for mod in self.destination_mods if mod not in current]:
+            self._unwatch(os.path.join(self.destination_directory, mod))
+            del self.destination_mods[mod]
+            destination["removed"].add(mod)
+            destination["changed"].discard(mod)
+        for mod, inode in current.items():
+            mod_path = os.path.join(self.destination_directory, mod)
+            state = self.destination_mods.get(mod, False)
+            if state is False:
+                self._watch(mod_path, WATCH_DESTINATION_MOD, mod)
+                destination["added"].add(mod)
+                destination["removed"].discard(mod)
+            elif state is not None and state[0] == inode:
+                continue
+            elif state is not None:
+                # Mod文件夹被整个替换（例如覆盖复制），重新注册监视
+                if self.monitor:
+                    self.monitor.add(mod_path)
+                destination["changed"].add(mod)
+            self.destination_mods[mod] = (inode, get_mtime(mod_path))
+
+    def _check_destination_mod(self, mod, destination):
+        state = self.destination_mods.get(mod)
+        mtime = get_mtime(os.path.join(self.destination_directory, mod))
+        if state is None or mtime is None or mtime == state[1]:
+            return
+        self.destination_mods[mod] = (state[0], mtime)
+        destination["changed"].add(mod)
+
+
+def watch_mods_job(job, source_directory=None, items=None, destination_directory=None, destination_mods=(),
+                   rule=DEFAULT_CONFLICT_RULE, pins=None):
+    """
+    （在工作线程中长期运行，取消时结束）监视源目录和目标目录，每次发现变化时通过job.emit把变化交给界面（格式见ModsWatcher.check）。
+    第一次检查会与传入的基准对比，因此扫描完成后、监视开始前发生的变化也不会遗漏。
+    多个源目录在同一个任务中监视（共用一个目录监视器），每个源目录的变化分别报告，
+    源目录再多也只占用一个工作线程。
+    :param job: 当前任务
+    :param source_directory: 源目录，多个源目录用SOURCE_SEPARATOR分隔，为None时不监视
+    :param items: 源目录的索引信息（见mods_index.load_workshop_index的"items"），按"root"分配给各个源目录
+    :param destination_directory: 目标目录，为None时不监视
+    :param destination_mods: 界面上已经显示的目标Mods
+    :param rule: 多个物品包含同名Mod时的选择规则
+    :param pins: 固定选择 {mod名称: 创意工坊ID}
+    """
+    watchers = []
+    for directory in split_source_directories(source_directory) if source_directory else ():
+        library_items = {item: info for item, info in (items or {}).items() if info.get("root", directory) == directory}
+        watchers.append(ModsWatcher(directory, library_items, rule=rule, pins=pins))
+    if destination_directory:
+        watchers.append(ModsWatcher(None, None, destination_directory, destination_mods, rule, pins))
+    monitor = create_monitor()
+    try:
+        dirty = None
+        while True:
+            try:
+                for watcher in watchers:
+                    if watcher.monitor is not monitor:
+                        watcher.set_monitor(monitor)
+                        dirty = None
+                changes = [watcher.check(dirty) for watcher in watchers]
+            except OSError as e:
+                if isinstance(monitor, PollingMonitor):
+                    raise
+                # 例如inotify监视的目录数量达到系统上限，改为定时检查
+                job.log(f"{monitor.name}不可用（{e}），改为定时检查目录的修改时间")
+                monitor.close()
+                monitor = PollingMonitor()
+                continue
+            for watcher_changes in changes:
+                if watcher_changes:
+                    job.emit(watcher_changes)
+            dirty = monitor.wait(job)
+    finally:
+        monitor.close()
@@ -47,7 +47,10 @@ def move_mods_by_id(source_directory, destination_directory):
 
     # 读取txt文件中的ID列表
     with open(id_file_path, 'r', encoding='utf-8') as file:
-        id_list = file.read().strip().split(',')
+        id_list = [workshop_id.strip() for workshop_id in file.read().strip().split(',') if workshop_id.strip()]
+    # 使用集合查找，不再在循环中逐个搜索和删除列表元素
+    wanted_ids = set(id_list)
+    found_ids = set()
 
     # 检查源目录是否存在
     if not os.path.exists(source_directory):
@@ -81,7 +84,7 @@ def move_mods_by_id(source_directory, destination_directory):
             if os.path.exists(mod_folder_path):
                 for mod in os.listdir(mod_folder_path):
                     mod_item_path = os.path.join(mod_folder_path, mod)
-                    if os.path.isdir(mod_item_path) and item in id_list:
+                    if os.path.isdir(mod_item_path) and item in wanted_ids:
                         destination_mod_path = os.path.join(destination_directory, mod)
                         if os.path.exists(destination_mod_path):
                             # 如果目标目录中已经存在同名文件，直接覆盖
@@ -92,9 +95,9 @@ def move_mods_by_id(source_directory, destination_directory):
                         # 更新mods_info
                         mods_info["mods"][mod] = item  # 使用创意工坊ID作为值
 
-                        # 从id_list中移除已处理的ID
-                        id_list.remove(item)
-                    elif mod in id_list:
+                        # 记录已处理的ID
+                        found_ids.add(item)
+                    elif mod in wanted_ids:
                         # 如果Mod名称直接匹配
                         mod_item_path = os.path.join(mod_folder_path, mod)
                         destination_mod_path = os.path.join(destination_directory, mod)
@@ -107,11 +110,11 @@ def move_mods_by_id(source_directory, destination_directory):
                         # 更新mods_info
                         mods_info["mods"][mod] = item  # 使用创意工坊ID作为值
 
-                        # 从id_list中移除已处理的ID
-                        id_list.remove(item)
+                        # 记录已处理的Mod名称
+                        found_ids.add(mod)
 
-    # 剩余的id_list即为缺失的ID
-    missing_ids = id_list
+    # 没有处理过的ID即为缺失的ID
+    missing_ids = [workshop_id for workshop_id in id_list if workshop_id not in found_ids]
 
     # 更新mods_info中的mods_count
     mods_info["mods_count"] = len(mods_info["mods"])
@@ -1,18 +1,73 @@
 import os
-import shutil
+import multiprocessing
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import json
-from PIL import Image, ImageTk, Image
+from PIL import ImageTk
+from mods_index import (CONFLICT_RULES, SOURCE_SEPARATOR, build_id_map, get_mod_path, load_conflict_settings,
+                        save_conflict_settings, source_directories_exist, split_source_directories)
+from mods_thumbs import ThumbnailCache
+from mods_copy import DEFAULT_COPY_WORKERS, format_duration, format_size
+from mods_deploy import DEPLOY_COPY, DEPLOY_MODES
+from mods_journal import is_internal_name
+from mods_listview import VirtualListView
+from mods_jobs import JobExecutor, JOB_DONE, JOB_CANCELLED, JOB_PAUSED, UNIT_BYTES
+from mods_cache import save_json
+from mods_diff import build_sync_plan, describe_diff, describe_id_plan, diff_manifests, has_differences, parse_id_list
+from mods_manifest import load_manifest
+from mods_pack import PACK_EXTENSION, pack_mods_job, unpack_pack_job
+from mods_store import store_gc_job
+from mods_trace import format_history, format_summary, get_trace_directory, load_run_history
+from mods_trash import TrashBin, restore_mods_job, trash_mods_job, trash_purger_job
+from mods_ops import (move_or_copy_mods_job, plan_mods_by_id_job, generate_mods_info_job,
+                      calculate_mods_size_job, scan_mods_job, apply_destination_changes_job, run_sync_plan_job,
+                      load_metadata_job)
+from mods_metadata import build_server_config, format_server_config
+from mods_verify import audit_destination_job
+from mods_watch import watch_mods_job
 
 # 定义全局变量
 source_directory_entry = None
 destination_directory_entry = None
-source_listbox = None
-destination_listbox = None
+source_list_view = None
+destination_list_view = None
 mod_count_label = None
+size_label = None
+copy_workers_var = None
+delta_sync_var = None
+hash_compare_var = None
+manifest_files_var = None
+verify_copy_var = None
+deploy_mode_var = None
 id_map = {}
+source_items = {}
+source_metadata = {}
+id_conflicts = {}
 destination_mods_info = {}
+job_executor = None
+query_executor = None
+watch_executor = None
+scan_job = None
+# 源Mods列表（id_map）对应的源目录，扫描完成后设置
+loaded_source_directory = None
+source_watch_job = None
+destination_watch_job = None
+trash_purger = None
+undo_delete_button = None
+job_views = {}
+thumbnail_cache = None
+cover_request = None
+
+# 界面刷新间隔（毫秒），后台任务的日志和进度按这个频率刷新到界面
+UI_REFRESH_INTERVAL = 100
+# 封面加载状态的检查间隔（毫秒）和预加载的相邻Mods数量
+COVER_POLL_INTERVAL = 20
+COVER_PREFETCH_COUNT = 3
+# 比较结果中每组最多显示的Mod数量（导出和同步不受限制）
+COMPARE_DISPLAY_LIMIT = 2000
+# 耗时统计中列出的最近运行次数
+RUN_HISTORY_LIMIT = 50
+# 导出服务器配置时最多列出的缺少的依赖数量
+MISSING_REQUIRES_DISPLAY_LIMIT = 20
 
 # 打包exe命令: pyinstaller --windowed -F --icon=icon.ppm mods管理2.0.py
 
@@ -36,7 +91,6 @@ def update_log(text_widget, message):
     """
     text_widget.insert(tk.END, message + "\n")
     text_widget.see(tk.END)  # 自动滚动到底部
-    root.update()
 
 def close_log_window(window):
     """
@@ -45,6 +99,299 @@ def close_log_window(window):
     """
     window.destroy()
 
+def start_job(name, target, *args, on_done=None):
+    """
+    在后台线程中运行任务，并创建带进度条、暂停和取消按钮的日志窗口
+    :param name: 任务名称（显示在日志窗口标题中）
+    :param target: 任务函数，签名为 target(job, *args)
+    :param on_done: 任务结束后在界面线程中调用的回调函数，参数为Job对象
+    :return: Job对象
+    """
+    log_text, log_window = create_log_window()
+    log_window.title(f"操作日志 - {name}")
+
+    progress = ttk.Progressbar(log_window, orient="horizontal", length=300, mode="determinate")
+    progress.pack(pady=5)
+    status_label = tk.Label(log_window, text="")
+    status_label.pack(pady=5)
+
+    control_frame = tk.Frame(log_window)
+    control_frame.pack(pady=5)
+    job = job_executor.submit(name, target, *args)
+    pause_button = tk.Button(control_frame, text="暂停", command=lambda: toggle_pause_job(job))
+    pause_button.pack(side=tk.LEFT, padx=10)
+    cancel_button = tk.Button(control_frame, text="取消", command=job.cancel)
+    cancel_button.pack(side=tk.LEFT, padx=10)
+    # 关闭日志窗口等同于取消任务
+    log_window.protocol("WM_DELETE_WINDOW", job.cancel)
+
+    job_views[job] = {
+        "log_text": log_text,
+        "log_window": log_window,
+        "progress": progress,
+        "status_label": status_label,
+        "pause_button": pause_button,
+        "on_done": on_done,
+    }
+    return job
+
+def run_query(name, target, *args, on_done=None, on_data=None):
+    """
+    在后台线程中运行只读的快速任务（例如计算大小），不显示日志窗口，也不会排在复制任务后面
+    :param name: 任务名称
+    :param target: 任务函数，签名为 target(job, *args)
+    :param on_done: 任务结束后在界面线程中调用的回调函数，参数为Job对象
+    :param on_data: 任务通过job.emit发送中间结果时在界面线程中调用的回调函数，参数为 (Job对象, 数据)
+    :return: Job对象
+    """
+    job = query_executor.submit(name, target, *args)
+    job_views[job] = {"on_done": on_done, "on_data": on_data}
+    return job
+
+def toggle_pause_job(job):
+    """
+    暂停或继续任务
+    :param job: 任务
+    """
+    if job.state == JOB_PAUSED:
+        job.resume()
+        job_views[job]["pause_button"].config(text="暂停")
+    else:
+        job.pause()
+        job_views[job]["pause_button"].config(text="继续")
+
+def pump_job_events():
+    """
+    按固定频率把后台任务的日志、进度和完成事件刷新到界面
+    """
+    logs = {}
+    finished = []
+    for event in job_executor.drain_events() + query_executor.drain_events() + watch_executor.drain_events():
+        kind, job = event[0], event[1]
+        if kind == "log":
+            logs.setdefault(job, []).append(event[2])
+        elif kind == "data":
+            view = job_views.get(job)
+            if view and view.get("on_data"):
+                view["on_data"](job, event[2])
+        elif kind == "finished":
+            finished.append(job)
+
+    for job, messages in logs.items():
+        view = job_views.get(job)
+        if view and "log_text" in view:
+            update_log(view["log_text"], "\n".join(messages))
+
+    for job, view in job_views.items():
+        if "progress" not in view:
+            continue
+        stats = job.stats()
+        view["progress"]["maximum"] = max(stats["total"], 1)
+        view["progress"]["value"] = stats["done"]
+        view["status_label"].config(text=describe_job_progress(stats))
+
+    for job in finished:
+        view = job_views.pop(job, None)
+        if view:
+            if "log_window" in view:
+                close_log_window(view["log_window"])
+            if view["on_done"]:
+                view["on_done"](job)
+
+    root.after(UI_REFRESH_INTERVAL, pump_job_events)
+
+def watch_source_directory(source_directory, items):
+    """
+    在后台监视源目录，外部新增或删除的Mods增量更新到源Mods列表和id_map。
+    多个源目录在同一个任务中监视，有变化时重新合并索引（同名Mods可能在不同的源目录中）
+    :param source_directory: 源目录，多个源目录用SOURCE_SEPARATOR分隔
+    :param items: 扫描得到的索引信息，作为对比的基准
+    """
+    global source_watch_job
+    if source_watch_job:
+        source_watch_job.cancel()
+    directories = split_source_directories(source_directory)
+    settings = load_conflict_settings()
+
+    def on_data(job, changes):
+        if job is not source_watch_job or "source" not in changes:
+            return
+        if len(directories) == 1:
+            apply_source_changes(changes["source"])
+            load_source_metadata(source_directory, list(changes["source"]["added"]) +
+                                 list(changes["source"]["moved"]))
+        else:
+            refresh_source_libraries(source_directory)
+
+    source_watch_job = watch_executor.submit(f"监视源目录 {source_directory}", watch_mods_job, source_directory, items,
+                                             None, (), settings["rule"], settings["pins"])
+    job_views[source_watch_job] = {"on_done": None, "on_data": on_data}
+
+def refresh_source_libraries(source_directory, on_refreshed=None):
+    """
+    在后台重新合并多个源目录的索引（使用索引缓存，只重新扫描有变化的创意工坊物品），再把差异应用到源Mods列表
+    :param source_directory: 源目录，多个源目录用SOURCE_SEPARATOR分隔
+    :param on_refreshed: 可选的回调函数，合并完成后在界面线程中调用
+    """
+    def on_done(job):
+        if job.state == JOB_DONE and source_directory_entry.get() == source_directory:
+            rebuild_id_map(job.result["items"], job.result["metadata"])
+            if on_refreshed:
+                on_refreshed()
+
+    run_query("刷新源目录", scan_mods_job, source_directory, on_done=on_done)
+
+def rebuild_id_map(items, metadata=None):
+    """
+    按保存的同名Mods选择设置重新生成id_map，和原来不同的部分增量更新到源Mods列表
+    :param items: 扫描得到的索引信息
+    :param metadata: 扫描得到的mod.info元数据 {创意工坊ID: {mod名称: 元数据}}，为None时沿用原来的
+    """
+    global source_items, source_metadata
+    source_items = items
+    if metadata is not None:
+        source_metadata = metadata
+    id_conflicts.clear()
+    settings = load_conflict_settings()
+    new_id_map = build_id_map(items, settings["rule"], settings["pins"], id_conflicts)
+    apply_source_changes({
+        "added": {mod: workshop_id for mod, workshop_id in new_id_map.items() if mod not in id_map},
+        "removed": [mod for mod in id_map if mod not in new_id_map],
+        "moved": {mod: workshop_id for mod, workshop_id in new_id_map.items()
+                  if mod in id_map and id_map[mod] != workshop_id},
+    })
+    source_list_view.set_metadata(get_source_metadata(id_map))
+
+def get_source_metadata(mods):
+    """
+    :param mods: 源Mod名称列表
+    :return: {mod名称: mod.info元数据}（按id_map中使用的创意工坊物品，没有mod.info的Mod不包含在内）
+    """
+    metadata = {}
+    for mod in mods:
+        entry = source_metadata.get(id_map.get(mod), {}).get(mod)
+        if entry:
+            metadata[mod] = entry
+    return metadata
+
+def load_source_metadata(source_directory, mods):
+    """
+    在后台读取监视到的新增源Mods的mod.info，完成后更新源Mods列表
+    :param source_directory: 源目录
+    :param mods: 源Mod名称列表
+    """
+    mod_paths = {mod: get_mod_path(source_directory, id_map[mod], mod) for mod in mods if mod in id_map}
+    if not mod_paths:
+        return
+    workshop_ids = {mod: id_map[mod] for mod in mod_paths}
+
+    def on_done(job):
+        if job.state != JOB_DONE or source_directory_entry.get() != source_directory:
+            return
+        for mod, entry in job.result.items():
+            source_metadata.setdefault(workshop_ids[mod], {})[mod] = entry
+        source_list_view.set_metadata(job.result)
+
+    run_query("读取mod.info", load_metadata_job, mod_paths, on_done=on_done)
+
+def update_mod_count_label():
+    text = f"Mods总数：{len(id_map)}"
+    if id_conflicts:
+        text += f"（{len(id_conflicts)} 个同名Mods，点击“同名Mods”查看）"
+    mod_count_label.config(text=text)
+
+def watch_destination_directory(destination_directory, destination_mods):
+    """
+    在后台监视目标目录，外部新增、删除或修改的Mods增量更新到目标Mods列表和mods_info.json
+    :param destination_directory: 目标目录（包含Mods文件夹的目录）
+    :param destination_mods: 目标Mods列表中已有的Mods，作为对比的基准
+    """
+    global destination_watch_job
+    if destination_watch_job:
+        destination_watch_job.cancel()
+
+    def on_data(job, changes):
+        if job is destination_watch_job and "destination" in changes:
+            apply_destination_changes(destination_directory, changes["destination"])
+
+    destination_watch_job = watch_executor.submit("监视目标目录", watch_mods_job, None, None, destination_directory,
+                                                  list(destination_mods))
+    job_views[destination_watch_job] = {"on_done": None, "on_data": on_data}
+
+def start_trash_purger(destination_directory):
+    """
+    在后台定期清理目标目录回收站中超过保留时间的Mods，并更新撤销按钮
+    :param destination_directory: 目标目录（包含Mods文件夹的目录）
+    """
+    global trash_purger
+    if trash_purger:
+        trash_purger.cancel()
+    trash_purger = watch_executor.submit("清理回收站", trash_purger_job, destination_directory)
+    update_undo_delete_button(destination_directory)
+
+def update_undo_delete_button(destination_directory):
+    """
+    根据回收站中是否有可以恢复的Mods启用或禁用撤销按钮
+    :param destination_directory: 目标目录（包含Mods文件夹的目录）
+    """
+    batches = TrashBin(destination_directory).batches() if os.path.isdir(destination_directory) else []
+    if batches:
+        undo_delete_button.config(state=tk.NORMAL, text=f"撤销删除（{len(batches[0][1])}个Mods）")
+    else:
+        undo_delete_button.config(state=tk.DISABLED, text="撤销删除")
+
+def apply_source_changes(changes):
+    """
+    把监视到的源目录变化应用到源Mods列表和id_map
+    :param changes: 变化（见mods_watch.ModsWatcher.check的"source"）
+    """
+    removed = [mod for mod in changes["removed"] if id_map.pop(mod, None) is not None]
+    source_list_view.remove_items(removed)
+    id_map.update(changes["added"])
+    id_map.update(changes["moved"])
+    source_list_view.add_items(list(changes["added"].items()) + list(changes["moved"].items()))
+    update_mod_count_label()
+
+def apply_destination_changes(destination_directory, changes):
+    """
+    把监视到的目标目录变化应用到目标Mods列表，并在后台更新mods_info.json（排在其他写入任务之后）
+    :param destination_directory: 目标目录（包含Mods文件夹的目录）
+    :param changes: 变化（见mods_watch.ModsWatcher.check的"destination"）
+    """
+    added = {mod: id_map.get(mod, "") for mod in changes["added"]}
+    destination_list_view.remove_items(changes["removed"])
+    destination_list_view.add_items(added.items())
+    load_destination_metadata(destination_directory, list(added) + list(changes["changed"]))
+    job_executor.submit("更新mods_info.json", apply_destination_changes_job, destination_directory, added,
+                        changes["removed"], changes["changed"])
+
+def describe_job_progress(stats):
+    """
+    生成任务进度的描述文字
+    :param stats: Job.stats()的返回值
+    :return: 例如 '1.2 GB / 3.4 GB  56.3 MB/s  剩余 00:32  120 文件/秒  mod名称'
+    """
+    if stats["unit"] == UNIT_BYTES:
+        text = (f"{format_size(stats['done'])} / {format_size(stats['total'])}  "
+                f"{format_size(stats['rate'])}/s  剩余 {format_duration(stats['eta'])}  "
+                f"{stats['files_rate']:.0f} 文件/秒")
+    else:
+        text = f"{stats['done']}/{stats['total']}  剩余 {format_duration(stats['eta'])}"
+    return f"{text}  {stats['status']}"
+
+def show_job_result(job, done_message):
+    """
+    任务结束后根据任务状态显示结果
+    :param job: 任务
+    :param done_message: 任务成功完成时显示的消息
+    """
+    if job.state == JOB_DONE:
+        messagebox.showinfo("完成", done_message)
+    elif job.state == JOB_CANCELLED:
+        messagebox.showwarning("已取消", f"{job.name}已取消，已完成的部分已保存。")
+    else:
+        messagebox.showerror("错误", f"{job.name}失败: {job.error}")
+
 def load_existing_mods(destination_directory):
     """
     加载目标目录中的现有Mods信息
@@ -54,32 +401,17 @@ def load_existing_mods(destination_directory):
     existing_mods_info = {}
     for mod in os.listdir(destination_directory):
         mod_path = os.path.join(destination_directory, mod)
-        if os.path.isdir(mod_path):
+        if os.path.isdir(mod_path) and not is_internal_name(mod):
             existing_mods_info[mod] = ""
     return existing_mods_info
 
-def find_creative_workshop_id(mod_name, source_directory):
-    """
-    通过源目录查找指定Mod的创意工坊ID
-    :param mod_name: Mod名称
-    :param source_directory: 源目录（包含Mods文件夹的目录）
-    :return: 创意工坊ID，如果找不到则返回空字符串
-    """
-    for item in os.listdir(source_directory):
-        item_path = os.path.join(source_directory, item)
-        if os.path.isdir(item_path):
-            mod_folder_path = os.path.join(item_path, "mods")
-            if os.path.exists(mod_folder_path) and mod_name in os.listdir(mod_folder_path):
-                return item
-    return ""
-
 def generate_mods_info(source_directory, destination_directory):
     """
-    生成mods_info.json文件
+    生成mods_info.json文件（包含每个Mod的内容哈希，在后台线程中计算）
     :param source_directory: 源目录（包含Mods文件夹的目录）
     :param destination_directory: 目标目录（包含Mods文件夹的目录）
     """
-    if not os.path.exists(source_directory):
+    if not source_directories_exist(source_directory):
         messagebox.showerror("错误", "源目录不存在，请检查路径是否正确。")
         return
 
@@ -87,19 +419,18 @@ def generate_mods_info(source_directory, destination_directory):
         messagebox.showerror("错误", "目标目录不存在，请检查路径是否正确。")
         return
 
-    mods_info = {"mods_count": 0, "mods": {}}
-    for mod in os.listdir(destination_directory):
-        mod_path = os.path.join(destination_directory, mod)
-        if os.path.isdir(mod_path):
-            # 尝试通过源目录获取创意工坊ID
-            workshop_id = find_creative_workshop_id(mod, source_directory)
-            mods_info["mods"][mod] = workshop_id
-    
-    mods_info["mods_count"] = len(mods_info["mods"])
-    json_path = os.path.join(destination_directory, "mods_info.json")
-    with open(json_path, 'w', encoding='utf-8') as file:
-        json.dump(mods_info, file, ensure_ascii=False, indent=4)
-    messagebox.showinfo("完成", "mods_info.json文件已生成。")
+    # 源Mods列表已经扫描完成时直接使用列表的id_map，否则在后台任务中加载索引，不阻塞界面
+    if source_directory == loaded_source_directory and id_map:
+        mods_id_map = dict(id_map)
+    else:
+        mods_id_map = None
+
+    def on_done(job):
+        show_job_result(job, "mods_info.json文件已生成。")
+        load_destination_mods(destination_directory)
+
+    start_job("生成mods_info.json", generate_mods_info_job, destination_directory, mods_id_map,
+              manifest_files_var.get(), source_directory, on_done=on_done)
 
 def copy_mods(source_directory, destination_directory, selected_mods):
     """
@@ -108,20 +439,27 @@ def copy_mods(source_directory, destination_directory, selected_mods):
     :param destination_directory: 目标目录（将Mods复制到的地方）
     :param selected_mods: 选定的Mods列表
     """
-    log_text, log_window = create_log_window()
-    move_or_copy_mods(source_directory, destination_directory, selected_mods, action='copy', log_text=log_text)
-    close_log_window(log_window)
+    move_or_copy_mods(source_directory, destination_directory, selected_mods, action='copy')
+
+def get_deploy_mode():
+    """
+    :return: 界面上选择的部署方式（见mods_deploy）
+    """
+    for mode, label in DEPLOY_MODES.items():
+        if label == deploy_mode_var.get():
+            return mode
+    return DEPLOY_COPY
 
-def move_or_copy_mods(source_directory, destination_directory, selected_mods, action='copy', log_text=None):
+def move_or_copy_mods(source_directory, destination_directory, selected_mods, action='copy'):
     """
     复制或移动选定的Mods文件夹内的Mods到另一个目录，并更新mods_info.json
+    复制在后台线程中进行，界面不会卡住，可以暂停或取消
     :param source_directory: 源目录（包含Mods文件夹的目录）
     :param destination_directory: 目标目录（将Mods复制到的地方）
     :param selected_mods: 选定的Mods列表
     :param action: 动作，'copy' 或 'move'
-    :param log_text: 日志显示的文本框
     """
-    if not os.path.exists(source_directory):
+    if not source_directories_exist(source_directory):
         messagebox.showerror("错误", "源目录不存在，请检查路径是否正确。")
         return
 
@@ -129,89 +467,78 @@ def move_or_copy_mods(source_directory, destination_directory, selected_mods, ac
         # 目标目录不存在时创建它
         os.makedirs(destination_directory)
 
-    # 读取或初始化JSON文档
-    json_path = os.path.join(destination_directory, "mods_info.json")
-    if os.path.exists(json_path):
-        with open(json_path, 'r', encoding='utf-8') as file:
-            mods_info = json.load(file)
-    else:
-        mods_info = {"mods_count": 0, "mods": {}}
-
-    # 创建进度条
-    progress = ttk.Progressbar(root, orient="horizontal", length=300, mode="determinate")
-    progress.pack(pady=10)
-    progress["maximum"] = len(selected_mods)
-    progress["value"] = 0
-
-    # 设定一个虚假的进度
-    fake_max_value = 0.9 * len(selected_mods)
-    for mod in selected_mods:
-        mod_item_path = os.path.join(source_directory, id_map[mod], "mods", mod)
-        if os.path.exists(mod_item_path):
-            destination_mod_path = os.path.join(destination_directory, mod)
-            if os.path.exists(destination_mod_path):
-                # 如果目标目录中已经存在同名文件，直接覆盖
-                shutil.rmtree(destination_mod_path)  # 删除已存在的目录
-            if action == 'copy':
-                shutil.copytree(mod_item_path, destination_mod_path)
-            elif action == 'move':
-                shutil.move(mod_item_path, destination_mod_path)
-            message = f"已{action} {mod_item_path} 到 {destination_mod_path}"
-            if log_text:
-                update_log(log_text, message)
-            print(message)
-
-            # 更新mods_info
-            workshop_id = find_creative_workshop_id(mod, source_directory)
-            mods_info["mods"][mod] = workshop_id
-
-            # 更新进度条
-            if progress["value"] < fake_max_value:
-                progress["value"] += 1
-            root.update()
-
-    # 更新进度条到100%
-    progress["value"] = len(selected_mods)
-    root.update()
-
-    # 更新mods_info中的mods_count
-    mods_info["mods_count"] = len(mods_info["mods"])
-
-    # 保存更新后的JSON文档
-    with open(json_path, 'w', encoding='utf-8') as file:
-        json.dump(mods_info, file, ensure_ascii=False, indent=4)
-
-    progress.destroy()
-    messagebox.showinfo("完成", f"选定的Mods{action}完成，并更新了mods_info.json。")
-    # 刷新目标目录的列表
-    load_destination_mods(destination_directory)
+    def on_done(job):
+        show_job_result(job, f"选定的Mods{action}完成，并更新了mods_info.json。")
+        # 刷新目标目录的列表
+        load_destination_mods(destination_directory)
+
+    start_job(f"{action} Mods", move_or_copy_mods_job, source_directory, destination_directory,
+              list(selected_mods), dict(id_map), action, copy_workers_var.get(),
+              delta_sync_var.get(), hash_compare_var.get(), get_deploy_mode(), None, verify_copy_var.get(),
+              on_done=on_done)
 
 def select_source_directory():
     directory = filedialog.askdirectory()
     if source_directory_entry:
         source_directory_entry.delete(0, tk.END)
         source_directory_entry.insert(0, directory)
-        source_listbox.delete(0, tk.END)
+        source_list_view.clear()
         mod_count_label.config(text="Mods总数：0")
         if directory:
             load_mods(directory)
 
+def add_source_directory():
+    """
+    再添加一个源目录（例如另一个Steam库的创意工坊目录），重新扫描所有源目录
+    """
+    directory = filedialog.askdirectory()
+    if not directory or not source_directory_entry:
+        return
+    directories = split_source_directories(source_directory_entry.get())
+    if os.path.abspath(directory) in directories:
+        return
+    source_directory = SOURCE_SEPARATOR.join(directories + [os.path.abspath(directory)])
+    source_directory_entry.delete(0, tk.END)
+    source_directory_entry.insert(0, source_directory)
+    load_mods(source_directory)
+
 def load_mods(source_directory):
-    mods_list = set()
-    for item in os.listdir(source_directory):
-        item_path = os.path.join(source_directory, item)
-        if os.path.isdir(item_path):
-            mod_folder_path = os.path.join(item_path, "mods")
-            if os.path.exists(mod_folder_path):
-                for mod in os.listdir(mod_folder_path):
-                    mod_item_path = os.path.join(mod_folder_path, mod)
-                    if os.path.isdir(mod_item_path):
-                        mods_list.add(mod)
-                        id_map[mod] = item  # 存储mod与创意工坊ID的映射
-    
-    for mod in mods_list:
-        source_listbox.insert(tk.END, mod)
-    mod_count_label.config(text=f"Mods总数：{len(mods_list)}")
+    """
+    在后台流式扫描源目录，扫描到的Mods分批加入列表，不需要等整个目录扫描完
+    :param source_directory: 源目录（包含Mods文件夹的目录）
+    """
+    global scan_job, loaded_source_directory
+    if scan_job:
+        scan_job.cancel()
+    loaded_source_directory = None
+    if source_watch_job:
+        source_watch_job.cancel()
+    id_map.clear()
+    id_conflicts.clear()
+    source_list_view.clear()
+
+    def on_data(job, batch):
+        if job is not scan_job:
+            return
+        id_map.update(batch)  # 存储mod与创意工坊ID的映射
+        source_list_view.add_items(batch)
+        mod_count_label.config(text=f"Mods总数：{len(id_map)}（扫描中...）")
+
+    def on_done(job):
+        global loaded_source_directory
+        if job is not scan_job:
+            return
+        if job.state == JOB_DONE:
+            # 扫描完成后使用完整索引，按选择规则确定同名Mods使用哪个创意工坊物品
+            rebuild_id_map(job.result["items"], job.result["metadata"])
+            loaded_source_directory = source_directory
+            watch_source_directory(source_directory, job.result["items"])
+        elif job.state != JOB_CANCELLED:
+            messagebox.showerror("错误", f"扫描源目录失败: {job.error}")
+        update_mod_count_label()
+
+    mod_count_label.config(text="Mods总数：0（扫描中...）")
+    scan_job = run_query("扫描源目录", scan_mods_job, source_directory, on_done=on_done, on_data=on_data)
 
 def select_destination_directory():
     directory = filedialog.askdirectory()
@@ -226,52 +553,98 @@ def select_destination_directory():
 def load_destination_mods(destination_directory):
     global destination_mods_info
     destination_mods_info = {}
-    destination_listbox.delete(0, tk.END)
     if os.path.exists(os.path.join(destination_directory, "mods_info.json")):
-        with open(os.path.join(destination_directory, "mods_info.json"), 'r', encoding='utf-8') as file:
-            destination_mods_info = json.load(file)
-        for mod in destination_mods_info["mods"].keys():
-            destination_listbox.insert(tk.END, mod)
+        destination_mods_info = load_manifest(os.path.join(destination_directory, "mods_info.json"))
+        destination_list_view.set_items(destination_mods_info["mods"].items())
+    else:
+        destination_list_view.clear()
+    load_destination_metadata(destination_directory, destination_list_view.names())
+    watch_destination_directory(destination_directory, destination_list_view.names())
+    start_trash_purger(destination_directory)
+
+def load_destination_metadata(destination_directory, mods):
+    """
+    在后台读取目标Mods的mod.info（mod.info没有变化的Mod使用缓存），完成后更新目标Mods列表
+    :param destination_directory: 目标目录
+    :param mods: 目标Mod名称列表
+    """
+    if not mods:
+        return
+
+    def on_done(job):
+        if job.state != JOB_DONE or destination_directory_entry.get() != destination_directory:
+            return
+        destination_list_view.set_metadata(job.result)
 
-def show_cover_image(event, source_directory, destination_directory, listbox, id_map):
+    run_query("读取mod.info", load_metadata_job, {mod: os.path.join(destination_directory, mod) for mod in mods},
+              on_done=on_done)
+
+def get_mod_directory(list_view, mod_name, source_directory, destination_directory):
     """
-    显示选定Mods的封面图片
+    获取列表中某个Mod所在的文件夹
+    :param list_view: 列表对象
+    :param mod_name: Mod名称
+    :param source_directory: 源目录
+    :param destination_directory: 目标目录
+    :return: Mod文件夹路径，找不到时返回None
+    """
+    if list_view is source_list_view:
+        if mod_name not in id_map:
+            return None
+        return get_mod_path(source_directory, id_map[mod_name], mod_name)
+    return os.path.join(destination_directory, mod_name)
+
+def show_cover_image(event, source_directory, destination_directory, list_view, id_map):
+    """
+    显示选定Mods的封面图片（缩略图在后台解码并缓存，同时预加载相邻Mods的封面）
     :param event: 事件对象
     :param source_directory: 源目录
     :param destination_directory: 目标目录
-    :param listbox: 列表框对象
+    :param list_view: 列表对象
     :param id_map: Mod与创意工坊ID的映射字典
     """
-    selected_index = listbox.curselection()
-    if not selected_index:
+    global cover_request
+    mod_name = list_view.get_active()
+    if mod_name is None:
         return
 
-    mod_name = listbox.get(selected_index[0])
-    if listbox == source_listbox:
-        mod_directory = os.path.join(source_directory, id_map[mod_name], "mods", mod_name)
-    else:
-        mod_directory = os.path.join(destination_directory, mod_name)
-
-    # 查找文件夹中的所有png图片
-    png_files = [f for f in os.listdir(mod_directory) if f.lower().endswith('.png')]
-    if png_files:
-        cover_path = os.path.join(mod_directory, png_files[0])  # 使用找到的第一张png图片
-        try:
-            image = Image.open(cover_path)
-            image = image.resize((200, 200), Image.Resampling.LANCZOS)  # 使用新的重采样方法
-            photo = ImageTk.PhotoImage(image)
-            # 清除之前显示的图片
-            for widget in image_frame.winfo_children():
-                widget.destroy()
-            image_label = tk.Label(image_frame, image=photo)
-            image_label.image = photo  # 防止图片被垃圾回收
-            image_label.pack()
-            image_frame.pack()
-        except Exception as e:
-            print(f"图片无法打开: {e}")  # 调试信息
-            pass  # 如果图片无法打开，不做任何处理
-    else:
+    mod_directory = get_mod_directory(list_view, mod_name, source_directory, destination_directory)
+    if mod_directory is None:
+        return
+    cover_request = thumbnail_cache.request(mod_directory)
+    display_cover_image(cover_request)
+
+    # 预加载相邻Mods的封面，用方向键滚动列表时可以直接从缓存显示
+    thumbnail_cache.prefetch([directory for directory in
+                              (get_mod_directory(list_view, name, source_directory, destination_directory)
+                               for name in list_view.neighbours(mod_name, COVER_PREFETCH_COUNT))
+                              if directory])
+
+def display_cover_image(request):
+    """
+    缩略图加载完成后显示在图片框中（还没加载完时稍后再检查）
+    :param request: ThumbnailCache.request返回的Future
+    """
+    if request is not cover_request:
+        return  # 已经选择了其他Mod
+    if not request.done():
+        root.after(COVER_POLL_INTERVAL, lambda: display_cover_image(request))
+        return
+    try:
+        image = request.result()
+    except Exception:
+        return  # 如果图片无法打开，不做任何处理
+    if image is None:
         image_frame.forget()  # 如果没有找到png图片，隐藏图片显示框
+        return
+    photo = ImageTk.PhotoImage(image)
+    # 清除之前显示的图片
+    for widget in image_frame.winfo_children():
+        widget.destroy()
+    image_label = tk.Label(image_frame, image=photo)
+    image_label.image = photo  # 防止图片被垃圾回收
+    image_label.pack()
+    image_frame.pack()
 
 
 def start_copying():
@@ -286,22 +659,19 @@ def start_copying():
         messagebox.showwarning("警告", "请选择目标目录。")
         return
     
-    selected_mods = source_listbox.curselection()
+    selected_mods = source_list_view.get_selection()
     if not selected_mods:
         messagebox.showwarning("警告", "请选择需要复制的Mods。")
         return
     
-    selected_mods = [source_listbox.get(index) for index in selected_mods]
     copy_mods(source_directory, destination_directory, selected_mods)
 
 def export_mod_ids():
-    selected_mods = source_listbox.curselection()
+    selected_mods = source_list_view.get_selection()
     if not selected_mods:
         messagebox.showwarning("警告", "请选择需要导出ID的Mods。")
         return
     
-    selected_mods = [source_listbox.get(index) for index in selected_mods]
-    
     # 获取创意工坊ID
     id_list = [id_map[mod] for mod in selected_mods]
     
@@ -316,9 +686,54 @@ def export_mod_ids():
     
     messagebox.showinfo("完成", f"创意工坊ID已导出到 {save_file_path}。")
 
+def export_server_config():
+    """
+    把选定的源Mods导出为服务器配置中的WorkshopItems=和Mods=（Mod ID来自mod.info），并提示缺少的依赖
+    """
+    selected_mods = source_list_view.get_selection()
+    if not selected_mods:
+        messagebox.showwarning("警告", "请选择需要导出的Mods。")
+        return
+    config = build_server_config(selected_mods, id_map, get_source_metadata(selected_mods))
+
+    save_file_path = filedialog.asksaveasfilename(defaultextension=".txt",
+                                                  filetypes=[("Text files", "*.txt"), ("ini files", "*.ini")],
+                                                  title="保存服务器配置")
+    if not save_file_path:
+        return
+    with open(save_file_path, 'w', encoding='utf-8') as file:
+        file.write(format_server_config(config))
+
+    message = f"{len(config['mods'])} 个Mod ID已导出到 {save_file_path}。"
+    if config["missing_requires"]:
+        missing = [f"{mod_id} 依赖 {required}" for mod_id, required in config["missing_requires"]]
+        message += "\n\n以下依赖不在选定的Mods中：\n" + "\n".join(missing[:MISSING_REQUIRES_DISPLAY_LIMIT])
+        if len(missing) > MISSING_REQUIRES_DISPLAY_LIMIT:
+            message += f"\n... 等 {len(missing)} 个"
+    messagebox.showinfo("完成", message)
+
 def select_all_mods():
-    if source_listbox:
-        source_listbox.select_set(0, tk.END)  # 选中所有项目
+    if source_list_view:
+        source_list_view.select_all()  # 选中当前显示的所有项目（选择变化时会重新计算大小）
+
+def calculate_selected_size():
+    """
+    在后台计算选定的源Mods的总大小并显示在界面上（结果按目录修改时间缓存，重复选择时立即返回）
+    """
+    selected_mods = source_list_view.get_selection()
+    source_directory = source_directory_entry.get()
+    mod_paths = [get_mod_path(source_directory, id_map[mod], mod) for mod in selected_mods if mod in id_map]
+    if not mod_paths:
+        size_label.config(text="已选Mods总大小：0 B")
+        return
+
+    def on_done(job):
+        if job.state == JOB_DONE:
+            size, count = job.result
+            size_label.config(text=f"已选Mods总大小：{format_size(size)}（{len(mod_paths)} 个Mods，{count} 个文件）")
+
+    size_label.config(text="已选Mods总大小：计算中...")
+    run_query("计算Mods总大小", calculate_mods_size_job, mod_paths, on_done=on_done)
 
 def compare_mods():
     local_directory = destination_directory_entry.get()  # 使用目标目录作为本地目录
@@ -328,9 +743,9 @@ def compare_mods():
         messagebox.showerror("错误", "目标目录不存在，请检查路径是否正确。")
         return
 
-    # 选择远程mods_info.json文件
-    remote_json_path = filedialog.askopenfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")], title="选择远程mods_info.json文件")
-    if not remote_json_path:
+    # 选择一个或多个远程mods_info.json文件
+    remote_json_paths = filedialog.askopenfilenames(defaultextension=".json", filetypes=[("JSON files", "*.json")], title="选择远程mods_info.json文件（可以多选）")
+    if not remote_json_paths:
         return
 
     local_json_path = os.path.join(local_directory, "mods_info.json")
@@ -340,19 +755,9 @@ def compare_mods():
         messagebox.showerror("错误", "本地mods_info.json不存在，请检查路径是否正确。")
         return
 
-    # 读取本地和远程的mods_info.json
-    with open(local_json_path, 'r', encoding='utf-8') as file:
-        local_mods_info = json.load(file)
-    with open(remote_json_path, 'r', encoding='utf-8') as file:
-        remote_mods_info = json.load(file)
-
-    # 获取本地和远程的mods集合
-    local_mods = set(local_mods_info["mods"].keys())
-    remote_mods = set(remote_mods_info["mods"].keys())
-
-    # 找出本地和远程的mods差异
-    missing_on_local = remote_mods - local_mods
-    missing_on_remote = local_mods - remote_mods
+    # 读取本地和远程的mods_info.json（兼容旧格式），按名称、创意工坊ID和内容哈希比较
+    local_mods_info = load_manifest(local_json_path)
+    diff = diff_manifests(local_mods_info, [load_manifest(path) for path in remote_json_paths])
 
     # 创建结果窗口
     result_window = tk.Toplevel()
@@ -360,32 +765,19 @@ def compare_mods():
     result_window.geometry("600x400")
 
     # 创建并放置结果标签
-    result_label = tk.Label(result_window, text="Mods比较结果：")
+    result_label = tk.Label(result_window, text=f"Mods比较结果（{len(remote_json_paths)} 个远程文件）：")
     result_label.pack(pady=5)
 
-    # 创建并放置结果文本框
+    # 创建并放置结果文本框，结果一次性插入
     result_text = tk.Text(result_window, width=70, height=15)
     result_text.pack(pady=5, padx=10, fill=tk.BOTH, expand=True)
-
-    # 显示结果
-    if missing_on_local:
-        result_text.insert(tk.END, "本地缺少的Mods:\n")
-        for mod in missing_on_local:
-            result_text.insert(tk.END, f"- {mod} (ID: {remote_mods_info['mods'][mod]})\n")
-        result_text.insert(tk.END, "\n")
-    if missing_on_remote:
-        result_text.insert(tk.END, "远程缺少的Mods:\n")
-        for mod in missing_on_remote:
-            result_text.insert(tk.END, f"- {mod} (ID: {local_mods_info['mods'][mod]})\n")
-
-    if not missing_on_local and not missing_on_remote:
-        result_text.insert(tk.END, "两个设备上的Mods完全一致。")
-    else:
+    result_text.insert(tk.END, describe_diff(diff, COMPARE_DISPLAY_LIMIT))
+    if has_differences(diff):
         result_text.insert(tk.END, "请检查上述结果并进行相应的操作。")
 
-    def export_missing_ids(mods, id_map, title="导出ID"):
+    def export_missing_ids(mods, title="导出ID"):
         # 获取创意工坊ID
-        id_list = [id_map[mod] for mod in mods]
+        id_list = [mods[mod] for mod in sorted(mods) if mods[mod]]
         
         # 选择保存位置
         save_file_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt")], title=title)
@@ -398,61 +790,334 @@ def compare_mods():
         
         messagebox.showinfo("完成", f"创意工坊ID已导出到 {save_file_path}。")
 
+    def make_sync_plan():
+        source_directory = source_directory_entry.get()
+        if not source_directories_exist(source_directory) or not id_map:
+            messagebox.showerror("错误", "请先选择源目录并等待扫描完成。")
+            return None
+        prune = bool(diff["extra"]) and messagebox.askyesno(
+            "同步计划", f"是否同时删除远程没有的 {len(diff['extra'])} 个本地Mods？", parent=result_window)
+        return build_sync_plan(diff, id_map, source_directory, local_directory, prune)
+
+    def sync_to_destination():
+        plan = make_sync_plan()
+        if plan is None:
+            return
+        if not plan["copy"] and not plan["delete"]:
+            messagebox.showinfo("同步", "没有可以自动处理的Mods。", parent=result_window)
+            return
+        if not messagebox.askyesno("同步", f"将复制 {len(plan['copy'])} 个Mods，删除 {len(plan['delete'])} 个Mods，"
+                                           f"跳过 {len(plan['skipped'])} 个无法自动处理的Mods，确定继续吗？", parent=result_window):
+            return
+
+        def on_done(job):
+            if job.state == JOB_DONE:
+                show_job_result(job, f"已复制 {len(job.result['copied'])} 个Mods，删除 {len(job.result['deleted'])} 个Mods。")
+            else:
+                show_job_result(job, "")
+            load_destination_mods(local_directory)
+
+        start_job("执行同步计划", run_sync_plan_job, plan, copy_workers_var.get(), delta_sync_var.get(),
+                  hash_compare_var.get(), get_deploy_mode(), verify_copy_var.get(), on_done=on_done)
+        result_window.destroy()
+
+    def save_sync_plan():
+        plan = make_sync_plan()
+        if plan is None:
+            return
+        save_file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")], title="保存同步计划")
+        if save_file_path:
+            save_json(save_file_path, plan, indent=4)
+            messagebox.showinfo("完成", f"同步计划已保存到 {save_file_path}，可以使用 mods_cli.py apply-plan 执行。")
+
     # 创建一个Frame来放置按钮
     button_frame = tk.Frame(result_window)
     button_frame.pack(pady=10)
 
     # 创建并放置导出本地缺少的ID按钮
-    if missing_on_local:
-        export_local_button = tk.Button(button_frame, text="导出本地缺少的ID", command=lambda: export_missing_ids(missing_on_local, remote_mods_info["mods"]))
+    if diff["missing"]:
+        export_local_button = tk.Button(button_frame, text="导出本地缺少的ID", command=lambda: export_missing_ids(diff["missing"]))
         export_local_button.pack(side=tk.LEFT, padx=10)
 
     # 创建并放置导出远程缺少的ID按钮
-    if missing_on_remote:
-        export_remote_button = tk.Button(button_frame, text="导出远程缺少的ID", command=lambda: export_missing_ids(missing_on_remote, local_mods_info["mods"]))
+    if diff["extra"]:
+        export_remote_button = tk.Button(button_frame, text="导出远程缺少的ID", command=lambda: export_missing_ids(diff["extra"]))
         export_remote_button.pack(side=tk.LEFT, padx=10)
 
+    # 创建并放置同步按钮：缺少和版本不同的Mods从源目录复制到目标目录
+    if has_differences(diff):
+        sync_button = tk.Button(button_frame, text="同步到目标目录", command=sync_to_destination)
+        sync_button.pack(side=tk.LEFT, padx=10)
+        save_plan_button = tk.Button(button_frame, text="保存同步计划", command=save_sync_plan)
+        save_plan_button.pack(side=tk.LEFT, padx=10)
+
     # 创建并放置关闭按钮
     close_button = tk.Button(button_frame, text="关闭", command=result_window.destroy)
     close_button.pack(side=tk.LEFT, padx=10)
 
 def delete_mods():
-    selected_mods = destination_listbox.curselection()
+    selected_mods = destination_list_view.get_selection()
     if not selected_mods:
         messagebox.showwarning("警告", "请选择需要删除的Mods。")
         return
-    
-    selected_mods = [destination_listbox.get(index) for index in selected_mods]
+
     destination_directory = destination_directory_entry.get()
+    # Mods只是移到目标目录中的回收站，立即从列表中移除，清理回收站之前可以撤销
+    destination_list_view.remove_items(selected_mods)
+
+    def on_done(job):
+        if job.state == JOB_DONE:
+            update_undo_delete_button(destination_directory)
+        else:
+            show_job_result(job, "")
+            load_destination_mods(destination_directory)
 
-    for mod in selected_mods:
-        mod_path = os.path.join(destination_directory, mod)
-        if os.path.exists(mod_path):
-            shutil.rmtree(mod_path)  # 删除mods
-            destination_listbox.delete(destination_listbox.get(0, tk.END).index(mod))  # 从列表框中删除
-
-    # 更新mods_info.json
-    json_path = os.path.join(destination_directory, "mods_info.json")
-    if os.path.exists(json_path):
-        with open(json_path, 'r', encoding='utf-8') as file:
-            mods_info = json.load(file)
-        for mod in selected_mods:
-            if mod in mods_info["mods"]:
-                del mods_info["mods"][mod]
-        mods_info["mods_count"] = len(mods_info["mods"])
-        with open(json_path, 'w', encoding='utf-8') as file:
-            json.dump(mods_info, file, ensure_ascii=False, indent=4)
-    messagebox.showinfo("完成", "选定的Mods已删除，并更新了mods_info.json。")
-    # 刷新目标目录的列表
-    load_destination_mods(destination_directory)
+    job = job_executor.submit("删除Mods", trash_mods_job, destination_directory, selected_mods)
+    job_views[job] = {"on_done": on_done}
+
+def undo_delete_mods():
+    """
+    从回收站恢复最近一次删除的目标Mods
+    """
+    destination_directory = destination_directory_entry.get()
+
+    def on_done(job):
+        if job.state == JOB_DONE:
+            messagebox.showinfo("完成", f"已恢复 {len(job.result)} 个Mods。")
+        else:
+            show_job_result(job, "")
+        load_destination_mods(destination_directory)
+
+    undo_delete_button.config(state=tk.DISABLED)
+    job = job_executor.submit("恢复Mods", restore_mods_job, destination_directory)
+    job_views[job] = {"on_done": on_done}
+
+def export_mods_pack():
+    """
+    把选定的源Mods（没有选择时为整个目标目录）打包为一个Mods包
+    """
+    source_directory = source_directory_entry.get()
+    destination_directory = destination_directory_entry.get()
+    selected_mods = source_list_view.get_selection()
+    if selected_mods:
+        mods = [(mod, get_mod_path(source_directory, id_map[mod], mod), id_map[mod]) for mod in selected_mods]
+    else:
+        if not os.path.isdir(destination_directory):
+            messagebox.showwarning("警告", "请选择需要打包的源Mods，或者选择目标目录。")
+            return
+        if not messagebox.askyesno("导出Mods包", "没有选择源Mods，是否打包整个目标目录？"):
+            return
+        destination_info = load_manifest(os.path.join(destination_directory, "mods_info.json"))
+        mods = [(mod, os.path.join(destination_directory, mod), workshop_id)
+                for mod, workshop_id in sorted(destination_info["mods"].items())
+                if os.path.isdir(os.path.join(destination_directory, mod))]
+
+    pack_path = filedialog.asksaveasfilename(defaultextension=PACK_EXTENSION,
+                                             filetypes=[("Mods包", "*" + PACK_EXTENSION)], title="保存Mods包")
+    if not pack_path:
+        return
+
+    def on_done(job):
+        if job.state == JOB_DONE:
+            result = job.result
+            show_job_result(job, f"已导出 {result['mods_count']} 个Mods（{format_size(result['size'])}，"
+                                 f"压缩后 {format_size(result['pack_size'])}）到 {pack_path}。")
+        else:
+            show_job_result(job, "")
+
+    start_job("导出Mods包", pack_mods_job, pack_path, mods, on_done=on_done)
+
+def import_mods_pack():
+    """
+    把Mods包解压到目标目录，并更新mods_info.json
+    """
+    destination_directory = destination_directory_entry.get()
+    if not destination_directory:
+        messagebox.showerror("错误", "请先选择目标目录。")
+        return
+    pack_path = filedialog.askopenfilename(filetypes=[("Mods包", "*" + PACK_EXTENSION)], title="选择Mods包")
+    if not pack_path:
+        return
+
+    def on_done(job):
+        show_job_result(job, "Mods包已解压到目标目录，并更新了mods_info.json。")
+        load_destination_mods(destination_directory)
+
+    start_job("导入Mods包", unpack_pack_job, pack_path, destination_directory, on_done=on_done)
+
+def clean_mods_store():
+    """
+    清理共享存储中已经没有任何目标目录使用的文件，并显示共享存储节省的空间
+    """
+    def on_done(job):
+        if job.state == JOB_DONE:
+            result = job.result
+            show_job_result(job, f"已清理 {result['removed_objects']} 个不再使用的文件，释放 {format_size(result['freed_bytes'])}。\n"
+                                 f"共享存储占用 {format_size(result['stored_bytes'])}，"
+                                 f"为目标目录节省了 {format_size(result['saved_bytes'])}。")
+        else:
+            show_job_result(job, "")
+
+    start_job("清理共享存储", store_gc_job, on_done=on_done)
+
+def show_run_history():
+    """
+    显示最近一次运行的耗时统计，以及以前各次运行的耗时和吞吐量
+    """
+    entries = load_run_history(limit=RUN_HISTORY_LIMIT)
+    history_window = tk.Toplevel(root)
+    history_window.title("耗时统计")
+    history_window.geometry("800x500")
+    history_text = tk.Text(history_window, font="TkFixedFont", wrap=tk.NONE)
+    history_text.pack(pady=5, padx=10, fill=tk.BOTH, expand=True)
+    if entries:
+        history_text.insert(tk.END, f"{format_summary(entries[-1])}\n\n最近的运行：\n{format_history(entries)}\n\n"
+                                    f"trace文件保存在 {get_trace_directory()}，可以在 chrome://tracing 或 "
+                                    f"https://ui.perfetto.dev 中打开。")
+    else:
+        history_text.insert(tk.END, "还没有运行记录。")
+    history_text.config(state=tk.DISABLED)
+    close_button = tk.Button(history_window, text="关闭", command=history_window.destroy)
+    close_button.pack(pady=5)
+
+def audit_destination():
+    """
+    按mods_info.json中记录的哈希校验目标目录，已扫描源目录时从源目录重新复制不一致的文件
+    """
+    destination_directory = destination_directory_entry.get()
+    if not os.path.exists(os.path.join(destination_directory, "mods_info.json")):
+        messagebox.showerror("错误", "目标目录中没有mods_info.json，请先生成。")
+        return
+    source_directory = source_directory_entry.get()
+    source_paths = None
+    if id_map and source_directories_exist(source_directory):
+        source_paths = {mod: get_mod_path(source_directory, workshop_id, mod) for mod, workshop_id in id_map.items()}
+
+    def on_done(job):
+        if job.state != JOB_DONE:
+            show_job_result(job, "")
+            return
+        report = job.result
+        unresolved = [mod for mod in report["mismatched"] if mod not in report["repaired"] or mod in report["failed"]]
+        message = (f"一致：{len(report['ok'])} 个，已修复：{len(report['repaired']) - len(report['failed'])} 个，"
+                   f"不一致：{len(unresolved)} 个，缺少：{len(report['missing'])} 个，"
+                   f"没有记录哈希：{len(report['unverifiable'])} 个")
+        if unresolved or report["missing"]:
+            messagebox.showwarning("校验结果", f"{message}\n\n{', '.join(sorted(unresolved + report['missing']))}")
+        else:
+            messagebox.showinfo("校验结果", message)
+        load_destination_mods(destination_directory)
+
+    start_job("校验目标目录", audit_destination_job, destination_directory, source_paths, on_done=on_done)
+
+def show_mod_conflicts():
+    """
+    显示多个创意工坊物品中的同名Mods，可以修改选择规则或固定使用某个创意工坊物品
+    """
+    settings = load_conflict_settings()
+    conflicts_window = tk.Toplevel(root)
+    conflicts_window.title("同名Mods")
+    conflicts_window.geometry("700x500")
+
+    rule_frame = tk.Frame(conflicts_window)
+    rule_frame.pack(pady=5)
+    rule_label = tk.Label(rule_frame, text="选择规则：")
+    rule_label.pack(side=tk.LEFT)
+    rule_var = tk.StringVar(value=CONFLICT_RULES[settings["rule"]])
+    rule_combobox = ttk.Combobox(rule_frame, textvariable=rule_var, state="readonly", width=30,
+                                 values=list(CONFLICT_RULES.values()))
+    rule_combobox.pack(side=tk.LEFT)
+
+    conflict_listbox = tk.Listbox(conflicts_window, font="TkFixedFont")
+    conflict_listbox.pack(pady=5, padx=10, fill=tk.BOTH, expand=True)
+
+    pin_frame = tk.Frame(conflicts_window)
+    pin_frame.pack(pady=5)
+    pin_label = tk.Label(pin_frame, text="固定使用：")
+    pin_label.pack(side=tk.LEFT)
+    pin_var = tk.StringVar()
+    pin_combobox = ttk.Combobox(pin_frame, textvariable=pin_var, state="readonly", width=20)
+    pin_combobox.pack(side=tk.LEFT)
+    mods = []
+
+    def describe_candidate(workshop_id):
+        info = source_items.get(workshop_id, {})
+        root_directory = info.get("root")
+        return f"{workshop_id}（{root_directory}）" if root_directory else workshop_id
+
+    def refresh():
+        conflict_listbox.delete(0, tk.END)
+        mods[:] = sorted(id_conflicts)
+        for mod in mods:
+            conflict = id_conflicts[mod]
+            others = [item for item in conflict["candidates"] if item != conflict["chosen"]]
+            conflict_listbox.insert(tk.END, f"{mod}  使用 {describe_candidate(conflict['chosen'])}"
+                                            f"{'（固定）' if conflict['pinned'] else ''}  其他：{', '.join(others)}")
+        if not mods:
+            conflict_listbox.insert(tk.END, "没有同名Mods。")
+
+    def get_selected_mod():
+        selection = conflict_listbox.curselection()
+        return mods[selection[0]] if selection and selection[0] < len(mods) else None
+
+    def on_select(event):
+        mod = get_selected_mod()
+        if mod:
+            pin_combobox["values"] = id_conflicts[mod]["candidates"]
+            pin_var.set(id_conflicts[mod]["chosen"])
+
+    def on_refreshed():
+        # 监视任务也要使用新的选择设置
+        if source_items:
+            watch_source_directory(source_directory_entry.get(), source_items)
+        if conflicts_window.winfo_exists():
+            refresh()
+
+    def apply_settings(rule_changed=False):
+        save_conflict_settings(settings)
+        source_directory = source_directory_entry.get()
+        if rule_changed and source_items and len(split_source_directories(source_directory)) > 1:
+            # 同一个创意工坊物品在多个源目录中时也按选择规则使用其中一个，需要重新合并索引
+            refresh_source_libraries(source_directory, on_refreshed)
+            return
+        rebuild_id_map(source_items)
+        on_refreshed()
+
+    def on_rule_selected(event):
+        for rule, label in CONFLICT_RULES.items():
+            if label == rule_var.get():
+                settings["rule"] = rule
+        apply_settings(rule_changed=True)
+
+    def pin_mod():
+        mod = get_selected_mod()
+        if mod and pin_var.get():
+            settings["pins"][mod] = pin_var.get()
+            apply_settings()
+
+    def unpin_mod():
+        mod = get_selected_mod()
+        if mod and settings["pins"].pop(mod, None) is not None:
+            apply_settings()
+
+    conflict_listbox.bind('<<ListboxSelect>>', on_select)
+    rule_combobox.bind('<<ComboboxSelected>>', on_rule_selected)
+    pin_button = tk.Button(pin_frame, text="固定", command=pin_mod)
+    pin_button.pack(side=tk.LEFT, padx=5)
+    unpin_button = tk.Button(pin_frame, text="取消固定", command=unpin_mod)
+    unpin_button.pack(side=tk.LEFT, padx=5)
+    close_button = tk.Button(conflicts_window, text="关闭", command=conflicts_window.destroy)
+    close_button.pack(pady=5)
+    refresh()
 
 def move_mods_by_id(source_directory, destination_directory):
     """
-    通过创意工坊ID将Mods从源目录复制到目标目录
+    通过创意工坊ID将Mods从源目录移动到目标目录：选择包含创意工坊ID的txt文件，先在后台生成计划
+    （需要移动的Mods、数据量和找不到的ID），确认后作为一个任务批量执行
     :param source_directory: 源目录（包含Mods文件夹的目录）
     :param destination_directory: 目标目录（将Mods复制到的地方）
     """
-    if not os.path.exists(source_directory):
+    if not source_directories_exist(source_directory):
         messagebox.showerror("错误", "源目录不存在，请检查路径是否正确。")
         return
 
@@ -460,46 +1125,70 @@ def move_mods_by_id(source_directory, destination_directory):
         messagebox.showerror("错误", "目标目录不存在，请检查路径是否正确。")
         return
 
-    log_text, log_window = create_log_window()
+    # 选择包含创意工坊ID的txt文件（“导出创意工坊ID”的格式）
+    id_file_path = filedialog.askopenfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt")], title="选择包含创意工坊ID的文件")
+    if not id_file_path:
+        return
+    with open(id_file_path, 'r', encoding='utf-8') as file:
+        workshop_ids = parse_id_list(file.read())
+    if not workshop_ids:
+        messagebox.showwarning("警告", "文件中没有创意工坊ID。")
+        return
 
-    # 创建进度条
-    progress = ttk.Progressbar(root, orient="horizontal", length=300, mode="determinate")
-    progress.pack(pady=10)
-    progress["maximum"] = len(id_map)
-    progress["value"] = 0
-
-    # 设定一个虚假的进度
-    fake_max_value = 0.9 * len(id_map)
-    for mod, workshop_id in id_map.items():
-        mod_item_path = os.path.join(source_directory, workshop_id, "mods", mod)
-        if os.path.exists(mod_item_path):
-            destination_mod_path = os.path.join(destination_directory, mod)
-            if os.path.exists(destination_mod_path):
-                # 如果目标目录中已经存在同名文件，直接覆盖
-                shutil.rmtree(destination_mod_path)  # 删除已存在的目录
-            shutil.move(mod_item_path, destination_mod_path)
-            message = f"已移动 {mod_item_path} 到 {destination_mod_path}"
-            if log_text:
-                update_log(log_text, message)
-            print(message)
-
-            # 更新进度条
-            if progress["value"] < fake_max_value:
-                progress["value"] += 1
-            root.update()
-
-    # 更新进度条到100%
-    progress["value"] = len(id_map)
-    root.update()
-
-    progress.destroy()
-    messagebox.showinfo("完成", "Mods已通过创意工坊ID移动完成。")
-    close_log_window(log_window)
-    # 刷新目标目录的列表
-    load_destination_mods(destination_directory)
+    def on_done(job):
+        if job.state == JOB_DONE:
+            show_id_plan(job.result)
+        elif job.state != JOB_CANCELLED:
+            messagebox.showerror("错误", f"生成计划失败: {job.error}")
+
+    run_query("生成创意工坊ID计划", plan_mods_by_id_job, source_directory, destination_directory, workshop_ids,
+              on_done=on_done)
+
+def show_id_plan(plan):
+    """
+    显示通过创意工坊ID生成的计划，确认后执行（关闭窗口即为只预览、不执行）
+    :param plan: plan_mods_by_id_job的返回值
+    """
+    plan_window = tk.Toplevel(root)
+    plan_window.title("通过创意工坊ID移动Mods")
+    plan_window.geometry("600x400")
+    plan_text = tk.Text(plan_window, width=70, height=15)
+    plan_text.pack(pady=5, padx=10, fill=tk.BOTH, expand=True)
+    plan_text.insert(tk.END, describe_id_plan(plan, COMPARE_DISPLAY_LIMIT))
+    plan_text.config(state=tk.DISABLED)
+
+    def run_plan():
+        def on_done(job):
+            if job.state == JOB_DONE:
+                show_job_result(job, f"已移动 {len(job.result['copied'])} 个Mods。")
+            else:
+                show_job_result(job, "")
+            load_destination_mods(plan["destination_directory"])
+
+        start_job("通过创意工坊ID移动Mods", run_sync_plan_job, plan, copy_workers_var.get(), delta_sync_var.get(),
+                  hash_compare_var.get(), get_deploy_mode(), verify_copy_var.get(), on_done=on_done)
+        plan_window.destroy()
+
+    def export_missing_ids():
+        save_file_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt")], title="导出缺失的创意工坊ID")
+        if save_file_path:
+            with open(save_file_path, 'w', encoding='utf-8') as file:
+                file.write(','.join(plan["missing"]))
+            messagebox.showinfo("完成", f"创意工坊ID已导出到 {save_file_path}。")
+
+    button_frame = tk.Frame(plan_window)
+    button_frame.pack(pady=10)
+    if plan["copy"]:
+        run_button = tk.Button(button_frame, text="开始移动", command=run_plan)
+        run_button.pack(side=tk.LEFT, padx=10)
+    if plan["missing"]:
+        export_button = tk.Button(button_frame, text="导出缺失的创意工坊ID", command=export_missing_ids)
+        export_button.pack(side=tk.LEFT, padx=10)
+    close_button = tk.Button(button_frame, text="关闭", command=plan_window.destroy)
+    close_button.pack(side=tk.LEFT, padx=10)
 
 def main():
-    global source_directory_entry, destination_directory_entry, source_listbox, destination_listbox, mod_count_label, root, image_frame
+    global source_directory_entry, destination_directory_entry, source_list_view, destination_list_view, mod_count_label, size_label, root, image_frame, job_executor, query_executor, watch_executor, thumbnail_cache, copy_workers_var, delta_sync_var, hash_compare_var, manifest_files_var, verify_copy_var, deploy_mode_var, undo_delete_button
 
     # 创建主窗口
     root = tk.Tk()
@@ -523,12 +1212,17 @@ def main():
 
 
     # 左侧框架：源目录选择
-    source_directory_label = tk.Label(left_frame, text="源目录（steamapps/common/创意工坊）：")
+    source_directory_label = tk.Label(left_frame, text=f"源目录（steamapps/common/创意工坊，多个用\"{SOURCE_SEPARATOR}\"分隔）：")
     source_directory_label.pack(pady=5)
     source_directory_entry = tk.Entry(left_frame, width=50)
     source_directory_entry.pack(pady=5)
-    source_directory_button = tk.Button(left_frame, text="选择目录", command=select_source_directory)
-    source_directory_button.pack(pady=5)
+    source_directory_button_frame = tk.Frame(left_frame)
+    source_directory_button_frame.pack(pady=5)
+    source_directory_button = tk.Button(source_directory_button_frame, text="选择目录", command=select_source_directory)
+    source_directory_button.pack(side=tk.LEFT, padx=5)
+    add_source_directory_button = tk.Button(source_directory_button_frame, text="添加目录（多个Steam库）",
+                                            command=add_source_directory)
+    add_source_directory_button.pack(side=tk.LEFT, padx=5)
 
     # 左侧框架：目标目录选择
     destination_directory_label = tk.Label(left_frame, text="目标目录（PZsave/mods）：")
@@ -538,6 +1232,39 @@ def main():
     destination_directory_button = tk.Button(left_frame, text="选择目录", command=select_destination_directory)
     destination_directory_button.pack(pady=5)
 
+    # 左侧框架：复制线程数设置（1为逐个复制）
+    copy_workers_frame = tk.Frame(left_frame)
+    copy_workers_frame.pack(pady=5)
+    copy_workers_label = tk.Label(copy_workers_frame, text="复制线程数：")
+    copy_workers_label.pack(side=tk.LEFT)
+    copy_workers_var = tk.IntVar(value=DEFAULT_COPY_WORKERS)
+    copy_workers_spinbox = tk.Spinbox(copy_workers_frame, from_=1, to=32, width=5, textvariable=copy_workers_var)
+    copy_workers_spinbox.pack(side=tk.LEFT)
+
+    # 左侧框架：增量同步设置
+    delta_sync_var = tk.BooleanVar(value=True)
+    delta_sync_checkbutton = tk.Checkbutton(left_frame, text="增量同步（目标已存在时只复制有变化的文件）", variable=delta_sync_var)
+    delta_sync_checkbutton.pack(pady=2)
+    hash_compare_var = tk.BooleanVar(value=False)
+    hash_compare_checkbutton = tk.Checkbutton(left_frame, text="增量同步时比较文件内容（较慢，更准确）", variable=hash_compare_var)
+    hash_compare_checkbutton.pack(pady=2)
+    manifest_files_var = tk.BooleanVar(value=False)
+    manifest_files_checkbutton = tk.Checkbutton(left_frame, text="生成Mods_info.json时记录每个文件的哈希", variable=manifest_files_var)
+    manifest_files_checkbutton.pack(pady=2)
+    verify_copy_var = tk.BooleanVar(value=False)
+    verify_copy_checkbutton = tk.Checkbutton(left_frame, text="复制后校验文件内容（只重新复制不一致的文件）", variable=verify_copy_var)
+    verify_copy_checkbutton.pack(pady=2)
+
+    # 左侧框架：部署方式（源目录和目标目录在同一磁盘上时，reflink和硬链接几乎不占用额外空间）
+    deploy_mode_frame = tk.Frame(left_frame)
+    deploy_mode_frame.pack(pady=5)
+    deploy_mode_label = tk.Label(deploy_mode_frame, text="部署方式：")
+    deploy_mode_label.pack(side=tk.LEFT)
+    deploy_mode_var = tk.StringVar(value=DEPLOY_MODES[DEPLOY_COPY])
+    deploy_mode_combobox = ttk.Combobox(deploy_mode_frame, textvariable=deploy_mode_var, state="readonly", width=36,
+                                        values=list(DEPLOY_MODES.values()))
+    deploy_mode_combobox.pack(side=tk.LEFT)
+
     # 左侧框架：操作按钮
     button_frame_left = tk.Frame(left_frame)
     button_frame_left.pack(pady=20)
@@ -555,30 +1282,35 @@ def main():
     generate_info_button.pack(side=tk.TOP, pady=5)
     
     # 增加注释标签
-    comment_label = tk.Label(left_frame, text="注：外部删除Mods会引发更新及显示问题，建议在软件内操作")
+    comment_label = tk.Label(left_frame, text="注：在外部新增或删除的Mods会自动刷新到列表和Mods_info.json中")
     comment_label.pack(pady=5)
     comment_label = tk.Label(left_frame, text="第一次打开软件建议选择完目录后点击生成Mods_info.json进行同步")
     comment_label.pack(pady=5)
     
 
     # 右侧框架：源Mods列表框
-    source_listbox_label = tk.Label(right_frame, text="请选择需要复制或导出ID的源Mods：")
-    source_listbox_label.pack(pady=5)
-    source_listbox = tk.Listbox(right_frame, selectmode=tk.BROWSE, width=50, height=10)
-    source_listbox.pack(pady=5, padx=10, fill=tk.BOTH, expand=True)
-    source_listbox.bind('<<ListboxSelect>>', lambda event: show_cover_image(event, source_directory_entry.get(), destination_directory_entry.get(), source_listbox, id_map))
+    source_list_label = tk.Label(right_frame, text="请选择需要复制或导出ID的源Mods（Ctrl/Shift+点击多选）：")
+    source_list_label.pack(pady=5)
+    source_list_view = VirtualListView(right_frame, width=50, height=10)
+    source_list_view.pack(pady=5, padx=10, fill=tk.BOTH, expand=True)
+    source_list_view.bind('<<ListboxSelect>>', lambda event: show_cover_image(event, source_directory_entry.get(), destination_directory_entry.get(), source_list_view, id_map))
+    source_list_view.bind('<<ListboxSelect>>', lambda event: calculate_selected_size(), add="+")
 
     # 右侧框架：目标Mods列表框
-    destination_listbox_label = tk.Label(right_frame, text="目标目录中的Mods：")
-    destination_listbox_label.pack(pady=5)
-    destination_listbox = tk.Listbox(right_frame, selectmode=tk.BROWSE, width=50, height=10)
-    destination_listbox.pack(pady=5, padx=10, fill=tk.BOTH, expand=True)
-    destination_listbox.bind('<<ListboxSelect>>', lambda event: show_cover_image(event, source_directory_entry.get(), destination_directory_entry.get(), destination_listbox, id_map))
+    destination_list_label = tk.Label(right_frame, text="目标目录中的Mods：")
+    destination_list_label.pack(pady=5)
+    destination_list_view = VirtualListView(right_frame, width=50, height=10)
+    destination_list_view.pack(pady=5, padx=10, fill=tk.BOTH, expand=True)
+    destination_list_view.bind('<<ListboxSelect>>', lambda event: show_cover_image(event, source_directory_entry.get(), destination_directory_entry.get(), destination_list_view, id_map))
 
     # 右侧框架：Mods总数标签
     mod_count_label = tk.Label(right_frame, text="Mods总数：0")
     mod_count_label.pack(pady=5)
 
+    # 右侧框架：已选Mods总大小标签
+    size_label = tk.Label(right_frame, text="已选Mods总大小：0 B")
+    size_label.pack(pady=5)
+
     # 右侧框架：操作按钮
     button_frame_right = tk.Frame(right_frame)
     button_frame_right.pack(pady=10)
@@ -586,14 +1318,60 @@ def main():
     select_all_button = tk.Button(button_frame_right, text="全选源Mods", command=select_all_mods)
     select_all_button.pack(side=tk.LEFT, padx=10)
 
+    size_button = tk.Button(button_frame_right, text="计算源Mods总大小", command=calculate_selected_size)
+    size_button.pack(side=tk.LEFT, padx=10)
+
     export_button = tk.Button(button_frame_right, text="导出源Mods创意工坊ID", command=export_mod_ids)
     export_button.pack(side=tk.LEFT, padx=10)
 
+    server_config_button = tk.Button(button_frame_right, text="导出服务器配置", command=export_server_config)
+    server_config_button.pack(side=tk.LEFT, padx=10)
+
     delete_button = tk.Button(button_frame_right, text="删除选定的目标Mods", command=delete_mods)
     delete_button.pack(side=tk.LEFT, padx=10)
 
+    undo_delete_button = tk.Button(button_frame_right, text="撤销删除", command=undo_delete_mods, state=tk.DISABLED)
+    undo_delete_button.pack(side=tk.LEFT, padx=10)
+
+    # 右侧框架：Mods包
+    pack_frame = tk.Frame(right_frame)
+    pack_frame.pack(pady=5)
+
+    export_pack_button = tk.Button(pack_frame, text="导出Mods包", command=export_mods_pack)
+    export_pack_button.pack(side=tk.LEFT, padx=10)
+
+    import_pack_button = tk.Button(pack_frame, text="导入Mods包到目标目录", command=import_mods_pack)
+    import_pack_button.pack(side=tk.LEFT, padx=10)
+
+    clean_store_button = tk.Button(pack_frame, text="清理共享存储", command=clean_mods_store)
+    clean_store_button.pack(side=tk.LEFT, padx=10)
+
+    history_button = tk.Button(pack_frame, text="耗时统计", command=show_run_history)
+    history_button.pack(side=tk.LEFT, padx=10)
+
+    conflicts_button = tk.Button(pack_frame, text="同名Mods", command=show_mod_conflicts)
+    conflicts_button.pack(side=tk.LEFT, padx=10)
+
+    audit_button = tk.Button(pack_frame, text="校验目标目录", command=audit_destination)
+    audit_button.pack(side=tk.LEFT, padx=10)
+
+    # 启动后台任务执行器，并按固定频率刷新任务进度
+    job_executor = JobExecutor()
+    query_executor = JobExecutor(max_workers=2)
+    # 监视源目录（所有源目录共用一个任务）、监视目标目录和清理回收站的长期任务，
+    # 多出的线程留给刚取消、还没有退出的旧任务
+    watch_executor = JobExecutor(max_workers=8)
+    thumbnail_cache = ThumbnailCache()
+    root.after(UI_REFRESH_INTERVAL, pump_job_events)
+
     # 进入主循环
     root.mainloop()
+    job_executor.shutdown()
+    watch_executor.shutdown()
+    query_executor.shutdown()
+    thumbnail_cache.shutdown()
 
 if __name__ == "__main__":
+    # 校验使用进程池，打包为exe后需要
+    multiprocessing.freeze_support()
     main()
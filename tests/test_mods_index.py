@@ -0,0 +1,56 @@
+"""
+多个源目录的索引测试：同一个创意工坊物品出现在多个源目录中时按选择规则使用其中一个。
+运行：python -m pytest tests
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mods_cache  # noqa: E402
+from mods_index import (CONFLICT_HIGHEST_ID, CONFLICT_LIBRARY_ORDER, CONFLICT_NEWEST, SOURCE_SEPARATOR,  # noqa: E402
+                        get_item_directory, get_mod_path, load_workshop_index, save_conflict_settings)
+
+
+class LibraryDuplicateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="mods_index_test_")
+        self.old_cache_directory = mods_cache.CACHE_DIRECTORY
+        mods_cache.set_cache_directory(os.path.join(self.directory, "cache"))
+        self.libraries = [os.path.join(self.directory, name) for name in ("library0", "library1")]
+        # 两个源目录都有物品1001，第二个源目录中的副本更新
+        for library, mtime in zip(self.libraries, (1000000000, 2000000000)):
+            mods_path = os.path.join(library, "1001", "mods")
+            os.makedirs(os.path.join(mods_path, "ModA"))
+            os.utime(mods_path, (mtime, mtime))
+        self.source_directory = SOURCE_SEPARATOR.join(self.libraries)
+
+    def tearDown(self):
+        mods_cache.set_cache_directory(self.old_cache_directory)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def assert_chosen_library(self, rule, library):
+        expected = os.path.join(self.libraries[library], "1001")
+        items = load_workshop_index(self.source_directory, rule=rule)["items"]
+        self.assertEqual(items["1001"]["library"], library)
+        self.assertEqual(items["1001"]["root"], self.libraries[library])
+        self.assertEqual(get_item_directory(self.source_directory, "1001", rule), expected)
+
+    def test_rule_selects_library_copy(self):
+        self.assert_chosen_library(CONFLICT_NEWEST, 1)
+        self.assert_chosen_library(CONFLICT_HIGHEST_ID, 1)
+        self.assert_chosen_library(CONFLICT_LIBRARY_ORDER, 0)
+
+    def test_saved_rule_is_used_by_default(self):
+        save_conflict_settings({"rule": CONFLICT_LIBRARY_ORDER, "pins": {}})
+        self.assertEqual(load_workshop_index(self.source_directory)["items"]["1001"]["library"], 0)
+        self.assertEqual(get_mod_path(self.source_directory, "1001", "ModA"),
+                         os.path.join(self.libraries[0], "1001", "mods", "ModA"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+"""
+客户端一键同步的测试：在本机启动ModsServer，用sync_from_server_job同步到临时目录。
+运行：python -m pytest tests
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mods_cache  # noqa: E402
+import mods_sync  # noqa: E402
+from mods_jobs import JOB_DONE, JOB_FAILED, JobExecutor  # noqa: E402
+from mods_trash import TrashBin  # noqa: E402
+from mods_sync import (DOWNLOAD_DIRECTORY_NAME, PART_SUFFIX, ModsRequestHandler, ModsServer, SyncError,  # noqa: E402
+                       plan_sync, sync_from_server_job)
+
+JOB_TIMEOUT = 30
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(data)
+
+
+def read_file(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+class RecordingHandler(ModsRequestHandler):
+    """记录每个文件请求的Range请求头"""
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("Range")))
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SyncServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="mods_sync_test_")
+        self.old_cache_directory = mods_cache.CACHE_DIRECTORY
+        self.old_manifest_ttl = mods_sync.MANIFEST_TTL
+        mods_cache.set_cache_directory(os.path.join(self.directory, "cache"))
+        # 每次请求都重新生成清单，服务端的修改可以立即被客户端看到
+        mods_sync.MANIFEST_TTL = 0
+
+        self.server_directory = os.path.join(self.directory, "server")
+        self.client_directory = os.path.join(self.directory, "client")
+        write_file(os.path.join(self.server_directory, "ModA", "mod.info"), b"name=Mod A\nid=ModA\n")
+        write_file(os.path.join(self.server_directory, "ModA", "media", "lua", "a.lua"), b"print('a')\n" * 100)
+        write_file(os.path.join(self.server_directory, "ModB", "media", "big.bin"), os.urandom(256 * 1024))
+        with open(os.path.join(self.server_directory, "mods_info.json"), 'w', encoding='utf-8') as file:
+            json.dump({"mods_count": 2, "mods": {"ModA": "1001", "ModB": "1002"}}, file)
+
+        self.server = ModsServer(("127.0.0.1", 0), self.server_directory)
+        self.server.RequestHandlerClass = RecordingHandler
+        self.server.requests = []
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.executor = JobExecutor(echo=False)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.executor.shutdown()
+        mods_sync.MANIFEST_TTL = self.old_manifest_ttl
+        mods_cache.set_cache_directory(self.old_cache_directory)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def run_sync(self, prune=False):
+        job = self.executor.submit("同步", sync_from_server_job, self.url, self.client_directory, prune=prune)
+        deadline = time.monotonic() + JOB_TIMEOUT
+        while not job.finished:
+            self.assertLess(time.monotonic(), deadline, "同步超时")
+            time.sleep(0.01)
+        return job
+
+    def file_requests(self):
+        return [(path, range_header) for path, range_header in self.server.requests if path.startswith("/files/")]
+
+    def assert_same_tree(self):
+        for mod in ("ModA", "ModB"):
+            for root, _, files in os.walk(os.path.join(self.server_directory, mod)):
+                for name in files:
+                    server_path = os.path.join(root, name)
+                    client_path = os.path.join(self.client_directory,
+                                               os.path.relpath(server_path, self.server_directory))
+                    self.assertEqual(read_file(server_path), read_file(client_path))
+
+    def test_first_sync_downloads_everything(self):
+        job = self.run_sync()
+        self.assertEqual(job.state, JOB_DONE, job.error)
+        self.assertEqual(job.result["downloaded"], 3)
+        self.assert_same_tree()
+        with open(os.path.join(self.client_directory, "mods_info.json"), encoding='utf-8') as file:
+            self.assertEqual(json.load(file)["mods"], {"ModA": "1001", "ModB": "1002"})
+
+    def test_second_sync_downloads_only_changed_files(self):
+        self.assertEqual(self.run_sync().state, JOB_DONE)
+        write_file(os.path.join(self.server_directory, "ModA", "media", "lua", "a.lua"), b"print('changed')\n")
+        write_file(os.path.join(self.server_directory, "ModA", "media", "lua", "new.lua"), b"print('new')\n")
+        self.server.requests.clear()
+
+        job = self.run_sync()
+        self.assertEqual(job.state, JOB_DONE, job.error)
+        self.assertEqual(job.result["downloaded"], 2)
+        self.assertEqual(job.result["updated_mods"], ["ModA"])
+        self.assertEqual(sorted(path for path, _ in self.file_requests()),
+                         ["/files/ModA/media/lua/a.lua", "/files/ModA/media/lua/new.lua"])
+        self.assert_same_tree()
+
+        self.server.requests.clear()
+        job = self.run_sync()
+        self.assertEqual(job.result["downloaded"], 0)
+        self.assertEqual(self.file_requests(), [])
+
+    def test_removed_files_and_mods_are_cleaned_up(self):
+        write_file(os.path.join(self.server_directory, "ModA", "media", "old", "gone.lua"), b"print('gone')\n")
+        self.assertEqual(self.run_sync().state, JOB_DONE)
+        shutil.rmtree(os.path.join(self.server_directory, "ModA", "media", "old"))
+        shutil.rmtree(os.path.join(self.server_directory, "ModB"))
+        with open(os.path.join(self.server_directory, "mods_info.json"), 'w', encoding='utf-8') as file:
+            json.dump({"mods_count": 1, "mods": {"ModA": "1001"}}, file)
+
+        job = self.run_sync(prune=True)
+        self.assertEqual(job.state, JOB_DONE, job.error)
+        self.assertEqual(job.result["removed_mods"], ["ModB"])
+        # 删除文件后留下的空文件夹也被删除，服务端没有的Mod移到回收站，可以恢复
+        self.assertFalse(os.path.exists(os.path.join(self.client_directory, "ModA", "media", "old")))
+        self.assertFalse(os.path.exists(os.path.join(self.client_directory, "ModB")))
+        self.assertEqual([entry["mod"] for entry in TrashBin(self.client_directory).entries()], ["ModB"])
+        with open(os.path.join(self.client_directory, "mods_info.json"), encoding='utf-8') as file:
+            self.assertEqual(json.load(file)["mods"], {"ModA": "1001"})
+
+    def test_part_file_resumes_with_range_request(self):
+        data = read_file(os.path.join(self.server_directory, "ModB", "media", "big.bin"))
+        offset = len(data) // 3
+        write_file(os.path.join(self.client_directory, DOWNLOAD_DIRECTORY_NAME, "ModB", "media", "big.bin" + PART_SUFFIX),
+                   data[:offset])
+
+        job = self.run_sync()
+        self.assertEqual(job.state, JOB_DONE, job.error)
+        self.assertIn(("/files/ModB/media/big.bin", f"bytes={offset}-"), self.file_requests())
+        self.assertEqual(read_file(os.path.join(self.client_directory, "ModB", "media", "big.bin")), data)
+        self.assertFalse(os.path.exists(os.path.join(self.client_directory, DOWNLOAD_DIRECTORY_NAME)))
+
+    def test_manifest_paths_outside_mods_folder_are_rejected(self):
+        escape_path = os.path.join(self.directory, "pwned.txt")
+        for mod, rel_path in (("../escape", "x.txt"), ("..", "pwned.txt"), ("ModA", "../../pwned.txt"),
+                              ("ModA", "media//x.lua"), ("ModA", "C:/pwned.txt"), (os.path.abspath(self.directory), "x")):
+            manifest = {"mods": {mod: "1"}, "details": {mod: {"files": {rel_path: [1, 0, "0" * 32]}}}}
+            with self.assertRaises(SyncError):
+                plan_sync(manifest, self.client_directory)
+
+        manifest = {"mods": {"../../escape": "1"},
+                    "details": {"../../escape": {"files": {"../../../pwned.txt": [1, 0, "0" * 32]}}}}
+        self.server.get_manifest_bytes = lambda: json.dumps(manifest).encode('utf-8')
+        job = self.run_sync()
+        self.assertEqual(job.state, JOB_FAILED)
+        self.assertIsInstance(job.error, SyncError)
+        self.assertEqual(self.file_requests(), [])
+        self.assertFalse(os.path.exists(escape_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
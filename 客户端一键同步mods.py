@@ -0,0 +1,59 @@
+"""
+客户端一键同步Mods：从服务端（python mods_cli.py serve <目标目录>）获取mods_info.json，
+只下载缺少或有变化的文件，删除多余的文件，并更新本地的mods_info.json。
+
+用法：
+    python 客户端一键同步mods.py http://服务端地址:8765 <本地Mods目录>
+第一次同步成功后地址和目录会保存到同目录下的 客户端一键同步mods.json，以后直接运行（或双击）即可同步。
+"""
+import os
+import sys
+import json
+import argparse
+
+from mods_cache import load_json, save_json
+from mods_cli import EXIT_OK, EXIT_USAGE, job_exit_code, job_result, log, run_job
+from mods_sync import DEFAULT_DOWNLOAD_WORKERS, sync_from_server_job
+
+
+def get_config_path():
+    """
+    :return: 配置文件路径（与脚本或打包后的exe在同一目录）
+    """
+    base = sys.executable if getattr(sys, "frozen", False) else os.path.abspath(__file__)
+    return os.path.splitext(base)[0] + ".json"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="从服务端一键同步Mods")
+    parser.add_argument("url", nargs="?", help="服务端地址，例如 http://192.168.1.10:8765")
+    parser.add_argument("destination", nargs="?", help="本地Mods目录")
+    parser.add_argument("--workers", type=int, default=DEFAULT_DOWNLOAD_WORKERS, help="并发下载数")
+    parser.add_argument("--prune", action="store_true", help="把服务端没有的本地Mods移到回收站")
+    parser.add_argument("--json", action="store_true", help="在标准输出中输出JSON格式的结果")
+    parser.add_argument("-q", "--quiet", action="store_true", help="不输出日志和进度")
+    args = parser.parse_args(argv)
+
+    config_path = get_config_path()
+    config = load_json(config_path, {})
+    url = args.url or config.get("url")
+    destination_directory = args.destination or config.get("destination")
+    if (not url or not destination_directory) and sys.stdin.isatty():
+        url = url or input("服务端地址：").strip()
+        destination_directory = destination_directory or input("本地Mods目录：").strip()
+    if not url or not destination_directory:
+        log("错误：请指定服务端地址和本地Mods目录")
+        return EXIT_USAGE
+
+    job = run_job(args, "同步Mods", sync_from_server_job, url, destination_directory, args.workers, args.prune)
+    result = job.result or {}
+    if job_exit_code(job) == EXIT_OK:
+        # 保存地址和目录，以后直接运行即可同步
+        save_json(config_path, {"url": url, "destination": destination_directory}, indent=4)
+    if args.json:
+        print(json.dumps(job_result(job, **result), ensure_ascii=False, indent=2))
+    return job_exit_code(job)
+
+
+if __name__ == "__main__":
+    sys.exit(main())